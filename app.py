@@ -1,151 +1,740 @@
+import startup
+startup.startup_report.begin_imports()
+import hashlib
+import json
+import logging
 import os
+import threading
 import time
+from collections import OrderedDict
+from functools import partial
 import database
-from flask import Flask, render_template, request, jsonify
+import cache
+import results
+from flask import Blueprint, Flask, Response, render_template, request, jsonify
 import stocks
 import assets
+import datasource
+import ingest
+import prices
+import scheduler
+import httpcache
+import universe
+import panel
+import optimizer
+import risk
+import montecarlo
+import backtest
+import rolling
+import colcache
+import catalog
+import bars
+import sharedpanel
+import instrumentation
+import jobs
 import pandas as pd
 import numpy as np
 from dotenv import load_dotenv
-import yfinance as yf
 
-load_dotenv()
-app = Flask(__name__)
+startup.startup_report.end_imports()
+
+# The routes, request hooks and error handlers, registered on each app built by create_app().
+routes = Blueprint("app", __name__)
 
 def test_db_connection():
     engine = database.get_engine()
     try:
         conn = engine.connect()
-        print("Successfully connected to PostgreSQL database.")
-        print("Database connection details:")
-        print(f"User: {os.getenv('DB_USER')}")
-        print(f"Host: {os.getenv('DB_HOST')}")
-        print(f"Port: {os.getenv('DB_PORT')}")
-        print(f"Database: {os.getenv('DB_NAME')}")
-        print(conn)
+        logging.info(f"Connected to the database: user={os.getenv('DB_USER')} host={os.getenv('DB_HOST')} "
+                     f"port={os.getenv('DB_PORT')} database={os.getenv('DB_NAME')}")
         conn.close()
     except Exception as e:
-        print("Error connecting to PostgreSQL database:", e)
-    finally:
-        engine.dispose()
+        logging.error(f"Error connecting to the database: {e}")
 
-# Global constants
-top_active_stocks = ['AAPL', 'TSLA', 'AMZN', 'GOOGL', 'MSFT', 'NVDA', 'META', 'NFLX', 'AMD', 'BRK-B']
-benchmarks = {'S&P 500': 'SPY', 'Gold': 'GLD', 'Silver': 'SLV', 'Oil': 'USO'}
+# Configured window name -> (start, end); used in table names and cache keys. Ad-hoc
+# windows requested through the API are named after their dates (see register_window)
+# and are not added here.
+WINDOWS = {}
+
+def configure():
+    """
+    Reads this module's settings from the environment: the ticker universe and date
+    windows (UNIVERSE_FILE and the UNIVERSE_*/TRAIN_*/TEST_* variables, see universe.py)
+    and the batch sizes. Runs on import, and again in create_app() once .env is loaded.
+    """
+    global UNIVERSE, top_active_stocks, benchmarks, TRAIN_START, TRAIN_END, TEST_START, TEST_END
+    global BATCH_SIZE, HTML_MAX_ASSETS
+    UNIVERSE = universe.load_universe()
+    top_active_stocks = UNIVERSE.stocks
+    benchmarks = UNIVERSE.benchmarks
+    # Date ranges for training and test data
+    TRAIN_START, TRAIN_END = UNIVERSE.windows["train"]
+    TEST_START, TEST_END = UNIVERSE.windows["test"]
+    # Updated in place, as other modules may hold the dict.
+    WINDOWS.clear()
+    WINDOWS.update(UNIVERSE.windows)
+    # Assets are loaded (fetched, processed and stored) in batches of this many, which bounds
+    # the memory held by raw downloads when the universe has thousands of tickers.
+    BATCH_SIZE = int(os.getenv("UNIVERSE_BATCH_SIZE", "250"))
+    # Correlation tables on the page are limited to this many assets; the API serves the full matrix.
+    HTML_MAX_ASSETS = int(os.getenv("CORRELATION_HTML_MAX_ASSETS", "50"))
 
-# Date ranges for training and test data
-TRAIN_START = "2022-01-01"
-TRAIN_END = "2024-12-31"
-TEST_START = "2023-01-01"
-TEST_END = "2023-03-31"
+configure()
 
-def get_training_data():
-    """Fetches or loads training data for top active stocks used for correlation matrix and optimization."""
-    train_data = {}
-    for ticker in top_active_stocks:
-        table_name = f"stock_train_{ticker}"
-        df = None
-        print("checking table name", table_name)
-        if database.table_exists(table_name):
-            print("table exists")
-            df = pd.read_sql_table(table_name, database.get_engine())
-            if df.empty:
-                print("coming here")
-                df = stocks.fetch_stock_data(ticker, start=TRAIN_START, end=TRAIN_END)
-                if df is not None:
-                    df = stocks.process_stock_data(df)
-                    database.store_df_to_db(df, table_name=table_name)
+# Asset kind -> (batch fetch function, processing function). The kind is also the table prefix.
+PIPELINES = {
+    "stock": (stocks.fetch_stocks_batch, stocks.process_stock_data),
+    "asset": (assets.fetch_assets_batch, assets.process_asset_data),
+}
+
+def table_name(kind, window, name, interval="1d"):
+    """Table of one asset and window. Bars of other intervals than daily get their own tables."""
+    return f"{kind}_{window}_{name}" if interval == bars.DAILY else f"{kind}_{window}_{interval}_{name}"
+
+def load_assets(specs, window, interval="1d", refresh=False, resample=None):
+    """
+    Returns processed DataFrames for several assets over one window, keyed by asset name.
+    `specs` is a list of (kind, name, ticker) tuples. Frames are served from the in-process
+    frame cache when possible, otherwise loaded from the database; assets whose table is
+    missing or empty are fetched concurrently in one batch, processed and stored.
+    With INGEST_MODE=incremental, stored tables are also topped up with only the date
+    range that has not been fetched yet. refresh=True bypasses the cache and re-fetches
+    every asset (only the missing range in incremental mode).
+    Bars are stored at `interval` (see bars.INTERVALS); with `resample` set to a coarser
+    interval the frames hold bars aggregated from the stored ones instead, and the
+    stored bars themselves are not kept in memory.
+    """
+    bars.validate(interval, resample)
+    _size_frame_cache()
+    loaded = {}
+    for offset in range(0, len(specs), BATCH_SIZE):
+        batch = specs[offset:offset + BATCH_SIZE]
+        if prices.normalized_enabled() and interval == bars.DAILY:
+            frames = _load_assets_normalized(batch, window, interval, refresh=refresh)
+            loaded.update(_resample_frames(batch, frames, window, interval, resample) if resample else frames)
+        else:
+            loaded.update(_load_asset_batch(batch, window, interval, refresh=refresh, resample=resample))
+    return loaded
+
+def _storage_processor(kind, interval):
+    # The kind's processing function, storing intraday bars in bars.storage_dtype().
+    process = PIPELINES[kind][1]
+    dtype = bars.storage_dtype(interval)
+    return process if dtype is None else partial(process, dtype=dtype)
+
+def _resample_frame(df, process, target):
+    # Processed bars aggregated to the target interval and processed again.
+    return process(bars.resample_ohlcv(df, target))
+
+def _resample_frames(specs, frames, window, interval, target):
+    # Resampled (and cached) versions of frames loaded from the normalized prices table.
+    resampled = {}
+    for kind, name, ticker in specs:
+        if name not in frames:
+            continue
+        key = (ticker, window, bars.resolution(interval, target))
+        df = cache.frame_cache.get(key)
+        if df is None:
+            with instrumentation.stage("process"):
+                df = _resample_frame(frames[name], PIPELINES[kind][1], target)
+            cache.frame_cache.set(key, df, table_name=prices.PRICES_TABLE)
+        resampled[name] = df
+    return resampled
+
+def _read_stored(table_name, version=None, target=None, process=None):
+    # A stored table, through the columnar cache when it is enabled. With a target interval
+    # the table is resampled chunk by chunk (memory-mapped slices, or chunks of rows
+    # read from the database) and the aggregated bars are processed.
+    if target is None:
+        return colcache.read_table(table_name, version) if colcache.enabled() else database.read_table(table_name)
+    if colcache.enabled():
+        resampled = bars.resample_chunks(bars.frame_chunks(colcache.read_table(table_name, version)), target)
+    else:
+        resampled = bars.read_resampled(table_name, target)
+    return process(resampled)
+
+def _load_asset_batch(specs, window, interval="1d", refresh=False, resample=None):
+    # load_assets() for one batch of the per-table layout.
+    loaded = {}
+    to_fetch = []
+    to_read = []
+    incremental = ingest.incremental_enabled()
+    key = bars.resolution(interval, resample)
+    pending = []
+    for kind, name, ticker in specs:
+        df = None if refresh else cache.frame_cache.get((ticker, window, key))
+        if df is None:
+            pending.append((kind, name, ticker, table_name(kind, window, name, interval)))
+        else:
+            loaded[name] = df
+
+    # The whole batch is planned before anything is read or fetched, from one read of the
+    # ingest state and one batch of catalog statistics (ingest.plan_window): tables written
+    # for other dates of the window are fetched again in full, and tables that only end
+    # early are topped up in incremental mode (and fetched again in full otherwise).
+    dates = window_dates(window)
+    whole = ingest.Fetch(*dates, True)
+    tables = [spec[3] for spec in pending]
+    replace_all = refresh and not incremental
+    plans = ingest.plan_window(tables, *dates) if tables and not replace_all else {}
+    for kind, name, ticker, table in pending:
+        plan = whole if replace_all else plans.get(table)
+        if plan is None:
+            to_read.append((kind, name, ticker, table))
+        else:
+            to_fetch.append((kind, name, ticker, plan if incremental else whole))
+
+    # Stored tables are read through the local columnar cache when it is enabled; the
+    # versions of all of them are checked against the database in one query.
+    versions = {}
+    if colcache.enabled() and to_read:
+        with instrumentation.stage("db_check"):
+            versions = colcache.table_versions([spec[3] for spec in to_read])
+    for kind, name, ticker, table in to_read:
+        with instrumentation.stage("db_read"):
+            df = _read_stored(table, versions.get(table), resample, PIPELINES[kind][1])
+        if df.empty:
+            to_fetch.append((kind, name, ticker, whole))
+            continue
+        cache.frame_cache.set((ticker, window, key), df, table_name=table)
+        loaded[name] = df
+
+    # One concurrent batch per asset kind and fetch (normally a single one per window).
+    groups = {}
+    recorded = []
+    for kind, name, ticker, fetch in to_fetch:
+        groups.setdefault((kind, fetch), []).append((name, ticker))
+    for (kind, fetch), pending in groups.items():
+        fetch_batch, process = PIPELINES[kind][0], _storage_processor(kind, interval)
+        with instrumentation.stage("fetch"):
+            fetched = fetch_batch([ticker for _, ticker in pending], {window: (fetch.start, fetch.end)},
+                                  interval=interval)
+        for name, ticker in pending:
+            raw = fetched.get((ticker, window))
+            table = table_name(kind, window, name, interval)
+            if not fetch.replace:
+                # Processes the new rows and upserts them.
+                with instrumentation.stage("store"):
+                    ingest.apply_increment(table, raw, process, fetched_until=fetch.end)
+                with instrumentation.stage("db_read"):
+                    exists = catalog.table_catalog.exists(table)
+                    df = _read_stored(table, target=resample, process=PIPELINES[kind][1]) if exists else None
+            elif raw is not None:
+                with instrumentation.stage("process"):
+                    df = process(raw)
+                with instrumentation.stage("store"):
+                    database.store_df_to_db(df, table_name=table)
+                fetched_from, fetched_until = ingest.fetched_range(None, fetch.start, fetch.end)
+                recorded.append((table, df.index.max() if not df.empty else None, fetched_until, fetched_from))
+                if resample:
+                    with instrumentation.stage("process"):
+                        df = _resample_frame(df, PIPELINES[kind][1], resample)
+            else:
+                df = None
+            if df is None:
+                continue
+            if not df.empty:
+                cache.frame_cache.set((ticker, window, key), df, table_name=table)
+            loaded[name] = df
+    # The window each replaced table now holds, checked by ingest.plan_window().
+    with instrumentation.stage("store"):
+        ingest.record_states(recorded)
+
+    # Preserve the order of the requested assets.
+    return {name: loaded[name] for _, name, _ in specs if name in loaded}
+
+def _load_assets_normalized(specs, window, interval="1d", refresh=False):
+    """
+    load_assets() for STORAGE_LAYOUT=normalized: every cache miss is read from the shared
+    prices table in one query, and tickers whose rows do not cover the window (or all
+    tickers, on refresh) are fetched in one batch and bulk-loaded with COPY. The date
+    range fetched per ticker is recorded in the ingest state, so a ticker listed after
+    the window started is not fetched again; rows stored without a recorded range must
+    reach both ends of the window (see ingest.rows_cover).
+    """
+    loaded = {}
+    misses = []
+    for kind, name, ticker in specs:
+        df = None if refresh else cache.frame_cache.get((ticker, window, interval))
+        if df is None:
+            misses.append((kind, name, ticker))
         else:
-            print("coming here 2")
-            df = stocks.fetch_stock_data(ticker, start=TRAIN_START, end=TRAIN_END)
+            loaded[name] = df
+
+    start, end = window_dates(window)
+    if misses:
+        tickers = [ticker for _, _, ticker in misses]
+        frames = {} if refresh else _read_prices(tickers, start, end)
+        with instrumentation.stage("db_check"):
+            states = ingest.get_states([prices.coverage_key(ticker) for ticker in tickers])
+        missing = [spec for spec in misses if refresh or not _prices_cover(
+            states.get(prices.coverage_key(spec[2])), frames.get(spec[2]), start, end)]
+        for kind in PIPELINES:
+            pending = [ticker for spec_kind, _, ticker in missing if spec_kind == kind]
+            if not pending:
+                continue
+            with instrumentation.stage("fetch"):
+                fetched = PIPELINES[kind][0](pending, {window: (start, end)}, interval=interval)
+            long_rows = [prices.to_long_frame(df, ticker, kind)
+                         for (ticker, _), df in fetched.items() if df is not None and not df.empty]
+            if long_rows:
+                with instrumentation.stage("store"):
+                    prices.copy_frame(pd.concat(long_rows, ignore_index=True))
+            # Failed fetches (None) are not recorded, so they are retried.
+            recorded = []
+            for (ticker, _), df in fetched.items():
+                if df is not None:
+                    state = states.get(prices.coverage_key(ticker))
+                    last = df.index.max() if not df.empty else (state["last_date"] if state else None)
+                    fetched_from, fetched_until = ingest.fetched_range(state, start, end)
+                    recorded.append((prices.coverage_key(ticker), last, fetched_until, fetched_from))
+            with instrumentation.stage("store"):
+                ingest.record_states(recorded)
+        if missing:
+            frames.update(_read_prices([t for _, _, t in missing], start, end))
+        for kind, name, ticker in misses:
+            df = frames.get(ticker)
             if df is not None:
-                df = stocks.process_stock_data(df)
-                database.store_df_to_db(df, table_name=table_name)
-        if df is not None:
-            train_data[ticker] = df
-    return train_data
+                cache.frame_cache.set((ticker, window, interval), df, table_name=prices.PRICES_TABLE)
+                loaded[name] = df
+
+    return {name: loaded[name] for _, name, _ in specs if name in loaded}
+
+def _prices_cover(state, frame, start, end):
+    # Whether a ticker's stored prices cover a window: by its recorded fetch range, or
+    # without one by the first and last bars read.
+    if state is not None and state["fetched_from"] is not None:
+        return ingest.covers(state, start, end)
+    return frame is not None and not frame.empty and ingest.rows_cover(frame["Date"].iloc[0], frame["Date"].iloc[-1],
+                                                                        start, end)
+
+def _read_prices(tickers, start, end):
+    # Processed frames of several tickers from the normalized prices table.
+    with instrumentation.stage("db_read"):
+        rows = prices.load_prices(tickers, start, end)
+    with instrumentation.stage("process"):
+        return prices.to_processed_frames(rows)
+
+def load_asset_window(kind, name, ticker, window, interval="1d"):
+    """Returns the processed DataFrame for one asset and window (see load_assets)."""
+    return load_assets([(kind, name, ticker)], window, interval=interval).get(name)
+
+def register_window(start, end):
+    """
+    Returns the name of the window covering start..end: a configured window with those
+    dates, or an ad-hoc window named after them (which is not added to WINDOWS, so
+    ad-hoc windows are not refreshed and cost nothing to keep). Raises ValueError for
+    an invalid range.
+    """
+    for name, dates in WINDOWS.items():
+        if dates == (start, end):
+            return name
+    return universe.window_name(start, end)
+
+def window_dates(window):
+    """(start, end) of a configured or ad-hoc window. Raises KeyError for an unknown name."""
+    dates = WINDOWS.get(window) or universe.window_dates(window)
+    if dates is None:
+        raise KeyError(window)
+    return dates
+
+def stock_specs():
+    return [("stock", ticker, ticker) for ticker in top_active_stocks]
+
+def benchmark_specs():
+    return [("asset", name, ticker) for name, ticker in benchmarks.items()]
+
+def all_specs():
+    return stock_specs() + benchmark_specs()
+
+def specs_for(names):
+    """Specs for a list of benchmark names and stock tickers, which may lie outside the universe."""
+    return [("asset", name, benchmarks[name]) if name in benchmarks else ("stock", name, name)
+            for name in names]
+
+# The frame cache's configured size (FRAME_CACHE_SIZE, default 64).
+_FRAME_CACHE_BASE = cache.frame_cache.max_entries
+
+def _size_frame_cache():
+    # Unless FRAME_CACHE_SIZE is set, keep room for every asset of the universe in every
+    # configured window, so that a large universe does not thrash the cache. The bound
+    # depends on the configuration only; ad-hoc requests share what is left by LRU.
+    if not os.getenv("FRAME_CACHE_SIZE"):
+        cache.frame_cache.max_entries = max(_FRAME_CACHE_BASE, len(WINDOWS) * len(all_specs()))
+
+def refresh_data():
+    """Re-fetches every asset of the configured windows from the data source and stores the results."""
+    for window in WINDOWS:
+        load_assets(all_specs(), window, refresh=True)
+
+def load_snapshot_data():
+    """Loads every window (warming the frame cache) and precomputes the training analytics."""
+    # Called after the refresh marker changed, so the shared panel's version is re-read.
+    sharedpanel.store.expire()
+    data = {
+        "stocks_train": get_training_data(),
+        "benches_train": get_benchmark_training_data(),
+        "test": get_all_test_data(),
+    }
+    precompute_analytics(data["stocks_train"], data["benches_train"])
+    return data
+
+def shared_panel():
+    """
+    The universe's training and test panel shared by the workers of this host
+    (SHARED_PANEL_DIR, see sharedpanel.py) for the current data version, or None when
+    sharing is disabled or the panel cannot be published.
+    """
+    if not sharedpanel.enabled():
+        return None
+    return sharedpanel.store.get(shared_panel_version, _build_shared_panel)
+
+def shared_panel_version():
+    """
+    Version of the shared panel: the refresh marker and a hash of the universe's assets
+    and the window dates. A panel published under another configuration (e.g. before a
+    restart with a new universe, when the marker is unset in both) is rebuilt.
+    """
+    config = json.dumps([all_specs(), sorted(WINDOWS.items())], default=str)
+    return f"{scheduler.read_marker()}/{hashlib.sha1(config.encode()).hexdigest()[:16]}"
+
+def _build_shared_panel():
+    # Loads the universe for the shared panel. The frames are only needed until they are
+    # published, so they are not left in this worker's frame cache.
+    specs = all_specs()
+    kinds = {name: kind for kind, name, _ in specs}
+    windows = {}
+    for window in ("train", "test"):
+        windows[window] = (load_assets(specs, window), kinds)
+        for _, _, ticker in specs:
+            cache.frame_cache.invalidate((ticker, window, bars.DAILY))
+    return windows
+
+def get_training_data():
+    """Fetches or loads training data for top active stocks used for correlation matrix and optimization."""
+    shared = shared_panel()
+    if shared is not None:
+        return shared.frames("train", "stock")
+    return load_assets(stock_specs(), "train")
 
 def get_benchmark_training_data():
     """Fetches or loads training data for benchmark assets."""
-    bench_data = {}
-    for name, ticker in benchmarks.items():
-        table_name = f"asset_train_{name}"
-        df = None
-        if database.table_exists(table_name):
-            df = pd.read_sql_table(table_name, database.get_engine())
-            if df.empty:
-                df = assets.fetch_asset_data(ticker, start=TRAIN_START, end=TRAIN_END)
-                if df is not None:
-                    df = assets.process_asset_data(df)
-                    database.store_df_to_db(df, table_name=table_name)
-        else:
-            df = assets.fetch_asset_data(ticker, start=TRAIN_START, end=TRAIN_END)
-            if df is not None:
-                df = assets.process_asset_data(df)
-                database.store_df_to_db(df, table_name=table_name)
-        if df is not None:
-            bench_data[name] = df
-    return bench_data
+    shared = shared_panel()
+    if shared is not None:
+        return shared.frames("train", "asset")
+    return load_assets(benchmark_specs(), "train")
 
+def get_all_test_data():
+    """Fetches or loads test data for every stock and benchmark asset."""
+    shared = shared_panel()
+    if shared is not None:
+        return shared.frames("test")
+    return load_assets(all_specs(), "test")
+
+def _frames_by_asset(*data_dicts):
+    """Collects every non-empty DataFrame, keyed by asset name."""
+    frames = {}
+    for data_dict in data_dicts:
+        for asset, df in data_dict.items():
+            if not df.empty:
+                frames[asset] = df
+    return frames
+
+def returns_panel(frames):
+    """
+    The (memoized) panel.ReturnsPanel of a set of processed frames keyed by asset: their
+    daily and cumulative returns aligned on their dates. Built once per distinct data
+    set and shared by every analytic run on it.
+    """
+    return results.result_store.get_or_compute(
+        "returns_panel", results.fingerprint(frames), lambda: panel.ReturnsPanel.from_frames(frames))
+
+@instrumentation.timed("correlation")
+def correlation_matrix(frames):
+    """
+    Returns the (memoized) correlation matrix of the daily returns of the frames, aligned
+    on their dates, over the dates on which every asset has a return.
+    """
+    def compute():
+        returns = returns_panel(frames)
+        return pd.DataFrame(returns.correlation(), index=returns.names, columns=returns.names)
+    return results.result_store.get_or_compute("correlation_matrix", results.fingerprint(frames), compute)
+
+def _correlation_html(name, frames):
+    # The rendered table is memoized alongside the matrix it was rendered from. Large
+    # universes are cut down to the first HTML_MAX_ASSETS assets.
+    def render():
+        matrix = correlation_matrix(frames)
+        html = matrix.iloc[:HTML_MAX_ASSETS, :HTML_MAX_ASSETS].to_html(classes="table table-striped")
+        if len(matrix) > HTML_MAX_ASSETS:
+            html = (f"<p>Showing {HTML_MAX_ASSETS} of {len(matrix)} assets; "
+                    f"the full matrix is available from /api/correlation.</p>" + html)
+        return html
+    return results.result_store.get_or_compute(name, results.fingerprint(frames), render)
+
+@instrumentation.timed("correlation")
 def build_correlation_html(train_data):
     """Builds an HTML table of the correlation matrix using training data for stocks only."""
-    returns_dict = {ticker: df['Daily_Return'] for ticker, df in train_data.items() if not df.empty}
-    if returns_dict:
-        returns_df = pd.DataFrame(returns_dict).dropna()
-        corr_matrix = returns_df.corr()
-        return corr_matrix.to_html(classes="table table-striped")
+    frames = _frames_by_asset(train_data)
+    if frames:
+        return _correlation_html("correlation_html", frames)
     else:
         return "<p>No training data available for correlation matrix.</p>"
 
+@instrumentation.timed("correlation")
 def build_combined_correlation_html(stocks_data, bench_data):
     """
     Builds an HTML table of the combined correlation matrix using daily returns from
     both stocks and benchmark assets.
     """
-    combined_returns = {}
-    for ticker, df in stocks_data.items():
-        if not df.empty:
-            combined_returns[ticker] = df['Daily_Return']
-    for name, df in bench_data.items():
-        if not df.empty:
-            combined_returns[name] = df['Daily_Return']
-    if combined_returns:
-        combined_df = pd.DataFrame(combined_returns).dropna()
-        corr_matrix = combined_df.corr()
-        return corr_matrix.to_html(classes="table table-striped")
+    frames = _frames_by_asset(stocks_data, bench_data)
+    if frames:
+        return _correlation_html("combined_correlation_html", frames)
     else:
         return "<p>No data available for the combined correlation matrix.</p>"
 
+@instrumentation.timed("metrics")
 def compute_group_metrics(data_dict):
     """
-    Computes metrics from a dictionary of training DataFrames.
+    Computes metrics from a dictionary of training DataFrames. Results are memoized by the
+    content of the inputs, so the returned dictionaries must not be modified.
     Returns:
       - metrics: Dictionary of individual asset metrics.
       - group_avg: Dictionary of group average metrics.
     """
+    frames = _frames_by_asset(data_dict)
+    return results.result_store.get_or_compute(
+        "group_metrics", results.fingerprint(frames), lambda: _compute_group_metrics(frames))
+
+def _compute_group_metrics(data_dict):
+    # All assets are reduced at once on the aligned dates x assets matrices.
     metrics = {}
-    for asset, df in data_dict.items():
-        if not df.empty:
+    if data_dict:
+        returns = returns_panel(data_dict)
+        mean, std, last = returns.stats()
+        for i, asset in enumerate(returns.names):
             metrics[asset] = {
-                "Average Daily Return": df['Daily_Return'].mean(),
-                "Volatility": df['Daily_Return'].std(),
-                "Cumulative Return": df['Cumulative_Return'].iloc[-1]
-                #The .iloc indexer is used for integer-location based indexing. By specifying -1 as the index, 
-                # it retrieves the last element from the Series.
+                "Average Daily Return": mean[i],
+                "Volatility": std[i],
+                "Cumulative Return": last[i]
             }
     if metrics:
         group_avg = {
-            "Average Daily Return": np.mean([m["Average Daily Return"] for m in metrics.values()]),
-            "Volatility": np.mean([m["Volatility"] for m in metrics.values()]),
-            "Cumulative Return": np.mean([m["Cumulative Return"] for m in metrics.values()])
+            "Average Daily Return": np.mean(mean),
+            "Volatility": np.mean(std),
+            "Cumulative Return": np.mean(last)
         }
     else:
         group_avg = {}
     return metrics, group_avg
 
-def get_test_data(investment):
+def risk_level():
+    """Confidence level of VaR and CVaR (RISK_CONFIDENCE, default 0.95)."""
+    return float(os.getenv("RISK_CONFIDENCE", "0.95"))
+
+def market_name():
+    """Name of the benchmark that betas are measured against (ticker RISK_MARKET_TICKER, default SPY), or None."""
+    ticker = os.getenv("RISK_MARKET_TICKER", "SPY")
+    return next((name for name, symbol in benchmarks.items() if symbol == ticker), None)
+
+def market_returns(returns, market_frame):
+    # The market's daily returns on the dates of a returns panel (NaN where it has no bar).
+    if market_frame is None or market_frame.empty:
+        return None
+    series = pd.Series(market_frame["Daily_Return"].to_numpy(dtype=np.float64), index=panel.frame_dates(market_frame))
+    return series[~series.index.duplicated()].reindex(returns.dates).to_numpy()
+
+def _risk_dict(metrics, i):
+    # One column of risk.risk_metrics() output, with NaN reported as None.
+    return {name: float(values[i]) if np.isfinite(values[i]) else None for name, values in metrics.items()}
+
+@instrumentation.timed("metrics")
+def compute_risk_metrics(frames, market_frame=None, level=None):
+    """
+    Risk metrics (see risk.py) of every asset of a dictionary of frames keyed by asset,
+    computed in one pass over their returns panel, with betas against market_frame.
+    Memoized by the content of the frames and of the market frame, so they are computed
+    once per data snapshot. Returns {asset: {metric: value}}; the dictionaries must not
+    be modified.
+    """
+    level = risk_level() if level is None else level
+
+    def compute():
+        if not frames:
+            return {}
+        returns = returns_panel(frames)
+        mean, std, _ = returns.stats()
+        metrics = risk.risk_metrics(returns.returns, market_returns(returns, market_frame), level,
+                                    mean=mean, std=std)
+        return {asset: _risk_dict(metrics, i) for i, asset in enumerate(returns.names)}
+    market_key = results.fingerprint({"market": market_frame}) if market_frame is not None else None
+    return results.result_store.get_or_compute(
+        "risk_metrics", (results.fingerprint(frames), market_key, level), compute)
+
+def average_risk(metrics, names=None):
+    """Average of each risk metric over the named assets (default all), skipping missing values."""
+    rows = [metrics[name] for name in (metrics if names is None else names) if name in metrics]
+    averages = {}
+    for metric in risk.METRICS:
+        values = [row[metric] for row in rows if row[metric] is not None]
+        averages[metric] = float(np.mean(values)) if values else None
+    return averages
+
+def _market_frame(benches_data, window="train", bars_args=None):
+    # The market benchmark's frame: taken from the loaded benchmarks, or loaded on its own
+    # when a request selected other assets.
+    name = market_name()
+    if name is None:
+        return None
+    frame = benches_data.get(name)
+    if frame is None:
+        frame = load_assets([("asset", name, benchmarks[name])], window, **(bars_args or {})).get(name)
+    return frame if frame is not None and not frame.empty else None
+
+def training_risk(stocks_train_data, benches_train_data):
+    """
+    Risk metrics of every stock and benchmark over their training data (one pass over
+    the whole universe) and their averages per group.
+    Returns (metrics by asset, {"Stocks": averages, "Benchmarks": averages}).
+    """
+    metrics = compute_risk_metrics(_frames_by_asset(stocks_train_data, benches_train_data),
+                                   _market_frame(benches_train_data))
+    return metrics, {"Stocks": average_risk(metrics, stocks_train_data),
+                     "Benchmarks": average_risk(metrics, benches_train_data)}
+
+def portfolio_risk(frames, weights, market_frame=None, level=None):
+    """
+    Risk metrics of a portfolio holding fixed weights (by asset, rebalanced daily) over
+    the dates on which every held asset has a return. Returns {} when none is held.
+    """
+    held = [asset for asset, weight in weights.items() if asset in frames and weight]
+    if not held:
+        return {}
+    returns = returns_panel(frames).select(held)
+    rows = returns.complete_mask
+    daily = returns.returns[rows] @ np.array([weights[asset] for asset in held], dtype=np.float64)
+    market = market_returns(returns, market_frame)
+    metrics = risk.risk_metrics(daily[:, None], market[rows] if market is not None else None,
+                                risk_level() if level is None else level)
+    return _risk_dict(metrics, 0)
+
+def projection_settings():
+    """
+    Default Monte Carlo projection settings: MONTE_CARLO_METHOD (bootstrap or normal),
+    MONTE_CARLO_PATHS, MONTE_CARLO_HORIZON (trading days), MONTE_CARLO_SEED and
+    MONTE_CARLO_REBALANCE.
+    """
+    seed = os.getenv("MONTE_CARLO_SEED", "0")
+    return {
+        "method": os.getenv("MONTE_CARLO_METHOD", "bootstrap"),
+        "paths": int(os.getenv("MONTE_CARLO_PATHS", "10000")),
+        "horizon": int(os.getenv("MONTE_CARLO_HORIZON", "63")),
+        "seed": int(seed) if seed not in ("", "none") else None,
+        "rebalance": os.getenv("MONTE_CARLO_REBALANCE", "none"),
+    }
+
+def projection_model(frames, method="bootstrap", estimator="ledoit_wolf"):
+    """
+    The montecarlo.simulate() model of the assets of the frames (in their order): their
+    complete rows of historical returns to bootstrap from, or the mean returns and
+    (shrunk) covariance estimated for the optimizer. Raises ValueError without at
+    least two dates on which every asset has a return.
+    """
+    if method == "bootstrap":
+        history = returns_panel(frames).complete_returns()
+        if len(history) < 2:
+            raise ValueError("not enough history on which every asset has a return")
+        return ("bootstrap", history)
+    if method == "normal":
+        _, mu, cov, _, _ = covariance_inputs(frames, estimator)
+        if mu is None:
+            raise ValueError("not enough history on which every asset has a return")
+        return ("normal", mu, montecarlo.normal_factor(cov))
+    raise ValueError(f"Unknown simulation method '{method}' (one of {', '.join(montecarlo.METHODS)})")
+
+@instrumentation.timed("portfolio")
+def project_portfolio(frames, weights, investment, settings=None, estimator="ledoit_wolf"):
     """
-    Fetches or loads test data for both stocks and benchmark assets.
+    Monte Carlo projection (see montecarlo.py) of an investment in a portfolio of the
+    frames' assets held at `weights` ({asset: weight}). The projection of a unit
+    investment is memoized per data set, weights and settings, and scaled to
+    `investment`. Raises ValueError as projection_model() does.
+    """
+    settings = settings or projection_settings()
+    frames = {asset: frames[asset] for asset in weights if asset in frames}
+    if not frames:
+        raise ValueError("no data for the portfolio's assets")
+    vector = np.array([weights[asset] for asset in frames], dtype=np.float64)
+
+    def compute():
+        model = projection_model(frames, settings["method"], estimator)
+        return montecarlo.project(model, vector, settings["horizon"], settings["paths"], seed=settings["seed"],
+                                  rebalance=settings["rebalance"] == "daily")
+    if settings["seed"] is None:
+        # Unseeded projections differ on every run, so they are not memoized.
+        return montecarlo.scale(compute(), investment)
+    key = (results.fingerprint(frames), tuple(vector), estimator, tuple(sorted(settings.items())))
+    return montecarlo.scale(results.result_store.get_or_compute("projection", key, compute), investment)
+
+# Streaming rolling-correlation engines, keyed by (data window, days, assets).
+_rolling_engines = OrderedDict()
+_rolling_lock = threading.Lock()
+
+@instrumentation.timed("correlation")
+def rolling_correlation_engine(frames, days, window="train", resolution="1d"):
+    """
+    Returns a rolling.RollingCorrelation positioned at the last date of the frames.
+    Engines are kept per (window, bar resolution, days, assets); when the frames have
+    only gained new dates since the last call (e.g. after incremental ingestion) just
+    those days are streamed in, otherwise the engine is rebuilt.
+    """
+    returns = returns_panel(frames)
+    dates, names, values = returns.dates, returns.names, returns.returns
+    key = (window, resolution, days, tuple(names))
+    with _rolling_lock:
+        engine = _rolling_engines.get(key)
+        start = 0
+        if engine is not None and engine.last_date is not None and engine.last_date in dates:
+            end = dates.get_loc(engine.last_date) + 1
+            buffered = engine.recent()
+            if np.array_equal(buffered, values[end - len(buffered):end], equal_nan=True):
+                start = end
+            else:
+                engine = None
+        else:
+            engine = None
+        if engine is None:
+            engine = rolling.RollingCorrelation(names, days)
+        if start < len(dates):
+            engine.append(values[start:], dates[start:])
+        _rolling_engines[key] = engine
+        _rolling_engines.move_to_end(key)
+        while len(_rolling_engines) > 16:
+            _rolling_engines.popitem(last=False)
+    return engine
+
+def precompute_analytics(stocks_train_data=None, benches_train_data=None):
+    """
+    Materializes the training-window analytics (group metrics, correlation matrices and
+    their rendered HTML) so that subsequent requests only render the template. Intended to
+    run at startup and after a data refresh.
+    """
+    if stocks_train_data is None:
+        stocks_train_data = get_training_data()
+    if benches_train_data is None:
+        benches_train_data = get_benchmark_training_data()
+    compute_group_metrics(stocks_train_data)
+    compute_group_metrics(benches_train_data)
+    training_risk(stocks_train_data, benches_train_data)
+    build_correlation_html(stocks_train_data)
+    build_combined_correlation_html(stocks_train_data, benches_train_data)
+    return results.result_store.stats()
+
+@instrumentation.timed("portfolio")
+def get_test_data(investment, test_data=None):
+    """
+    Fetches or loads test data for both stocks and benchmark assets (unless already
+    loaded test data, e.g. from the background refresh snapshot, is passed in).
     Returns:
       - asset_results: Dictionary of individual asset predictions.
       - test_data_store: Dictionary storing DataFrames for each asset.
@@ -153,53 +742,18 @@ def get_test_data(investment):
     asset_results = {}
     test_data_store = {}
     
-    # Process stocks test data
-    for ticker in top_active_stocks:
-        table_name = f"stock_test_{ticker}"
-        df = None
-        if database.table_exists(table_name):
-            df = pd.read_sql_table(table_name, database.get_engine())
-            if df.empty:
-                df = stocks.fetch_stock_data(ticker, start=TEST_START, end=TEST_END)
-                if df is not None:
-                    df = stocks.process_stock_data(df)
-                    database.store_df_to_db(df, table_name=table_name)
-        else:
-            df = stocks.fetch_stock_data(ticker, start=TEST_START, end=TEST_END)
-            if df is not None:
-                df = stocks.process_stock_data(df)
-                database.store_df_to_db(df, table_name=table_name)
-        if df is not None and not df.empty:
-
-            cum_ret = df['Cumulative_Return'].iloc[-1]
-            predicted_value = investment * (1 + cum_ret)
-            asset_results[ticker] = {"Cumulative_Return": cum_ret, "Predicted_Value": predicted_value}
-            test_data_store[ticker] = df
-
-    # Process benchmark assets test data
-    for name, ticker in benchmarks.items():
-        table_name = f"asset_test_{name}"
-        df = None
-        if database.table_exists(table_name):
-            df = pd.read_sql_table(table_name, database.get_engine())
-            if df.empty:
-                df = assets.fetch_asset_data(ticker, start=TEST_START, end=TEST_END)
-                if df is not None:
-                    df = assets.process_asset_data(df)
-                    database.store_df_to_db(df, table_name=table_name)
-        else:
-            df = assets.fetch_asset_data(ticker, start=TEST_START, end=TEST_END)
-            if df is not None:
-                df = assets.process_asset_data(df)
-                database.store_df_to_db(df, table_name=table_name)
-        if df is not None and not df.empty:
-            cum_ret = df['Cumulative_Return'].iloc[-1]
+    if test_data is None:
+        test_data = get_all_test_data()
+    test_data_store = _frames_by_asset(test_data)
+    if test_data_store:
+        returns = returns_panel(test_data_store)
+        for name, cum_ret in zip(returns.names, returns.stats()[2]):
             predicted_value = investment * (1 + cum_ret)
             asset_results[name] = {"Cumulative_Return": cum_ret, "Predicted_Value": predicted_value}
-            test_data_store[name] = df
 
     return asset_results, test_data_store
 
+@instrumentation.timed("portfolio")
 def calculate_portfolio_metrics(test_data_store, asset_results, investment):
     """
     Calculates a balanced portfolio using equal weighting for assets with positive cumulative returns.
@@ -214,14 +768,11 @@ def calculate_portfolio_metrics(test_data_store, asset_results, investment):
     portfolio_assets = list(positive_assets.keys())
     
     if positive_assets:
-        portfolio_dfs = []
-        for asset in positive_assets:
-            if asset in test_data_store:
-                temp_df = test_data_store[asset][['Daily_Return']].rename(columns={'Daily_Return': asset})
-                portfolio_dfs.append(temp_df)
-        if portfolio_dfs:
-            combined_returns = pd.concat(portfolio_dfs, axis=1, join='inner')
-            portfolio_daily_return = combined_returns.mean(axis=1)
+        held = [asset for asset in positive_assets if asset in test_data_store]
+        if held:
+            # Equal weights, rebalanced daily, over the dates on which every held asset has a return.
+            combined_returns = returns_panel(test_data_store).select(held).complete_returns()
+            portfolio_daily_return = pd.Series(combined_returns.mean(axis=1))
             portfolio_avg_daily_return = portfolio_daily_return.mean()
             portfolio_volatility = portfolio_daily_return.std()
             sharpe_ratio = (portfolio_avg_daily_return / portfolio_volatility) if portfolio_volatility != 0 else None
@@ -236,69 +787,915 @@ def calculate_portfolio_metrics(test_data_store, asset_results, investment):
                 "Volatility": portfolio_volatility,
                 "Sharpe Ratio": sharpe_ratio
             }
+            portfolio_metrics.update(portfolio_risk(test_data_store, dict.fromkeys(held, 1.0 / len(held)),
+                                                    test_data_store.get(market_name())))
     return portfolio_result, portfolio_metrics, portfolio_assets
 
-def calculate_optimized_portfolio(investment, train_data, asset_results):
+def optimizer_settings():
+    """Default optimization settings: OPTIMIZER_METHOD, OPTIMIZER_MAX_WEIGHT, OPTIMIZER_LONG_ONLY, COVARIANCE_ESTIMATOR."""
+    max_weight = os.getenv("OPTIMIZER_MAX_WEIGHT")
+    return {
+        "method": os.getenv("OPTIMIZER_METHOD", "max_sharpe"),
+        "long_only": os.getenv("OPTIMIZER_LONG_ONLY", "true").lower() in ("1", "true", "yes", "on"),
+        "max_weight": float(max_weight) if max_weight else None,
+        "estimator": os.getenv("COVARIANCE_ESTIMATOR", "ledoit_wolf"),
+    }
+
+def covariance_inputs(frames, estimator="ledoit_wolf"):
     """
-    Computes an optimized portfolio using training data to assign weights proportional to each asset's
-    average daily return. Only assets with positive cumulative returns (from test data) are considered.
-    
+    Returns the (memoized) optimizer inputs for the frames: (names, expected daily returns,
+    covariance, shrinkage, observations), estimated on the dates where every asset has a return.
+    """
+    def compute():
+        returns = returns_panel(frames)
+        names, values = returns.names, returns.complete_returns()
+        if len(values) < 2:
+            return names, None, None, None, len(values)
+        cov, shrinkage = optimizer.covariance(values, estimator)
+        return names, values.mean(axis=0), cov, shrinkage, len(values)
+    return results.result_store.get_or_compute(
+        "covariance", (results.fingerprint(frames), estimator), compute)
+
+@instrumentation.timed("portfolio")
+def optimize_portfolio(frames, method="max_sharpe", long_only=True, max_weight=None, estimator="ledoit_wolf"):
+    """
+    Optimal weights for the training frames, memoized per data version (universe and
+    window) and constraints. Returns a dictionary with the weights by asset, the
+    portfolio's expected daily return, volatility and Sharpe ratio, the covariance
+    shrinkage and the number of observations, or None without enough history.
+    Raises ValueError for an unknown method or infeasible constraints.
+    """
+    def compute():
+        inputs = covariance_inputs(frames, estimator)
+        if inputs[1] is None:
+            return None
+        _, mu, cov, _, _ = inputs
+        return _optimized_summary(inputs, optimizer.optimize(method, mu, cov, long_only=long_only,
+                                                             max_weight=max_weight))
+    key = (results.fingerprint(frames), method, long_only, max_weight, estimator)
+    return results.result_store.get_or_compute("optimized_portfolio", key, compute)
+
+def _optimized_summary(inputs, weights):
+    # The optimize_portfolio() result for covariance_inputs() and optimal weights.
+    names, mu, cov, shrinkage, observations = inputs
+    return {
+        "weights": dict(zip(names, weights.tolist())),
+        "metrics": optimizer.portfolio_stats(weights, mu, cov),
+        "shrinkage": shrinkage,
+        "observations": observations,
+    }
+
+@instrumentation.timed("portfolio")
+def calculate_optimized_portfolio(investment, train_data, asset_results, settings=None):
+    """
+    Computes an optimized portfolio over the assets with positive cumulative returns (from
+    test data). Weights are chosen from the training data by the configured method
+    (see optimizer_settings): minimum variance, maximum Sharpe ratio or risk parity on a
+    shrunk covariance matrix, or "mean_return" for weights proportional to each asset's
+    average daily return.
+
     Returns:
       - optimized_predicted_value: Predicted portfolio value using optimized weights.
       - optimized_cum_ret: Weighted average cumulative return.
       - portfolio_composition: Dictionary with each asset's allocation percentage.
     """
-    weights = {}
-    total_avg_return = 0.0
+    settings = settings or optimizer_settings()
     positive_assets = [asset for asset, data in asset_results.items() if data["Cumulative_Return"] > 0]
-    
-    # Calculate each asset's average daily return using training data as a performance proxy.
-    for asset in positive_assets:
-        if asset in train_data and not train_data[asset].empty:
-            avg_return = train_data[asset]['Daily_Return'].mean()
+    frames = {asset: train_data[asset] for asset in positive_assets
+              if asset in train_data and not train_data[asset].empty}
+
+    weights = {}
+    if settings["method"] == "mean_return":
+        # Calculate each asset's average daily return using training data as a performance proxy.
+        returns = returns_panel(frames)
+        for asset, avg_return in zip(returns.names, returns.stats()[0]):
             if avg_return > 0:
                 weights[asset] = avg_return
-                total_avg_return += avg_return
-    
+    elif frames:
+        optimized = optimize_portfolio(frames, settings["method"], settings["long_only"],
+                                       settings["max_weight"], settings["estimator"])
+        weights = optimized["weights"] if optimized else {}
+    total = sum(weights.values())
+
     portfolio_composition = {}
-    if total_avg_return > 0:
-        for asset, ret in weights.items():
-            portfolio_composition[asset] = round(ret / total_avg_return * 100, 2)
-    
+    if total > 0:
+        for asset, weight in weights.items():
+            allocation = round(weight / total * 100, 2)
+            if allocation:
+                portfolio_composition[asset] = allocation
+
     optimized_predicted_value = 0.0
     for asset, alloc_percent in portfolio_composition.items():
         weight = alloc_percent / 100.0
         if asset in asset_results:
             optimized_predicted_value += investment * weight * (1 + asset_results[asset]['Cumulative_Return'])
-    
+
     optimized_cum_ret = sum((alloc_percent / 100.0) * asset_results[asset]['Cumulative_Return']
                             for asset, alloc_percent in portfolio_composition.items())
-    
+
     return optimized_predicted_value, optimized_cum_ret, portfolio_composition
 
-@app.route("/health")
+# Background warm-up and periodic refresh (BACKGROUND_REFRESH=1), see scheduler.py.
+refresher = scheduler.Refresher(load_snapshot_data, refresh_data)
+
+@routes.before_app_request
+def begin_instrumentation():
+    instrumentation.begin_request()
+
+@routes.after_app_request
+def finish_instrumentation(response):
+    # Metrics are labelled with the view name, without the blueprint's "app." prefix.
+    endpoint = request.endpoint.rpartition(".")[2] if request.endpoint else None
+    record = instrumentation.finish_request(endpoint, request.method, response.status_code)
+    if record is not None and instrumentation.server_timing_enabled():
+        response.headers["Server-Timing"] = record.server_timing()
+    return response
+
+@routes.after_app_request
+def record_first_response(response):
+    startup.startup_report.mark_response()
+    return response
+
+@routes.before_app_request
+def start_refresher():
+    # create_app() starts the thread (and forked workers restart it); this covers apps
+    # served without the factory.
+    if scheduler.enabled():
+        refresher.start()
+
+class WarmingUp(Exception):
+    """The background refresher has not built its first snapshot yet; reported as a 503 response."""
+
+@routes.app_errorhandler(WarmingUp)
+def warming_up(error):
+    if request.path.startswith("/api/"):
+        response = jsonify({"error": str(error), "refresh": refresher.status()})
+    else:
+        response = Response(f"<p>{str(error).capitalize()}.</p>", mimetype="text/html")
+    response.status_code = 503
+    response.headers["Retry-After"] = os.getenv("REFRESH_RETRY_AFTER", "5")
+    return response
+
+def background_snapshot():
+    """
+    The background refresher's snapshot of the universe's data. Until the first one is
+    built, waits up to REFRESH_WARMUP_WAIT seconds (default 10) for it and then raises
+    WarmingUp, rather than loading the same data inline while the refresher does.
+    """
+    refresher.start()
+    snapshot = refresher.wait(float(os.getenv("REFRESH_WARMUP_WAIT", "10")))
+    if snapshot is None:
+        raise WarmingUp("market data is loading; retry shortly")
+    return snapshot
+
+@routes.route("/health")
 def health():
     # Simple health check endpoint to verify that the service is running.
     return jsonify({"status": "OK"}), 200
 
-@app.route("/debug/aapl")
+@routes.route("/metrics")
+def metrics():
+    # Prometheus metrics of this worker process (request and stage durations, DB round trips, cache lookups).
+    return Response(instrumentation.registry.render(), mimetype="text/plain; version=0.0.4")
+
+@routes.route("/debug/aapl")
 def debug_aapl():
-    # try the two different fetch styles
-    df1 = yf.Ticker("AAPL").history(start="2022-01-01", end="2024-12-31", interval="1d")
-    df2 = yf.download(
-        tickers="AAPL",
-        start="2022-01-01",
-        end="2024-12-31",
-        interval="1d",
-        progress=False,
-        threads=False
-    )
+    # try the two different fetch styles of the configured data source
+    source = datasource.get_data_source()
+    df1 = source.history("AAPL", start="2022-01-01", end="2024-12-31", interval="1d")
+    df2 = source.download("AAPL", start="2022-01-01", end="2024-12-31", interval="1d")
     return {
+        "source": source.name,
         "history_rows": len(df1),
         "download_rows": len(df2)
     }
 
-@app.route("/testtimeout")
+@routes.route("/debug/pool")
+def debug_pool():
+    # Connection pool statistics for this worker, used to tune the DB_POOL_* settings.
+    return jsonify(database.pool_status()), 200
+
+@routes.route("/debug/cache")
+def debug_cache():
+    # Hit/miss counters of this worker's DataFrame cache.
+    return jsonify({"frames": cache.frame_cache.stats(), "results": results.result_store.stats(),
+                    "responses": httpcache.body_cache.stats(), "columnar": colcache.stats(), "catalog": catalog.table_catalog.status(),
+                    "shared_panel": sharedpanel.store.status()}), 200
+
+@routes.route("/debug/profiles")
+def debug_profiles():
+    # Stage breakdown and hottest stacks of this worker's recent slow requests (PROFILE_SLOW_REQUESTS_MS).
+    return jsonify(list(instrumentation.profiler.recent)), 200
+
+@routes.route("/debug/startup")
+def debug_startup():
+    # Import times, time to ready and to first response of this worker's process (see startup.py).
+    return jsonify(startup.startup_report.status()), 200
+
+@routes.route("/debug/refresh")
+def debug_refresh():
+    # Age and staleness of the background refresh snapshot served by this worker.
+    return jsonify(refresher.status()), 200
+
+def current_data(include_test=False, names=None, window="train", interval="1d", resample=None):
+    """
+    Returns the data served to requests: (stocks_train, benches_train, test_data, version,
+    modified_at). Uses the background snapshot when the refresher is enabled (see
+    background_snapshot). `version` is a content hash of the frames and `modified_at`
+    the snapshot refresh time (None without one).
+    Requests for tickers outside the universe, for another training window or for bars
+    other than daily (interval and resample, see load_assets) load just the requested
+    assets for that window and resolution instead.
+    """
+    adhoc = (window != "train" or interval != bars.DAILY or resample is not None
+             or (names is not None and not set(names) <= set(top_active_stocks) | set(benchmarks)))
+    snapshot = background_snapshot() if scheduler.enabled() and not adhoc else None
+    if snapshot is not None:
+        stocks_train, benches_train = snapshot.data["stocks_train"], snapshot.data["benches_train"]
+        test_data = snapshot.data["test"] if include_test else {}
+        modified_at = snapshot.version
+    elif adhoc:
+        specs = specs_for(names) if names is not None else all_specs()
+        bars_args = {"interval": interval, "resample": resample}
+        stocks_train = load_assets([spec for spec in specs if spec[0] == "stock"], window, **bars_args)
+        benches_train = load_assets([spec for spec in specs if spec[0] == "asset"], window, **bars_args)
+        test_data = load_assets(specs, "test", **bars_args) if include_test else {}
+        modified_at = None
+    else:
+        stocks_train, benches_train = get_training_data(), get_benchmark_training_data()
+        test_data = get_all_test_data() if include_test else {}
+        modified_at = None
+    version = results.fingerprint(_frames_by_asset(stocks_train, benches_train, test_data))
+    return stocks_train, benches_train, test_data, version, modified_at
+
+class BadRequest(ValueError):
+    """Invalid API query parameters; reported as a 400 response."""
+
+@routes.app_errorhandler(BadRequest)
+def bad_request(error):
+    return jsonify({"error": str(error)}), 400
+
+def _requested_tickers(args=None):
+    # ?tickers=AAPL,MSFT,Gold restricts a response to those assets (stock tickers or benchmark
+    # names). Tickers outside the configured universe are loaded on demand. `args` replaces
+    # the query string, e.g. with job parameters (where tickers may also be a list).
+    args = request.args if args is None else args
+    value = args.get("tickers") or ""
+    items = value.split(",") if isinstance(value, str) else [str(item) for item in value]
+    names = list(dict.fromkeys(name.strip() for name in items if name.strip()))
+    max_tickers = int(os.getenv("API_MAX_TICKERS", "200"))
+    if len(names) > max_tickers:
+        raise BadRequest(f"at most {max_tickers} tickers per request")
+    return names or None
+
+def _requested_confidence(args=None):
+    # ?confidence=0.99 replaces the VaR/CVaR confidence level (RISK_CONFIDENCE).
+    args = request.args if args is None else args
+    value = args.get("confidence")
+    if value in (None, ""):
+        return risk_level()
+    try:
+        level = float(value)
+    except ValueError:
+        raise BadRequest("confidence must be a number")
+    if not 0.5 <= level < 1:
+        raise BadRequest("confidence must be at least 0.5 and below 1")
+    return level
+
+def _requested_window(args=None):
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD replaces the training window for this request.
+    args = request.args if args is None else args
+    start, end = args.get("start"), args.get("end")
+    if not start and not end:
+        return "train"
+    try:
+        return register_window(start or TRAIN_START, end or TRAIN_END)
+    except ValueError as e:
+        raise BadRequest(str(e))
+
+def _requested_bars(args=None):
+    # ?interval= sets the bars to load (1m to 1mo, default 1d) and ?resample= a coarser
+    # interval to aggregate them to before the analytics run, e.g. interval=5m&resample=1h.
+    # Returned as load_assets() keyword arguments.
+    args = request.args if args is None else args
+    interval = args.get("interval") or bars.DAILY
+    resample = args.get("resample") or None
+    try:
+        bars.validate(interval, resample)
+    except ValueError as e:
+        raise BadRequest(str(e))
+    return {"interval": interval, "resample": resample}
+
+def _float_arg(name, default=None, args=None):
+    value = (request.args if args is None else args).get(name)
+    if value in (None, ""):
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a number")
+
+def _optimizer_args(args=None):
+    # ?method=, ?long_only=, ?max_weight= and ?estimator= override the configured defaults.
+    args = request.args if args is None else args
+    settings = optimizer_settings()
+    settings["method"] = args.get("method", settings["method"])
+    if "long_only" in args:
+        settings["long_only"] = str(args["long_only"]).lower() in ("1", "true", "yes", "on")
+    settings["max_weight"] = _float_arg("max_weight", settings["max_weight"], args)
+    settings["estimator"] = args.get("estimator", settings["estimator"])
+    if settings["method"] not in optimizer.METHODS + ("mean_return",):
+        raise BadRequest(f"unknown method '{settings['method']}'")
+    if settings["estimator"] not in optimizer.ESTIMATORS:
+        raise BadRequest(f"unknown estimator '{settings['estimator']}'")
+    return settings
+
+def _window_json(window, bars_args=None):
+    # The window's dates, plus the bar interval (and resampling) when not daily.
+    start, end = window_dates(window)
+    window_json = {"start": start, "end": end}
+    if bars_args and (bars_args["interval"] != bars.DAILY or bars_args["resample"]):
+        window_json.update(bars_args)
+    return window_json
+
+def _date_labels(dates, bars_args):
+    # YYYY-MM-DD for daily (or coarser) bars, full ISO timestamps for intraday bars. The
+    # format follows the bars requested: daily bars are stamped at midnight exchange time,
+    # which is not midnight in the UTC dates of the panels.
+    if bars.is_intraday(bars_args.get("resample") or bars_args.get("interval") or bars.DAILY):
+        return [d.isoformat() for d in dates]
+    return [str(d.date()) for d in dates]
+
+def _select_assets(data_dict, names):
+    if names is None:
+        return data_dict
+    return {name: df for name, df in data_dict.items() if name in names}
+
+@routes.route("/api/metrics")
+def api_metrics():
+    # Per-asset training metrics; ?group=stocks|benchmarks|all (default all).
+    group = request.args.get("group", "all")
+    names = _requested_tickers()
+    window = _requested_window()
+    bars_args = _requested_bars()
+    groups = ("stocks", "benchmarks", "all")
+    if group not in groups:
+        return jsonify({"error": f"unknown group '{group}'"}), 400
+    stocks_train, benches_train, _, version, modified_at = current_data(names=names, window=window, **bars_args)
+    groups = {"stocks": [stocks_train], "benchmarks": [benches_train], "all": [stocks_train, benches_train]}
+    frames = _select_assets(_frames_by_asset(*groups[group]), names)
+    return httpcache.conditional_json(version, [group, names, window, bars_args], lambda: {
+        "window": _window_json(window, bars_args),
+        "metrics": compute_group_metrics(frames)[0],
+    }, modified_at)
+
+@routes.route("/api/group-metrics")
+def api_group_metrics():
+    window = _requested_window()
+    bars_args = _requested_bars()
+    stocks_train, benches_train, _, version, modified_at = current_data(window=window, **bars_args)
+    return httpcache.conditional_json(version, [window, bars_args], lambda: {
+        "window": _window_json(window, bars_args),
+        "groups": {"Stocks": compute_group_metrics(stocks_train)[1],
+                   "Benchmarks": compute_group_metrics(benches_train)[1]},
+    }, modified_at)
+
+@routes.route("/api/risk")
+def api_risk():
+    # Per-asset risk metrics of training returns; ?group=stocks|benchmarks|all (default all), ?confidence=.
+    group = request.args.get("group", "all")
+    names = _requested_tickers()
+    window = _requested_window()
+    bars_args = _requested_bars()
+    level = _requested_confidence()
+    groups = ("stocks", "benchmarks", "all")
+    if group not in groups:
+        return jsonify({"error": f"unknown group '{group}'"}), 400
+    stocks_train, benches_train, _, version, modified_at = current_data(names=names, window=window, **bars_args)
+    market = _market_frame(benches_train, window, bars_args)
+    groups = {"stocks": [stocks_train], "benchmarks": [benches_train], "all": [stocks_train, benches_train]}
+    frames = _select_assets(_frames_by_asset(*groups[group]), names)
+
+    def build():
+        metrics = compute_risk_metrics(frames, market, level)
+        return {"window": _window_json(window, bars_args), "confidence": level, "market": market_name(),
+                "metrics": metrics, "average": average_risk(metrics)}
+    market_version = results.fingerprint({"market": market}) if market is not None else None
+    return httpcache.conditional_json(version, [group, names, window, bars_args, level, market_version],
+                                      build, modified_at)
+
+@routes.route("/api/correlation")
+def api_correlation():
+    # Correlation matrix of training returns; ?group=stocks|all (default all) and ?tickers=.
+    group = request.args.get("group", "all")
+    names = _requested_tickers()
+    window = _requested_window()
+    bars_args = _requested_bars()
+    if group not in ("stocks", "all"):
+        return jsonify({"error": f"unknown group '{group}'"}), 400
+    stocks_train, benches_train, _, version, modified_at = current_data(names=names, window=window, **bars_args)
+    frames = _frames_by_asset(stocks_train) if group == "stocks" else _frames_by_asset(stocks_train, benches_train)
+    frames = _select_assets(frames, names)
+
+    def build():
+        matrix = correlation_matrix(frames) if frames else pd.DataFrame()
+        return {"window": _window_json(window, bars_args), "assets": list(matrix.columns),
+                "matrix": matrix.to_numpy().tolist()}
+    return httpcache.conditional_json(version, [group, names, window, bars_args], build, modified_at)
+
+@routes.route("/api/portfolio")
+def api_portfolio():
+    # Equal-weighted and optimized portfolio results for ?investment= (default 1000) over ?tickers=.
+    try:
+        investment = float(request.args.get("investment", 1000))
+    except ValueError:
+        return jsonify({"error": "investment must be a number"}), 400
+    names = _requested_tickers()
+    window = _requested_window()
+    bars_args = _requested_bars()
+    settings = _optimizer_args()
+    stocks_train, _, test_data, version, modified_at = current_data(include_test=True, names=names, window=window,
+                                                                    **bars_args)
+
+    def build():
+        asset_results, test_data_store = get_test_data(investment, _select_assets(test_data, names))
+        portfolio_result, portfolio_metrics, portfolio_assets = calculate_portfolio_metrics(
+            test_data_store, asset_results, investment)
+        try:
+            optimized_value, optimized_cum_ret, optimized_composition = calculate_optimized_portfolio(
+                investment, stocks_train, asset_results, settings)
+        except ValueError as e:
+            raise BadRequest(str(e))
+        weights = {asset: alloc / 100.0 for asset, alloc in optimized_composition.items()}
+        optimized_risk = portfolio_risk(test_data_store, weights, test_data_store.get(market_name()))
+        return {
+            "investment": investment,
+            "window": _window_json("test", bars_args),
+            "training_window": _window_json(window, bars_args),
+            "assets": asset_results,
+            "equal_weighted": {"result": portfolio_result, "metrics": portfolio_metrics,
+                               "assets": portfolio_assets},
+            "optimized": {"Portfolio_Cumulative_Return": optimized_cum_ret,
+                          "Portfolio_Predicted_Value": optimized_value,
+                          "composition": optimized_composition,
+                          "risk": optimized_risk,
+                          "settings": settings},
+        }
+    return httpcache.conditional_json(version, [investment, names, window, bars_args, sorted(settings.items())],
+                                      build, modified_at)
+
+@routes.route("/api/optimize")
+def api_optimize():
+    # Optimal weights over the training returns; ?group=stocks|all (default stocks), ?tickers=,
+    # ?method=min_variance|max_sharpe|risk_parity, ?long_only=, ?max_weight=, ?estimator=.
+    group, names, window, bars_args, settings = _optimize_options()
+    frames, version, modified_at = _optimize_frames(group, names, window, bars_args)
+
+    def build():
+        try:
+            optimized = optimize_portfolio(frames, settings["method"], settings["long_only"],
+                                           settings["max_weight"], settings["estimator"]) if frames else None
+        except ValueError as e:
+            raise BadRequest(str(e))
+        return {"window": _window_json(window, bars_args), "settings": settings, "portfolio": optimized}
+    return httpcache.conditional_json(version, [group, names, window, bars_args, sorted(settings.items())],
+                                      build, modified_at)
+
+def _optimize_options(args=None):
+    # Parameters of /api/optimize (and optimize jobs): (group, tickers, window, bars, settings).
+    args = request.args if args is None else args
+    group = args.get("group", "stocks")
+    names = _requested_tickers(args)
+    window = _requested_window(args)
+    bars_args = _requested_bars(args)
+    settings = _optimizer_args(args)
+    if group not in ("stocks", "all"):
+        raise BadRequest(f"unknown group '{group}'")
+    if settings["method"] == "mean_return":
+        raise BadRequest("method must be one of " + ", ".join(optimizer.METHODS))
+    return group, names, window, bars_args, settings
+
+def _optimize_frames(group, names, window, bars_args):
+    # Training frames to optimize over: (frames, version, modified_at).
+    stocks_train, benches_train, _, version, modified_at = current_data(names=names, window=window, **bars_args)
+    frames = _frames_by_asset(stocks_train) if group == "stocks" else _frames_by_asset(stocks_train, benches_train)
+    return _select_assets(frames, names), version, modified_at
+
+def _backtest_request():
+    # Backtest parameters from a JSON body (POST) or the query string (GET).
+    body = request.get_json(silent=True) if request.method == "POST" else None
+    if body is None:
+        body = {key: request.args[key] for key in request.args}
+    if not isinstance(body, dict):
+        raise BadRequest("request body must be a JSON object")
+    return body
+
+def _list_param(params, key):
+    # A list parameter given as a list, a single value or a comma-separated string (as in
+    # the query string, or in job parameters).
+    value = params.get(key)
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+def _backtest_options(params):
+    # Validated backtest parameters that need no data: tickers, window, schedules,
+    # investments, number of random portfolios and whether to return equity curves.
+    names = _requested_tickers(params)
+    start, end = params.get("start"), params.get("end")
+    try:
+        window = register_window(start or TEST_START, end or TEST_END) if (start or end) else "test"
+        schedules = _list_param(params, "rebalance") or ["none"]
+        for schedule in schedules:
+            backtest.rebalance_period(schedule)
+        investments = [float(value) for value in (_list_param(params, "investments") or [1000.0])]
+        n_random = int(params.get("portfolios", 0))
+    except (TypeError, ValueError) as e:
+        raise BadRequest(str(e))
+    seed = params.get("seed")
+    try:
+        seed = int(seed) if seed not in (None, "") else None
+    except (TypeError, ValueError):
+        raise BadRequest("seed must be an integer")
+    curves = str(params.get("curves", "false")).lower() in ("1", "true", "yes", "on")
+    return {"names": names, "window": window, "bars": _requested_bars(params), "schedules": schedules,
+            "investments": investments, "random": n_random, "seed": seed, "curves": curves}
+
+def _backtest_inputs(params, max_portfolios):
+    # _backtest_options() plus the aligned test returns ("dates", "assets", "returns") and
+    # the "weights" matrix (given, random or equal-weighted).
+    options = _backtest_options(params)
+    names, window, bars_args = options["names"], options["window"], options["bars"]
+    if window == "test":
+        test_data = current_data(include_test=True, names=names, **bars_args)[2]
+    else:
+        test_data = load_assets(specs_for(names) if names else all_specs(), window, **bars_args)
+    frames = _select_assets(_frames_by_asset(test_data), names)
+    if not frames:
+        raise BadRequest("no test data for the requested assets")
+    returns = returns_panel(frames)
+    dates, assets, values, complete = returns.dates, returns.names, returns.returns, returns.complete_mask
+    if not complete.any():
+        raise BadRequest("not enough history on which every asset has a return")
+
+    weights = params.get("weights")
+    if weights is not None:
+        try:
+            weights = np.asarray([[float(portfolio.get(asset, 0.0)) for asset in assets]
+                                  if isinstance(portfolio, dict) else portfolio for portfolio in weights],
+                                 dtype=np.float64)
+        except (TypeError, ValueError):
+            weights = None
+        if weights is None or weights.ndim != 2 or weights.shape[1] != len(assets):
+            raise BadRequest(f"weights must be portfolios x {len(assets)} assets ({', '.join(assets)})")
+    elif options["random"] > 0:
+        long_only = str(params.get("long_only", "true")).lower() in ("1", "true", "yes", "on")
+        weights = backtest.random_weights(min(options["random"], max_portfolios), len(assets),
+                                          seed=options["seed"], long_only=long_only)
+    else:
+        weights = np.full((1, len(assets)), 1.0 / len(assets))
+    if len(weights) > max_portfolios:
+        raise BadRequest(f"at most {max_portfolios} portfolios per request")
+    return dict(options, dates=dates[complete], assets=assets, returns=values[complete], weights=weights)
+
+def _backtest_payload(inputs, report, params):
+    # JSON body of a backtest from its inputs and the backtest.run() report.
+    dates = inputs["dates"]
+    first_last = _date_labels(dates[[0, -1]], inputs["bars"]) if len(dates) else None
+    payload = {
+        "window": _window_json(inputs["window"], inputs["bars"]),
+        "assets": inputs["assets"],
+        "dates": {"start": first_last[0], "end": first_last[1], "count": len(dates)} if len(dates) else None,
+        "investments": inputs["investments"],
+        "portfolios": len(inputs["weights"]),
+        "results": {},
+    }
+    for schedule, stats in report.items():
+        entry = {metric: stats[metric].tolist() for metric in backtest.METRICS}
+        entry["final_values"] = stats["final_values"].tolist()
+        entry["best_sharpe"] = int(np.nanargmax(stats["sharpe_ratio"])) if np.isfinite(stats["sharpe_ratio"]).any() else None
+        if inputs["curves"]:
+            entry["equity"] = stats["equity"].T.tolist()
+        payload["results"][schedule] = entry
+    if inputs["random"] > 0 and params.get("weights") is None:
+        payload["weights"] = inputs["weights"].tolist()
+    return payload
+
+@routes.route("/api/backtest", methods=["GET", "POST"])
+def api_backtest():
+    """
+    Backtests many portfolios over the test window (or ?start=&end=) in one vectorized pass.
+    Parameters (JSON body or query string): tickers, weights (a list of weight vectors in
+    the order of `tickers`, or one {asset: weight} mapping per portfolio) or portfolios
+    (number of random portfolios, with seed and long_only), rebalance (schedule names
+    or periods in days), investments, and curves (include equity curves).
+    """
+    params = _backtest_request()
+    inputs = _backtest_inputs(params, int(os.getenv("BACKTEST_MAX_PORTFOLIOS", "50000")))
+    with instrumentation.stage("backtest"):
+        report = backtest.run(inputs["returns"], inputs["weights"], inputs["schedules"],
+                              inputs["investments"], curves=inputs["curves"])
+    return jsonify(httpcache.json_safe(_backtest_payload(inputs, report, params))), 200
+
+def _projection_options(params, max_paths=None):
+    # Validated projection parameters that need no data: tickers, weights, investment,
+    # training window, bars, covariance estimator and the simulation settings.
+    names = _requested_tickers(params)
+    settings = projection_settings()
+    try:
+        for key in ("paths", "horizon"):
+            if params.get(key) not in (None, ""):
+                settings[key] = int(params[key])
+        if params.get("seed") not in (None, ""):
+            settings["seed"] = int(params["seed"])
+        settings["method"] = params.get("method") or settings["method"]
+        settings["rebalance"] = params.get("rebalance") or settings["rebalance"]
+        investment = float(params.get("investment", 1000))
+    except (TypeError, ValueError) as e:
+        raise BadRequest(str(e))
+    if settings["method"] not in montecarlo.METHODS:
+        raise BadRequest(f"unknown method '{settings['method']}' (one of {', '.join(montecarlo.METHODS)})")
+    if settings["rebalance"] not in ("none", "daily"):
+        raise BadRequest("rebalance must be none or daily")
+    if settings["horizon"] < 1 or settings["paths"] < 1:
+        raise BadRequest("horizon and paths must be positive")
+    max_paths = max_paths or int(os.getenv("MONTE_CARLO_MAX_PATHS", "100000"))
+    if settings["paths"] > max_paths:
+        raise BadRequest(f"at most {max_paths} paths per request")
+    weights = params.get("weights")
+    if weights is not None and not isinstance(weights, (dict, list)):
+        raise BadRequest("weights must be a list in the order of tickers or an {asset: weight} object")
+    return {"names": names, "weights": weights, "investment": investment, "window": _requested_window(params),
+            "bars": _requested_bars(params), "estimator": params.get("estimator") or optimizer_settings()["estimator"],
+            "settings": settings}
+
+def _projection_inputs(params, max_paths=None):
+    # _projection_options() plus the training frames of the portfolio's assets and their
+    # weights ({asset: weight}; equal weights by default).
+    options = _projection_options(params, max_paths)
+    names = options["names"]
+    stocks_train, benches_train, _, version, _ = current_data(names=names, window=options["window"], **options["bars"])
+    frames = _select_assets(_frames_by_asset(stocks_train, benches_train) if names else _frames_by_asset(stocks_train),
+                            names)
+    if not frames:
+        raise BadRequest("no training data for the requested assets")
+    assets = list(frames)
+    weights = options["weights"]
+    try:
+        if isinstance(weights, dict):
+            weights = {asset: float(weights.get(asset, 0.0)) for asset in assets}
+        elif weights is not None:
+            if len(weights) != len(assets):
+                raise ValueError
+            weights = dict(zip(assets, map(float, weights)))
+        else:
+            weights = dict.fromkeys(assets, 1.0 / len(assets))
+    except (TypeError, ValueError):
+        raise BadRequest(f"weights must give one weight per asset ({', '.join(assets)})")
+    return dict(options, frames=frames, assets=assets, weights=weights, version=version)
+
+def _projection_payload(inputs, projection):
+    return {"window": _window_json(inputs["window"], inputs["bars"]), "assets": inputs["assets"],
+            "weights": inputs["weights"], "investment": inputs["investment"], "settings": inputs["settings"],
+            "estimator": inputs["estimator"], "projection": projection}
+
+@routes.route("/api/projection", methods=["GET", "POST"])
+def api_projection():
+    """
+    Monte Carlo projection of an investment in a portfolio over the next `horizon`
+    trading days. Parameters (JSON body or query string): tickers (default the stocks),
+    weights (in the order of `tickers`, or an {asset: weight} mapping; default equal),
+    investment, horizon, paths, method (bootstrap or normal), seed, rebalance (none or
+    daily), estimator and the training window (start, end).
+    """
+    params = _backtest_request()
+    inputs = _projection_inputs(params)
+    try:
+        projection = project_portfolio(inputs["frames"], inputs["weights"], inputs["investment"],
+                                       inputs["settings"], inputs["estimator"])
+    except ValueError as e:
+        raise BadRequest(str(e))
+    return jsonify(httpcache.json_safe(_projection_payload(inputs, projection))), 200
+
+@routes.route("/api/rolling-correlation")
+def api_rolling_correlation():
+    # Rolling correlation of training returns over ?days= (default 60): the matrix on the last
+    # date (or ?date=YYYY-MM-DD), or with ?pair=A,B that pair's correlation over time.
+    # Also accepts ?group=stocks|all (default all), ?tickers=, ?start=, ?end=, ?interval= and
+    # ?resample=; with intraday bars, days counts bars.
+    group = request.args.get("group", "all")
+    names = _requested_tickers()
+    window = _requested_window()
+    bars_args = _requested_bars()
+    days = _float_arg("days", 60)
+    if days != int(days) or not 2 <= days <= 1000:
+        raise BadRequest("days must be a whole number between 2 and 1000")
+    days = int(days)
+    pair = [name.strip() for name in request.args.get("pair", "").split(",") if name.strip()]
+    if pair and len(pair) != 2:
+        raise BadRequest("pair must name two assets")
+    if group not in ("stocks", "all"):
+        return jsonify({"error": f"unknown group '{group}'"}), 400
+    date = request.args.get("date")
+    stocks_train, benches_train, _, version, modified_at = current_data(names=names or pair or None, window=window,
+                                                                        **bars_args)
+    frames = _frames_by_asset(stocks_train) if group == "stocks" else _frames_by_asset(stocks_train, benches_train)
+    frames = _select_assets(frames, pair or names)
+
+    def build():
+        if pair:
+            missing = [name for name in pair if name not in frames]
+            if missing:
+                raise BadRequest(f"no data for {', '.join(missing)}")
+            pair_returns = returns_panel(frames).select(pair)
+            # The dates on which either asset has a bar.
+            rows = pair_returns.mask.any(axis=1)
+            dates, values = pair_returns.dates[rows], pair_returns.returns[rows]
+            series = rolling.pair_series(values[:, 0], values[:, 1], days, min_periods=max(2, days // 2))
+            return {"window": _window_json(window, bars_args), "days": days, "pair": pair,
+                    "dates": _date_labels(dates, bars_args), "correlation": series.tolist()}
+        if not frames:
+            return {"window": _window_json(window, bars_args), "days": days, "date": None, "assets": [], "matrix": []}
+        if date:
+            try:
+                day_after = pd.Timestamp(date).normalize() + pd.Timedelta(days=1)
+            except ValueError:
+                raise BadRequest("date must be YYYY-MM-DD")
+            history = returns_panel(frames).between(end=day_after)
+            if not len(history):
+                raise BadRequest(f"no data on or before {date}")
+            assets = history.names
+            matrix = rolling.window_correlation(history.returns[-days:], min_periods=max(2, days // 2))
+            as_of = history.dates[-1]
+        else:
+            engine = rolling_correlation_engine(frames, days, window,
+                                                bars.resolution(bars_args["interval"], bars_args["resample"]))
+            assets, matrix, as_of = engine.names, engine.matrix(), engine.last_date
+        return {"window": _window_json(window, bars_args), "days": days,
+                "date": _date_labels(pd.DatetimeIndex([as_of]), bars_args)[0], "assets": assets, "matrix": matrix.tolist()}
+    return httpcache.conditional_json(version, [group, names, window, bars_args, days, pair, date], build, modified_at)
+
+def _ingest_options(params):
+    # Ingest job parameters: the assets (tickers, default the universe), the windows
+    # (default all configured windows), the bar interval (default 1d) and whether to
+    # re-fetch stored data (refresh).
+    names = _requested_tickers(params)
+    windows = params.get("windows") or list(UNIVERSE.windows)
+    if isinstance(windows, str):
+        windows = [window.strip() for window in windows.split(",") if window.strip()]
+    unknown = [window for window in windows if window not in WINDOWS]
+    if unknown:
+        raise BadRequest(f"unknown windows: {', '.join(map(str, unknown))}")
+    refresh = str(params.get("refresh", "true")).lower() in ("1", "true", "yes", "on")
+    interval = params.get("interval") or bars.DAILY
+    try:
+        bars.validate(interval)
+    except ValueError as e:
+        raise BadRequest(str(e))
+    return specs_for(names) if names else all_specs(), windows, interval, refresh
+
+def ingest_job(params, context):
+    """Loads (or with refresh, re-fetches) the requested assets and windows in batches."""
+    specs, windows, interval, refresh = _ingest_options(params)
+    batches = [(window, offset) for window in windows for offset in range(0, len(specs), BATCH_SIZE)]
+    loaded = {window: set() for window in windows}
+    for step, (window, offset) in enumerate(batches, start=1):
+        batch = specs[offset:offset + BATCH_SIZE]
+        loaded[window].update(load_assets(batch, window, interval=interval, refresh=refresh))
+        context.progress(step / len(batches), f"{window}: {min(offset + BATCH_SIZE, len(specs))}/{len(specs)} assets")
+    # Workers rebuild their snapshots from the database, and reused job results expire.
+    scheduler.write_marker(time.time())
+    return {"windows": {window: {"loaded": len(names), "missing": [name for _, name, _ in specs if name not in names]}
+                        for window, names in loaded.items()}}
+
+def backtest_job(params, context):
+    """/api/backtest as a job: portfolios are backtested in slices on the job process pool."""
+    inputs = _backtest_inputs(params, int(os.getenv("JOB_BACKTEST_MAX_PORTFOLIOS", "200000")))
+    weights = inputs["weights"]
+    size = int(os.getenv("JOB_BACKTEST_SLICE", "5000"))
+    slices = [(inputs["returns"], weights[offset:offset + size], inputs["schedules"], inputs["investments"],
+               2048, inputs["curves"]) for offset in range(0, len(weights), size)]
+    with instrumentation.stage("backtest"):
+        report = backtest.merge(context.map_cpu(backtest.run, slices, "backtesting portfolios"))
+    return _backtest_payload(inputs, report, params)
+
+def _projection_job_options(params):
+    # Projection jobs accept up to JOB_MONTE_CARLO_MAX_PATHS paths.
+    return _projection_options(params, int(os.getenv("JOB_MONTE_CARLO_MAX_PATHS", "1000000")))
+
+def projection_job(params, context):
+    """/api/projection as a job: chunks of paths are simulated on the job process pool."""
+    inputs = _projection_inputs(params, int(os.getenv("JOB_MONTE_CARLO_MAX_PATHS", "1000000")))
+    settings, weights = inputs["settings"], inputs["weights"]
+    try:
+        model = projection_model(inputs["frames"], settings["method"], inputs["estimator"])
+    except ValueError as e:
+        raise BadRequest(str(e))
+    vector = np.array(list(weights.values()), dtype=np.float64)
+    chunks = montecarlo.chunks(model, vector, settings["horizon"], settings["paths"], settings["seed"],
+                               settings["rebalance"] == "daily")
+    with instrumentation.stage("portfolio"):
+        # Each chunk's histograms are folded in as it arrives, so memory does not grow with paths.
+        parts = context.imap_cpu(montecarlo.run_chunk, chunks, "simulating paths")
+        projection = montecarlo.scale(montecarlo.merge(parts, settings["horizon"]), inputs["investment"])
+    return httpcache.json_safe(_projection_payload(inputs, projection))
+
+def optimize_job(params, context):
+    """/api/optimize as a job: the optimization runs on the job process pool."""
+    group, names, window, bars_args, settings = _optimize_options(params)
+    frames = _optimize_frames(group, names, window, bars_args)[0]
+    context.progress(0.5, "estimating covariance")
+    portfolio = None
+    inputs = covariance_inputs(frames, settings["estimator"]) if frames else None
+    if inputs is not None and inputs[1] is not None:
+        _, mu, cov, _, _ = inputs
+        with instrumentation.stage("portfolio"):
+            weights = context.run_cpu(optimizer.optimize, settings["method"], mu, cov,
+                                      settings["long_only"], settings["max_weight"])
+        portfolio = _optimized_summary(inputs, weights)
+    return {"window": _window_json(window, bars_args), "settings": settings, "portfolio": portfolio}
+
+def _job_data_version(names, window, bars_args):
+    """
+    Version of the data a job will read, for deduplicating submissions: the refresh marker
+    and the catalog statistics (rows, first and last date, close checksum) of the window's
+    tables for the job's assets. Nothing is loaded or fetched, so a submission returns at
+    once; the job itself loads the data.
+    """
+    interval = bars_args.get("interval") or bars.DAILY
+    if prices.normalized_enabled() and interval == bars.DAILY:
+        stats = catalog.table_catalog.stats([prices.PRICES_TABLE], date_column="date", value_column="close")
+    else:
+        specs = specs_for(names) if names else all_specs()
+        stats = catalog.table_catalog.stats([table_name(kind, window, name, interval) for kind, name, _ in specs])
+    payload = json.dumps([scheduler.read_marker(), sorted(stats.items())], default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+# Job kind -> (handler, validation run on submission, whether results of identical jobs are
+# reused, data version of the validated options, see _job_data_version). Identical jobs are
+# deduplicated while the data they read is unchanged; ingest jobs rewrite the data and are
+# only deduplicated while pending.
+JOB_KINDS = {
+    "ingest": (ingest_job, _ingest_options, False, lambda options: None),
+    "backtest": (backtest_job, _backtest_options, True,
+                 lambda options: _job_data_version(options["names"], options["window"], options["bars"])),
+    "optimize": (optimize_job, _optimize_options, True,
+                 lambda options: _job_data_version(options[1], options[2], options[3])),
+    "projection": (projection_job, _projection_job_options, True,
+                   lambda options: _job_data_version(options["names"], options["window"], options["bars"])),
+}
+for _kind, (_handler, _, _reuse, _) in JOB_KINDS.items():
+    jobs.manager.register(_kind, _handler, reuse_results=_reuse)
+
+def _job_json(job):
+    return dict(job, url=f"/api/jobs/{job['id']}", result_url=f"/api/jobs/{job['id']}/result")
+
+@routes.route("/api/jobs", methods=["POST"])
+def api_submit_job():
+    """
+    Submits a job: {"kind": "ingest" | "backtest" | "optimize" | "projection", "params": {...},
+    "force": false}. Parameters are those of the matching API endpoint. Returns the job (202
+    while it is pending); an identical earlier job on the same data is returned instead
+    unless force is true.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or body.get("kind") not in JOB_KINDS:
+        raise BadRequest("request body must be a JSON object with kind one of " + ", ".join(JOB_KINDS))
+    params = body.get("params") or {}
+    if not isinstance(params, dict):
+        raise BadRequest("params must be a JSON object")
+    _, validate, _, data_version = JOB_KINDS[body["kind"]]
+    version = data_version(validate(params))
+    job, _ = jobs.manager.submit(body["kind"], params, version=version,
+                                 force=str(body.get("force", "false")).lower() in ("1", "true", "yes", "on"))
+    response = jsonify(_job_json(job))
+    response.status_code = 202 if job["status"] in jobs.PENDING else 200
+    response.headers["Location"] = f"/api/jobs/{job['id']}"
+    return response
+
+@routes.route("/api/jobs/<job_id>")
+def api_job(job_id):
+    # Status and progress of a job.
+    job = jobs.manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(_job_json(job)), 200
+
+@routes.route("/api/jobs/<job_id>/result")
+def api_job_result(job_id):
+    # Result of a finished job; 202 with the status while it is pending, 500 if it failed.
+    job, result = jobs.manager.result(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    if job["status"] in jobs.PENDING:
+        return jsonify(_job_json(job)), 202
+    if job["status"] == jobs.FAILED:
+        return jsonify(dict(_job_json(job), error=job["error"])), 500
+    return jsonify(result), 200
+
+@routes.route("/testtimeout")
 def testtimeout():
     # This endpoint simulates a long-running request.
     # It simply waits for 310 seconds, which is longer than the configured Gunicorn timeout,
@@ -306,9 +1703,18 @@ def testtimeout():
     time.sleep(310)
     return jsonify({"status": "Completed after delay"}), 200
 
-@app.route("/", methods=["GET", "POST"])
+def _page_projection(frames, weights, investment):
+    # The projection shown on the page, or None without a portfolio or enough history.
+    if not weights:
+        return None
+    try:
+        return project_portfolio(frames, weights, investment)
+    except ValueError as e:
+        logging.warning(f"No Monte Carlo projection for the portfolio: {e}")
+        return None
+
+@routes.route("/", methods=["GET", "POST"])
 def index():
-    print("Hello World!!!!")
     results = {}
     correlation_html = ""
     combined_correlation_html = ""
@@ -318,18 +1724,30 @@ def index():
     portfolio_composition = {}
     optimized_portfolio = {}
     optimized_composition = {}
+    optimized_risk = {}
+    equal_projection = None
+    optimized_projection = None
     group_metrics = {}
     
+    # Serve the last good background snapshot when the refresher is enabled; otherwise load inline.
+    snapshot = background_snapshot() if scheduler.enabled() else None
+    data_status = refresher.status() if snapshot is not None else None
+
     # Retrieve group-level training data for Stocks and Benchmarks
-    stocks_train_data = get_training_data()
-    #print("Stocks training data:", stocks_train_data)
-    benches_train_data = get_benchmark_training_data()
+    if snapshot is not None:
+        stocks_train_data = snapshot.data["stocks_train"]
+        benches_train_data = snapshot.data["benches_train"]
+    else:
+        stocks_train_data = get_training_data()
+        benches_train_data = get_benchmark_training_data()
     _, stocks_group_avg = compute_group_metrics(stocks_train_data)
     _, benches_group_avg = compute_group_metrics(benches_train_data)
     group_metrics = {
         "Stocks": stocks_group_avg,
         "Benchmarks": benches_group_avg
     }
+    # Risk metrics of every asset (the table shows the first HTML_MAX_ASSETS) and per group
+    risk_metrics, risk_groups = training_risk(stocks_train_data, benches_train_data)
     
     # Build individual correlation matrix (stocks only)
     correlation_html = build_correlation_html(stocks_train_data)
@@ -343,7 +1761,7 @@ def index():
             investment = 0
         
         # --- Test Data for Individual Predictions ---
-        asset_results, test_data_store = get_test_data(investment)
+        asset_results, test_data_store = get_test_data(investment, snapshot.data["test"] if snapshot is not None else None)
         results = asset_results
         
         # --- Equal-Weighted Portfolio Calculation & Additional Metrics ---
@@ -357,17 +1775,77 @@ def index():
             "Portfolio_Cumulative_Return": optimized_cum_ret,
             "Portfolio_Predicted_Value": optimized_predicted_value
         }
+        optimized_weights = {asset: alloc / 100.0 for asset, alloc in optimized_composition.items()}
+        optimized_risk = portfolio_risk(test_data_store, optimized_weights, test_data_store.get(market_name()))
+
+        # --- Monte Carlo projections of both portfolios from the training returns ---
+        train_frames = _frames_by_asset(stocks_train_data, benches_train_data)
+        if portfolio_assets:
+            equal_projection = _page_projection(train_frames, dict.fromkeys(portfolio_assets, 1.0 / len(portfolio_assets)),
+                                                investment)
+        optimized_projection = _page_projection(train_frames, optimized_weights, investment)
     
-    return render_template("index.html", results=results, correlation_html=correlation_html,
-                           combined_correlation_html=combined_correlation_html,
-                           portfolio=portfolio_result, metrics=portfolio_metrics,
-                           portfolio_assets=portfolio_assets, portfolio_composition=portfolio_composition,
-                           optimized_portfolio=optimized_portfolio, optimized_composition=optimized_composition,
-                           group_metrics=group_metrics)
+    with instrumentation.stage("render"):
+        return render_template("index.html", results=results, correlation_html=correlation_html,
+                               combined_correlation_html=combined_correlation_html,
+                               portfolio=portfolio_result, metrics=portfolio_metrics,
+                               portfolio_assets=portfolio_assets, portfolio_composition=portfolio_composition,
+                               optimized_portfolio=optimized_portfolio, optimized_composition=optimized_composition,
+                               group_metrics=group_metrics, data_status=data_status,
+                               optimizer_method=optimizer_settings()["method"], optimized_risk=optimized_risk,
+                               risk_metrics=dict(list(risk_metrics.items())[:HTML_MAX_ASSETS]),
+                               risk_total=len(risk_metrics), risk_groups=risk_groups,
+                               risk_level=risk_level(), market_name=market_name(),
+                               equal_projection=equal_projection, optimized_projection=optimized_projection,
+                               projection_settings=projection_settings())
+
+def create_app(preload=None):
+    """
+    Application factory, used by gunicorn ("app:create_app()") and for local runs.
+    Loads .env, sets up logging, re-reads the settings (see configure) and returns a new
+    Flask app with the routes registered.
+    `preload` (default: APP_PRELOAD) does work up front that requests would otherwise
+    do on first use: "imports" imports the data source's modules (yfinance is otherwise
+    imported on the first fetch), "data" also loads the training data and precomputes
+    the analytics. Under gunicorn --preload this runs once in the master process, and
+    the workers start with the modules, frames and analytics already in memory.
+    With BACKGROUND_REFRESH=1 the refresher starts here, so its first snapshot is being
+    built before traffic arrives ("data" builds it before returning); forked workers
+    restart the thread and keep an inherited snapshot.
+    """
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    preload = (preload if preload is not None else os.getenv("APP_PRELOAD", "")).strip().lower()
+    if preload not in ("", "none", "imports", "data"):
+        raise ValueError(f"Unknown APP_PRELOAD '{preload}' (none, imports or data)")
+    configure()
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(routes)
+    if preload in ("imports", "data"):
+        with startup.startup_report.phase("preload_imports"):
+            datasource.get_data_source().preload()
+    if preload == "data":
+        with startup.startup_report.phase("preload_data"):
+            if scheduler.enabled():
+                refresher.run_once()
+            else:
+                precompute_analytics()
+    if scheduler.enabled():
+        refresher.start()
+    startup.startup_report.mark_ready()
+    return flask_app
+
+# An app with the routes for tools that import one ("from app import app", flask run) and
+# for tests; it is built without create_app()'s setup.
+app = Flask(__name__)
+app.register_blueprint(routes)
 
 if __name__ == "__main__":
+    load_dotenv()
     test_db_connection()
+    flask_app = create_app(preload="data")
     # Only run app.run() if in a local development environment
     # For production, Gunicorn will load the app directly
     if not os.getenv("PORT"):  # If PORT is not set, assume local development
-        app.run(host="0.0.0.0", port=8080, debug=True)
\ No newline at end of file
+        flask_app.run(host="0.0.0.0", port=8080, debug=True)
@@ -1,29 +1,32 @@
-import yfinance as yf
-import pandas as pd
+import logging
+import fetcher
+import datasource
+import processing
+
+def _history(ticker, start=None, end=None, period='3y', interval='1d'):
+    # Raises on failure; used directly by the batch fetcher so it can retry.
+    source = datasource.get_data_source()
+    if start and end:
+        return source.history(ticker, start=start, end=end, interval=interval)
+    return source.history(ticker, period=period, interval=interval)
 
 def fetch_asset_data(ticker, start=None, end=None, period='3y', interval='1d'):
     try:
-        asset = yf.Ticker(ticker)
-        if start and end:
-            df = asset.history(start=start, end=end)
-        else:
-            df = asset.history(period=period, interval=interval)
-        return df
+        return _history(ticker, start=start, end=end, period=period, interval=interval)
     except Exception as e:
-        print(f"Error fetching data for {ticker}: {e}")
+        logging.error(f"Error fetching data for {ticker}: {e}")
         return None
 
-def calculate_daily_returns(df):
-    df = df.copy()
-    df['Daily_Return'] = df['Close'].pct_change()
-    return df
+def fetch_assets_batch(tickers, windows, interval='1d', fetch=None, **options):
+    """
+    Fetches several benchmark assets over several date windows concurrently (see
+    fetcher.fetch_windows); `fetch` defaults to the data source's history call.
+    """
+    return fetcher.fetch_windows(fetch or _history, tickers, windows, interval=interval, **options)
 
-def clean_missing_data(df):
-    return df.dropna(subset=['Daily_Return'])
+# Processing is shared with stocks.py; see processing.py.
+calculate_daily_returns = processing.calculate_daily_returns
+clean_missing_data = processing.clean_missing_data
 
-def process_asset_data(df):
-    df = calculate_daily_returns(df)
-    df = clean_missing_data(df)
-    df['Cumulative_Return'] = (1 + df['Daily_Return']).cumprod() - 1
-    df['Predicted_Direction'] = df['Daily_Return'].apply(lambda x: 'Increase' if x > 0 else 'Decrease')
-    return df
\ No newline at end of file
+def process_asset_data(df, dtype=None):
+    return processing.process_price_data(df, dtype=dtype)
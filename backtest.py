@@ -0,0 +1,125 @@
+"""
+Vectorized backtesting of many portfolios at once.
+
+A backtest runs a weight matrix (portfolios x assets) over an aligned return matrix
+(dates x assets). Between rebalancing dates each portfolio is buy-and-hold, so with
+G the per-asset growth since the last rebalance, a portfolio's value relative to that
+rebalance is cash + G @ w; the values at the end of each period are chained. One
+matrix product therefore covers every portfolio, and buy-and-hold (one period) and
+daily rebalancing (one-day periods) are the two extremes of the same formula.
+Weights summing to less than one keep the remainder in cash.
+"""
+import numpy as np
+
+# Rebalancing schedule name -> period in trading days (None: buy and hold).
+SCHEDULES = {"none": None, "daily": 1, "weekly": 5, "monthly": 21, "quarterly": 63}
+
+METRICS = ("cumulative_return", "average_daily_return", "volatility", "sharpe_ratio", "max_drawdown")
+
+
+def rebalance_period(schedule):
+    """Period in days for a schedule name or a positive number of days (None for buy and hold)."""
+    if isinstance(schedule, str) and schedule in SCHEDULES:
+        return SCHEDULES[schedule]
+    try:
+        period = int(schedule)
+    except (TypeError, ValueError):
+        raise ValueError(f"Unknown rebalancing schedule '{schedule}'")
+    if period < 1:
+        raise ValueError("Rebalancing period must be at least one day")
+    return period
+
+
+def equity_curves(returns, weights, period=None):
+    """
+    Portfolio values (starting from 1) after each date, as a dates x portfolios array.
+    `returns` is dates x assets without missing values, `weights` portfolios x assets.
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    days = len(returns)
+    period = days if period is None else max(1, min(int(period), days))
+    cash = 1.0 - weights.sum(axis=1)
+
+    growth = np.cumprod(1.0 + returns, axis=0)
+    starts = np.arange(0, days, period)
+    # Per-asset growth since the start of each rebalancing period.
+    base = np.vstack((np.ones((1, returns.shape[1])), growth[starts[1:] - 1]))
+    block = np.arange(days) // period
+    relative = growth / base[block]
+    values = relative @ weights.T + cash
+
+    ends = np.minimum(starts + period, days) - 1
+    carried = np.cumprod(np.vstack((np.ones((1, len(weights))), values[ends[:-1]])), axis=0)
+    return values * carried[block]
+
+
+def summarize(equity):
+    """Cumulative return, average daily return, volatility, Sharpe ratio and maximum drawdown per portfolio."""
+    previous = np.vstack((np.ones((1, equity.shape[1])), equity[:-1]))
+    daily = equity / previous - 1.0
+    mean = daily.mean(axis=0)
+    std = daily.std(axis=0, ddof=1) if len(daily) > 1 else np.full(equity.shape[1], np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe = np.where(std > 0, mean / std, np.nan)
+    peaks = np.maximum.accumulate(np.vstack((np.ones((1, equity.shape[1])), equity)), axis=0)[1:]
+    return {
+        "cumulative_return": equity[-1] - 1.0,
+        "average_daily_return": mean,
+        "volatility": std,
+        "sharpe_ratio": sharpe,
+        "max_drawdown": (equity / peaks - 1.0).min(axis=0),
+    }
+
+
+def run(returns, weights, schedules=("none",), investments=(1000.0,), chunk_size=2048, curves=False):
+    """
+    Backtests every portfolio under every schedule. Portfolios are processed in chunks
+    of `chunk_size`, which bounds the size of the dates x portfolios intermediates.
+    Returns {schedule: {metric: array over portfolios, "final_values": portfolios x
+    investments array, and "equity" (dates x portfolios) when curves=True}}.
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    investments = np.asarray(investments, dtype=np.float64)
+    if len(returns) == 0:
+        raise ValueError("returns must cover at least one date")
+    report = {}
+    for schedule in schedules:
+        period = rebalance_period(schedule)
+        parts = []
+        for offset in range(0, len(weights), chunk_size):
+            equity = equity_curves(returns, weights[offset:offset + chunk_size], period)
+            stats = summarize(equity)
+            if curves:
+                stats["equity"] = equity
+            parts.append(stats)
+        merged = _concatenate(parts)
+        merged["final_values"] = np.outer(1.0 + merged["cumulative_return"], investments)
+        report[str(schedule)] = merged
+    return report
+
+
+def _concatenate(parts):
+    # Per-portfolio arrays are concatenated along their last (portfolio) axis.
+    return {key: np.concatenate([part[key] for part in parts], axis=-1) for key in parts[0]}
+
+
+def merge(reports):
+    """Combines the reports of run() over consecutive slices of the portfolios into one report."""
+    merged = {}
+    for schedule in reports[0]:
+        parts = [report[schedule] for report in reports]
+        final_values = np.concatenate([part["final_values"] for part in parts], axis=0)
+        merged[schedule] = _concatenate([{k: v for k, v in part.items() if k != "final_values"} for part in parts])
+        merged[schedule]["final_values"] = final_values
+    return merged
+
+
+def random_weights(n_portfolios, n_assets, seed=None, long_only=True):
+    """Random fully-invested portfolios: uniform on the simplex, or normalized Gaussian weights when shorting."""
+    rng = np.random.default_rng(seed)
+    if long_only:
+        return rng.dirichlet(np.ones(n_assets), size=n_portfolios)
+    raw = rng.normal(size=(n_portfolios, n_assets))
+    raw += (1.0 - raw.sum(axis=1, keepdims=True)) / n_assets
+    return raw
@@ -0,0 +1,148 @@
+"""
+Bar intervals and OHLCV resampling.
+
+Prices can be fetched and stored at any yfinance interval from one-minute bars up to
+monthly bars; every interval gets its own tables. Analytics can run on the stored bars
+or on coarser bars aggregated from them on the fly (first Open, highest High, lowest
+Low, last Close and total Volume per bucket). Buckets are found with one vectorized
+pass over the timestamps and reduced with NumPy's reduceat, and stored tables are
+resampled chunk by chunk, so the raw minute bars of a table are never in memory at once.
+
+Timestamps are bucketed in UTC, which keeps a US trading session within one day.
+"""
+import os
+import numpy as np
+import pandas as pd
+import database
+import panel
+
+# Interval -> nominal bar length (used to order intervals) and how timestamps are bucketed:
+# a fixed frequency for Timestamp.floor, or a calendar period.
+INTERVALS = {
+    "1m": (pd.Timedelta(minutes=1), "1min"),
+    "2m": (pd.Timedelta(minutes=2), "2min"),
+    "5m": (pd.Timedelta(minutes=5), "5min"),
+    "15m": (pd.Timedelta(minutes=15), "15min"),
+    "30m": (pd.Timedelta(minutes=30), "30min"),
+    "60m": (pd.Timedelta(hours=1), "60min"),
+    "90m": (pd.Timedelta(minutes=90), "90min"),
+    "1h": (pd.Timedelta(hours=1), "60min"),
+    "1d": (pd.Timedelta(days=1), "1D"),
+    "1wk": (pd.Timedelta(days=7), "period:W"),
+    "1mo": (pd.Timedelta(days=31), "period:M"),
+}
+
+DAILY = "1d"
+
+OHLCV = ("Open", "High", "Low", "Close", "Volume")
+
+
+def is_intraday(interval):
+    return INTERVALS[interval][0] < INTERVALS[DAILY][0]
+
+
+def validate(interval, target=None):
+    """
+    Checks a stored interval and an optional coarser interval to resample it to.
+    Raises ValueError for unknown intervals or a target that is not coarser.
+    """
+    for value in (interval, target):
+        if value is not None and value not in INTERVALS:
+            raise ValueError(f"unknown interval '{value}' (one of {', '.join(INTERVALS)})")
+    if target is not None and INTERVALS[target][0] <= INTERVALS[interval][0]:
+        raise ValueError(f"cannot resample {interval} bars to {target}; choose a coarser interval")
+
+
+def resolution(interval, target=None):
+    """Label of the bars analytics run on: the interval, or e.g. '5m>1h' for resampled bars."""
+    return interval if target is None else f"{interval}>{target}"
+
+
+def storage_dtype(interval):
+    """
+    Float dtype of stored bars: intraday tables are stored in INTRADAY_DTYPE (default
+    float32, half the size of daily tables per row); daily bars use PROCESS_DTYPE.
+    """
+    return np.dtype(os.getenv("INTRADAY_DTYPE", "float32")) if is_intraday(interval) else None
+
+
+def bucket_starts(dates, target):
+    """Start of the target-interval bucket of every (UTC-naive) timestamp."""
+    rule = INTERVALS[target][1]
+    if rule.startswith("period:"):
+        return dates.to_period(rule.split(":", 1)[1]).start_time
+    return dates.floor(rule)
+
+
+def resample_ohlcv(df, target):
+    """
+    Aggregates bars (sorted by time, with a Date column or index) to the target interval:
+    first Open, highest High, lowest Low, last Close and total Volume of every bucket.
+    Buckets without bars are left out, so there are no overnight or weekend rows.
+    Returns a frame of the OHLCV columns present, indexed by the bucket start (Date).
+    """
+    columns = [column for column in OHLCV if column in df.columns]
+    if df.empty:
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name="Date"))
+    dates = panel.frame_dates(df)
+    if not dates.is_monotonic_increasing:
+        order = np.argsort(dates.asi8, kind="stable")
+        df, dates = df.take(order), dates.take(order)
+    labels = bucket_starts(dates, target)
+    starts = np.flatnonzero(np.r_[True, labels.asi8[1:] != labels.asi8[:-1]])
+    ends = np.r_[starts[1:], len(df)] - 1
+    out = {}
+    for column in columns:
+        values = df[column].to_numpy(dtype=np.float64)
+        if column == "Open":
+            out[column] = values[starts]
+        elif column == "High":
+            out[column] = np.maximum.reduceat(values, starts)
+        elif column == "Low":
+            out[column] = np.minimum.reduceat(values, starts)
+        elif column == "Close":
+            out[column] = values[ends]
+        else:
+            out[column] = np.add.reduceat(np.nan_to_num(values), starts)
+    return pd.DataFrame(out, index=pd.DatetimeIndex(labels[starts], name="Date"))
+
+
+def resample_chunks(chunks, target):
+    """
+    resample_ohlcv() over an iterable of consecutive, time-ordered chunks of bars. The
+    bars of the last (possibly incomplete) bucket of a chunk are carried over to the
+    next chunk, so the result equals resampling the concatenated chunks.
+    """
+    parts = []
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index="Date" not in chunk.index.names)
+        if chunk.empty:
+            continue
+        labels = bucket_starts(panel.frame_dates(chunk), target).asi8
+        cut = int(np.searchsorted(labels, labels[-1], side="left"))
+        if cut:
+            parts.append(resample_ohlcv(chunk.iloc[:cut], target))
+        carry = chunk.iloc[cut:]
+    if carry is not None and not carry.empty:
+        parts.append(resample_ohlcv(carry, target))
+    if not parts:
+        return resample_ohlcv(pd.DataFrame(columns=["Date", *OHLCV]), target)
+    return pd.concat(parts)
+
+
+def chunk_rows():
+    """Rows per chunk when resampling stored tables (RESAMPLE_CHUNK_ROWS, default 100000)."""
+    return int(os.getenv("RESAMPLE_CHUNK_ROWS", "100000"))
+
+
+def frame_chunks(df, size=None):
+    """Consecutive row slices of a frame (views, so memory-mapped frames stay unloaded)."""
+    size = size or chunk_rows()
+    return (df.iloc[offset:offset + size] for offset in range(0, len(df), size))
+
+
+def read_resampled(table_name, target, size=None):
+    """Resamples a stored table to the target interval, reading it in chunks of rows."""
+    return resample_chunks(database.read_table_chunks(table_name, size or chunk_rows()), target)
@@ -0,0 +1,279 @@
+"""
+Pipeline benchmark suite.
+
+Generates a synthetic price panel (tickers x days), serves it through the replay data
+source into a temporary SQLite database, and times each pipeline stage as well as the
+full `/` request through the Flask test client. Reports wall time, throughput and peak
+memory, and compares against a saved baseline.
+
+    python benchmark.py --tickers 50 --days 756 --save-baseline bench_baseline.json
+    python benchmark.py --tickers 50 --days 756 --compare bench_baseline.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+PANEL_START = "2021-12-01"
+
+
+def make_price_panel(tickers, days, start=PANEL_START, seed=0):
+    """Synthetic daily OHLCV bars (geometric random walk) for each ticker, in yfinance's shape."""
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(start, periods=days, tz="America/New_York", name="Date")
+    returns = rng.normal(0.0004, 0.015, size=(days, len(tickers)))
+    closes = 100 * np.cumprod(1 + returns, axis=0)
+    panel = {}
+    for i, ticker in enumerate(tickers):
+        close = closes[:, i]
+        panel[ticker] = pd.DataFrame({
+            'Open': close * (1 - 0.002), 'High': close * 1.01, 'Low': close * 0.99, 'Close': close,
+            'Volume': rng.integers(1_000_000, 5_000_000, size=days),
+        }, index=index)
+    return panel
+
+
+def make_intraday_panel(tickers, days, minutes=5, start=PANEL_START, seed=0):
+    """Synthetic intraday OHLCV bars (regular 9:30-16:00 sessions on business days) for each ticker."""
+    rng = np.random.default_rng(seed)
+    sessions = pd.bdate_range(start, periods=days)
+    offsets = pd.timedelta_range("9h30min", "15h59min", freq=f"{minutes}min")
+    index = pd.DatetimeIndex([day + offset for day in sessions for offset in offsets], name="Date")
+    index = index.tz_localize("America/New_York")
+    returns = rng.normal(0.00001, 0.001, size=(len(index), len(tickers)))
+    closes = 100 * np.cumprod(1 + returns, axis=0)
+    panel = {}
+    for i, ticker in enumerate(tickers):
+        close = closes[:, i]
+        panel[ticker] = pd.DataFrame({
+            'Open': close * (1 - 0.0002), 'High': close * 1.001, 'Low': close * 0.999, 'Close': close,
+            'Volume': rng.integers(1_000, 50_000, size=len(index)),
+        }, index=index)
+    return panel
+
+
+def measure(fn, repeat=3, setup=None):
+    """
+    Runs fn `repeat` times untraced for wall times (seconds), then once more under
+    tracemalloc for the peak allocated memory (bytes), so tracing does not skew timings.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return times, peak
+
+
+class BenchmarkEnvironment:
+    """
+    Temporary replay fixtures and SQLite database wired into the app modules. The app's
+    ticker universe is replaced by the synthetic tickers for the duration of the run.
+    """
+
+    def __init__(self, n_tickers, days, n_benchmarks=4, seed=0):
+        self.stock_tickers = [f"S{i:04d}" for i in range(n_tickers)]
+        self.bench_tickers = {f"Bench{i}": f"B{i:03d}" for i in range(n_benchmarks)}
+        self.days = days
+        self.seed = seed
+
+    def __enter__(self):
+        import app
+        import cache
+        import database
+        import datasource
+        import results
+        self.app, self.cache, self.database, self.datasource, self.results = app, cache, database, datasource, results
+        self.tmp = tempfile.TemporaryDirectory()
+        self.replay = datasource.ReplaySource(os.path.join(self.tmp.name, "fixtures"))
+        panel = make_price_panel(self.stock_tickers + list(self.bench_tickers.values()), self.days, seed=self.seed)
+        for ticker, df in panel.items():
+            self.replay.save(ticker, df)
+        self.panel = panel
+
+        self._saved = dict(os.environ)
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(self.tmp.name, 'bench.db')}"
+        # Replayed fixtures need no protection from the fetch rate limit.
+        os.environ["FETCH_RATE_LIMIT"] = "0"
+        # Set through the environment, so the universe also survives app.create_app().
+        os.environ["UNIVERSE_STOCKS"] = ",".join(self.stock_tickers)
+        os.environ["UNIVERSE_BENCHMARKS"] = ",".join(f"{name}={ticker}" for name, ticker in self.bench_tickers.items())
+        database.dispose_engine()
+        datasource.set_data_source(self.replay)
+        app.configure()
+        self.reset_caches()
+        return self
+
+    def __exit__(self, *exc):
+        self.datasource.set_data_source(None)
+        self.database.dispose_engine()
+        os.environ.clear()
+        os.environ.update(self._saved)
+        self.app.configure()
+        self.reset_caches()
+        self.tmp.cleanup()
+
+    def drop_database(self):
+        """Starts over with an empty database and empty caches."""
+        self.database.dispose_engine()
+        path = os.path.join(self.tmp.name, 'bench.db')
+        if os.path.exists(path):
+            os.remove(path)
+        self.reset_caches()
+
+    def reset_caches(self):
+        self.cache.frame_cache.clear()
+        self.results.result_store.clear()
+        self.app.httpcache.body_cache.clear()
+
+    def rows(self, window):
+        start, end = self.app.WINDOWS[window]
+        index = next(iter(self.panel.values())).index
+        days = int(((index >= pd.Timestamp(start, tz=index.tz)) & (index < pd.Timestamp(end, tz=index.tz))).sum())
+        return days * (len(self.stock_tickers) + len(self.bench_tickers))
+
+
+def run_benchmarks(n_tickers=10, days=756, repeat=3):
+    """Runs every stage and returns {stage: {seconds, min_seconds, throughput, peak_mb, ...}}."""
+    report = {}
+
+    def record(name, times, peak, items=None, unit="rows"):
+        median = statistics.median(times)
+        entry = {"seconds": round(median, 6), "min_seconds": round(min(times), 6),
+                 "peak_mb": round(peak / 1e6, 3)}
+        if items:
+            entry["throughput"] = round(items / median, 1) if median else None
+            entry["unit"] = f"{unit}/s"
+        report[name] = entry
+
+    with BenchmarkEnvironment(n_tickers, days) as env:
+        app = env.app
+        train_rows = env.rows("train")
+
+        # Cold: every table is missing, so data is fetched (replayed), processed and stored.
+        times, peak = measure(lambda: (app.get_training_data(), app.get_benchmark_training_data()),
+                              repeat=repeat, setup=env.drop_database)
+        record("get_training_data (cold, fetch+store)", times, peak, train_rows)
+
+        # Warm database, cold cache: one read per table.
+        times, peak = measure(lambda: (app.get_training_data(), app.get_benchmark_training_data()),
+                              repeat=repeat, setup=env.reset_caches)
+        record("get_training_data (database)", times, peak, train_rows)
+
+        # Warm columnar cache tier, cold frame cache: memory-mapped reads checked against
+        # the database with one version query per batch.
+        os.environ["COLUMNAR_CACHE_DIR"] = os.path.join(env.tmp.name, "columnar")
+        env.reset_caches()
+        app.get_training_data(), app.get_benchmark_training_data()
+        times, peak = measure(lambda: (app.get_training_data(), app.get_benchmark_training_data()),
+                              repeat=repeat, setup=env.reset_caches)
+        record("get_training_data (columnar cache)", times, peak, train_rows)
+        del os.environ["COLUMNAR_CACHE_DIR"]
+
+        # Steady state: served from the frame cache.
+        times, peak = measure(lambda: (app.get_training_data(), app.get_benchmark_training_data()), repeat=repeat)
+        record("get_training_data (cached)", times, peak, train_rows)
+
+        raw = env.panel[env.stock_tickers[0]]
+        times, peak = measure(lambda: [app.stocks.process_stock_data(raw) for _ in range(n_tickers)], repeat=repeat)
+        record("process_stock_data", times, peak, len(raw) * n_tickers)
+
+        stocks_data = app.get_training_data()
+        bench_data = app.get_benchmark_training_data()
+        times, peak = measure(lambda: (app.build_correlation_html(stocks_data),
+                                       app.build_combined_correlation_html(stocks_data, bench_data)),
+                              repeat=repeat, setup=env.results.result_store.clear)
+        record("correlation builders (uncached)", times, peak, train_rows)
+        times, peak = measure(lambda: (app.build_correlation_html(stocks_data),
+                                       app.build_combined_correlation_html(stocks_data, bench_data)), repeat=repeat)
+        record("correlation builders (memoized)", times, peak, train_rows)
+
+        asset_results, test_store = app.get_test_data(1000.0)
+        times, peak = measure(lambda: app.calculate_portfolio_metrics(test_store, asset_results, 1000.0), repeat=repeat)
+        record("calculate_portfolio_metrics", times, peak, len(test_store), unit="assets")
+
+        import backtest
+        _, _, test_returns = app.panel.returns_matrix(test_store)
+        test_returns = app.panel.complete_rows(test_returns)
+        weights = backtest.random_weights(1000, test_returns.shape[1], seed=0)
+        times, peak = measure(lambda: backtest.run(test_returns, weights, ("none", "daily", "weekly")), repeat=repeat)
+        record("backtest (1000 portfolios x 3 schedules)", times, peak, 3000, unit="backtests")
+
+        client = app.app.test_client()
+        times, peak = measure(lambda: client.get("/"), repeat=repeat, setup=env.reset_caches)
+        record("GET / (cold caches)", times, peak, 1, unit="requests")
+        times, peak = measure(lambda: client.get("/"), repeat=repeat)
+        record("GET / (warm)", times, peak, 1, unit="requests")
+        times, peak = measure(lambda: client.post("/", data={"investment": "1000"}), repeat=repeat)
+        record("POST / (warm)", times, peak, 1, unit="requests")
+
+    return {"parameters": {"tickers": n_tickers, "days": days, "repeat": repeat}, "results": report}
+
+
+def compare(current, baseline, threshold=0.25):
+    """Returns (stage, baseline seconds, current seconds, ratio, regressed) for stages in both runs."""
+    rows = []
+    for stage, entry in current["results"].items():
+        base = baseline.get("results", {}).get(stage)
+        if not base or not base["seconds"]:
+            continue
+        ratio = entry["seconds"] / base["seconds"]
+        rows.append((stage, base["seconds"], entry["seconds"], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def format_report(report):
+    lines = [f"{'stage':45} {'median s':>10} {'min s':>10} {'throughput':>18} {'peak MB':>9}"]
+    for stage, entry in report["results"].items():
+        throughput = f"{entry['throughput']} {entry['unit']}" if entry.get("throughput") else ""
+        lines.append(f"{stage:45} {entry['seconds']:>10.4f} {entry['min_seconds']:>10.4f} "
+                     f"{throughput:>18} {entry['peak_mb']:>9.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the stock data pipeline.")
+    parser.add_argument("--tickers", type=int, default=10)
+    parser.add_argument("--days", type=int, default=756)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--compare", metavar="FILE")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="relative slowdown that counts as a regression (default 0.25)")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.tickers, args.days, args.repeat)
+    print(format_report(report))
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+        regressions = 0
+        for stage, base, current, ratio, regressed in compare(report, baseline, args.threshold):
+            regressions += regressed
+            print(f"{stage:45} {base:>10.4f} -> {current:>10.4f}  x{ratio:.2f}{'  REGRESSION' if regressed else ''}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
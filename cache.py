@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import instrumentation
+
+
+class DataFrameCache:
+    """
+    A small thread-safe in-process cache for processed DataFrames.
+    Entries are keyed by (ticker, window, interval), evicted least-recently-used once
+    max_entries is reached, and optionally expire after ttl seconds. Each entry may be
+    tagged with the database table it was loaded from so that rewriting the table
+    invalidates it.
+
+    Cached DataFrames are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries=64, ttl=None, name="frames"):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        value = self._get(key)
+        instrumentation.cache_lookup(self.name, value is not None)
+        return value
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, table_name, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, table_name=None):
+        with self._lock:
+            self._entries[key] = (value, table_name, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_table(self, table_name):
+        """Drops every entry that was loaded from the given database table."""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[1] == table_name]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits / lookups) if lookups else None,
+            }
+
+
+def _ttl_from_env():
+    value = os.getenv("FRAME_CACHE_TTL")
+    return float(value) if value else None
+
+
+# Process-wide cache of processed training/test DataFrames.
+frame_cache = DataFrameCache(max_entries=int(os.getenv("FRAME_CACHE_SIZE", "64")), ttl=_ttl_from_env())
@@ -0,0 +1,214 @@
+"""
+Cached database catalog: which tables exist, and per table the row count, date coverage
+and a checksum of the close prices.
+
+The table list is loaded once per process (and again after CATALOG_TTL seconds) instead
+of scanning the database catalog for every existence check. Tables created or dropped
+through this process's engine are picked up from the DDL statements themselves; a
+table reported missing triggers one reload (at most every CATALOG_RECHECK seconds) so
+tables written by other workers are found too. Table statistics for any number of
+tables are fetched in one query and cached until the table is written again through this
+process, or for at most CATALOG_STATS_TTL seconds so writes by other workers show up.
+"""
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+import pandas as pd
+from sqlalchemy import event, inspect, text
+import database
+import instrumentation
+
+TableStats = namedtuple("TableStats", "rows first_date last_date checksum")
+
+# Table names of CREATE TABLE / DROP TABLE statements (temporary tables are ignored).
+_DDL = re.compile(r'^\s*(CREATE|DROP)\s+TABLE\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(?:"([^"]+)"|([\w.]+))', re.IGNORECASE)
+
+# Tables summarized per statement; SQLite limits a compound SELECT to 500 terms.
+STATS_CHUNK = 200
+
+
+def _env_seconds(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _timestamp(value):
+    return pd.Timestamp(value) if value is not None else None
+
+
+class TableCatalog:
+    """Per-process cache of the database catalog and of per-table statistics."""
+
+    def __init__(self, ttl=None, recheck=None, stats_ttl=None):
+        self.ttl = ttl
+        self.recheck = recheck
+        self.stats_ttl = stats_ttl
+        self._tables = None
+        self._loaded_at = None
+        self._stats = {}
+        self._stats_at = {}
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _ttl(self):
+        return self.ttl if self.ttl is not None else _env_seconds("CATALOG_TTL", 300.0)
+
+    def _recheck(self):
+        return self.recheck if self.recheck is not None else _env_seconds("CATALOG_RECHECK", 2.0)
+
+    def _stats_ttl(self):
+        return self.stats_ttl if self.stats_ttl is not None else _env_seconds("CATALOG_STATS_TTL", 30.0)
+
+    def _reload(self):
+        with instrumentation.stage("db_check"):
+            names = inspect(database.get_engine()).get_table_names()
+        with self._lock:
+            self._tables = set(names)
+            self._loaded_at = time.monotonic()
+            self._stats = {name: stats for name, stats in self._stats.items() if name in self._tables}
+            self._stats_at = {name: at for name, at in self._stats_at.items() if name in self._stats}
+            self.reloads += 1
+
+    def _current(self):
+        with self._lock:
+            fresh = self._tables is not None and time.monotonic() - self._loaded_at < self._ttl()
+        if not fresh:
+            self._reload()
+
+    def tables(self):
+        """Names of all tables."""
+        self._current()
+        with self._lock:
+            return sorted(self._tables)
+
+    def missing(self, table_names):
+        """The tables (of table_names, in order) that do not exist."""
+        self._current()
+        with self._lock:
+            missing = [name for name in table_names if name not in self._tables]
+            recheck = missing and time.monotonic() - self._loaded_at >= self._recheck()
+        if recheck:
+            # Possibly created by another worker since the catalog was loaded.
+            self._reload()
+            with self._lock:
+                missing = [name for name in table_names if name not in self._tables]
+        return missing
+
+    def exists(self, table_name):
+        return not self.missing([table_name])
+
+    def stats(self, table_names, refresh=False, date_column="Date", value_column="Close"):
+        """
+        {table: TableStats} for the existing tables among table_names. Cached statistics
+        younger than CATALOG_STATS_TTL are reused unless refresh=True; the others are
+        fetched in one query per STATS_CHUNK tables. Tables that cannot be summarized are
+        left out.
+        """
+        missing = set(self.missing(table_names))
+        existing = [name for name in dict.fromkeys(table_names) if name not in missing]
+        with self._lock:
+            oldest = time.monotonic() - self._stats_ttl()
+            found = {} if refresh else {name: self._stats[name] for name in existing
+                                        if name in self._stats and self._stats_at[name] > oldest}
+        to_load = [name for name in existing if name not in found]
+        for offset in range(0, len(to_load), STATS_CHUNK):
+            found.update(self._query_stats(to_load[offset:offset + STATS_CHUNK], date_column, value_column))
+        return found
+
+    def _query_stats(self, table_names, date_column, value_column):
+        engine = database.get_engine()
+        quote = engine.dialect.identifier_preparer.quote
+        parts = [f"SELECT :t{i} AS name, COUNT(*) AS n, MIN({quote(date_column)}) AS first, "
+                 f"MAX({quote(date_column)}) AS last, SUM({quote(value_column)}) AS checksum FROM {quote(table)}"
+                 for i, table in enumerate(table_names)]
+        params = {f"t{i}": table for i, table in enumerate(table_names)}
+        try:
+            with instrumentation.stage("db_check"), engine.connect() as conn:
+                rows = conn.execute(text(" UNION ALL ".join(parts)), params).fetchall()
+        except Exception:
+            # One table without the columns fails the whole statement; summarize one by one.
+            if len(table_names) == 1:
+                return {}
+            found = {}
+            for table in table_names:
+                found.update(self._query_stats([table], date_column, value_column))
+            return found
+        found = {}
+        for name, n, first, last, checksum in rows:
+            try:
+                found[name] = TableStats(n, _timestamp(first), _timestamp(last), float(checksum or 0))
+            except (TypeError, ValueError):
+                # SQLite reads a quoted name of a missing column as a string literal.
+                continue
+        now = time.monotonic()
+        with self._lock:
+            self._stats.update(found)
+            self._stats_at.update(dict.fromkeys(found, now))
+        return found
+
+    def record_write(self, table_name, df=None, date_column="Date", value_column="Close"):
+        """
+        Marks a table as existing after a write. With the full frame written (replacing
+        the table), its statistics are taken from the frame; otherwise they are reloaded
+        on next use.
+        """
+        stats = None
+        if df is not None and value_column in df.columns:
+            dates = df.index if df.index.name == date_column else df.get(date_column)
+            if dates is not None:
+                stats = TableStats(len(df), _timestamp(dates.min()) if len(df) else None,
+                                   _timestamp(dates.max()) if len(df) else None, float(df[value_column].sum()))
+        with self._lock:
+            if self._tables is not None:
+                self._tables.add(table_name)
+            if stats is not None:
+                self._stats[table_name] = stats
+                self._stats_at[table_name] = time.monotonic()
+            else:
+                self._stats.pop(table_name, None)
+                self._stats_at.pop(table_name, None)
+
+    def record_drop(self, table_name):
+        with self._lock:
+            if self._tables is not None:
+                self._tables.discard(table_name)
+            self._stats.pop(table_name, None)
+            self._stats_at.pop(table_name, None)
+
+    def clear(self):
+        with self._lock:
+            self._tables = None
+            self._loaded_at = None
+            self._stats.clear()
+            self._stats_at.clear()
+
+    def status(self):
+        with self._lock:
+            return {
+                "tables": len(self._tables) if self._tables is not None else None,
+                "age": time.monotonic() - self._loaded_at if self._loaded_at is not None else None,
+                "tables_with_stats": len(self._stats),
+                "reloads": self.reloads,
+            }
+
+
+def watch_engine(engine, catalog=None):
+    """Keeps a catalog in step with the CREATE TABLE and DROP TABLE statements run on an engine."""
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        match = _DDL.match(statement)
+        if match:
+            target = catalog or table_catalog
+            action, name = match.group(1).upper(), match.group(2) or match.group(3)
+            if action == "CREATE":
+                target.record_write(name)
+            else:
+                target.record_drop(name)
+
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    return engine
+
+
+# Process-wide catalog of the database behind database.get_engine().
+table_catalog = TableCatalog()
@@ -0,0 +1,189 @@
+"""
+Local columnar cache tier in front of the database.
+
+Stored tables are kept on local disk as NumPy `.npy` column files, loaded with
+memory mapping: loading a table is zero-copy, and all gunicorn workers on a host share
+the same pages through the OS page cache instead of each deserializing rows from the
+database. Every table directory holds a manifest naming the current version, which is
+derived from the database contents (row count, last date and a checksum of the close
+prices, fetched for a whole batch of tables in one query). A missing or outdated
+version falls back to the database and rewrites the cache.
+
+Enabled by setting COLUMNAR_CACHE_DIR. Loaded frames are backed by read-only memory
+maps and must not be modified in place.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import catalog
+import database
+import instrumentation
+
+MANIFEST = "manifest.json"
+
+_stats = {"hits": 0, "misses": 0, "writes": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def cache_dir():
+    """Directory of the columnar cache (COLUMNAR_CACHE_DIR), or None when the tier is disabled."""
+    return os.getenv("COLUMNAR_CACHE_DIR") or None
+
+
+def enabled():
+    return cache_dir() is not None
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+    if name in ("hits", "misses"):
+        instrumentation.cache_lookup("columnar", name == "hits")
+
+
+def stats():
+    with _stats_lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return dict(_stats, directory=cache_dir(), hit_ratio=(_stats["hits"] / lookups) if lookups else None)
+
+
+def table_versions(table_names):
+    """
+    Content tokens for several tables, from one batch of table statistics (see catalog.py):
+    {table: "rows|last date|checksum"}. Tables that cannot be summarized are left out.
+    """
+    if not table_names:
+        return {}
+    try:
+        stats = catalog.table_catalog.stats(table_names, refresh=True)
+    except Exception as e:
+        logging.warning(f"Could not read table versions: {e}")
+        _count("errors")
+        return {}
+    return {name: f"{s.rows}|{s.last_date}|{s.checksum:.12g}" for name, s in stats.items()}
+
+
+def _table_dir(table_name):
+    # Table names contain ticker symbols; keep them readable but filesystem-safe.
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in table_name)
+    return os.path.join(cache_dir(), safe)
+
+
+def _version_id(token):
+    return hashlib.sha1(token.encode()).hexdigest()[:16]
+
+
+def _read_manifest(table_name):
+    try:
+        with open(os.path.join(_table_dir(table_name), MANIFEST)) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def load(table_name, token):
+    """The cached frame of a table if the cache holds the version `token`, otherwise None."""
+    manifest = _read_manifest(table_name)
+    if manifest is None or manifest.get("token") != token:
+        _count("misses")
+        return None
+    path = os.path.join(_table_dir(table_name), manifest["version"])
+    try:
+        blocks = {file: np.load(os.path.join(path, file), mmap_mode="r") for file in manifest["files"]}
+        columns = {}
+        for column in manifest["columns"]:
+            values = blocks[column["file"]][column["row"]]
+            if column["kind"] == "datetime":
+                values = pd.DatetimeIndex(values.view("datetime64[ns]"))
+                if column.get("tz"):
+                    values = values.tz_localize("UTC").tz_convert(column["tz"])
+            elif column["kind"] == "category":
+                values = pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(column["categories"]))
+            columns[column["name"]] = values
+        df = pd.DataFrame(columns, copy=False)
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Columnar cache entry for {table_name} is unreadable: {e}")
+        _count("errors")
+        return None
+    _count("hits")
+    return df
+
+
+def _encode_column(name, series):
+    column = {"name": name}
+    if isinstance(series.dtype, pd.DatetimeTZDtype) or pd.api.types.is_datetime64_dtype(series.dtype):
+        tz = getattr(series.dt, "tz", None)
+        values = series.dt.tz_convert("UTC").dt.tz_localize(None) if tz is not None else series
+        column.update(kind="datetime", tz=str(tz) if tz is not None else None)
+        return column, values.to_numpy(dtype="datetime64[ns]").view("int64")
+    if isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+        categorical = series.astype("category")
+        column.update(kind="category", categories=[str(c) for c in categorical.cat.categories])
+        return column, categorical.cat.codes.to_numpy()
+    column["kind"] = "values"
+    return column, series.to_numpy()
+
+
+def store(table_name, token, df):
+    """Writes a frame as the cached version `token` of a table (atomically; errors are only logged)."""
+    directory = _table_dir(table_name)
+    version = _version_id(token)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=directory, prefix=".tmp-")
+        # Columns of the same dtype are stacked into one (columns x rows) array per file,
+        # so each column is a contiguous row and a table needs only a few file opens.
+        columns, groups = [], {}
+        for name in df.columns:
+            column, values = _encode_column(str(name), df[name])
+            group = groups.setdefault(values.dtype.str, [])
+            column.update(file=f"{values.dtype.name}.npy", row=len(group))
+            group.append(values)
+            columns.append(column)
+        for dtype, group in groups.items():
+            np.save(os.path.join(staging, f"{np.dtype(dtype).name}.npy"), np.stack(group), allow_pickle=False)
+        target = os.path.join(directory, version)
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # Another worker wrote the same version first.
+            shutil.rmtree(staging, ignore_errors=True)
+            if not os.path.isdir(target):
+                raise
+        manifest = {"token": token, "version": version, "rows": len(df), "columns": columns,
+                    "files": sorted({column["file"] for column in columns})}
+        handle, manifest_tmp = tempfile.mkstemp(dir=directory, prefix=".manifest-")
+        with os.fdopen(handle, "w") as out:
+            json.dump(manifest, out)
+        os.replace(manifest_tmp, os.path.join(directory, MANIFEST))
+        # Older versions are removed; readers that still map them keep their open files.
+        for entry in os.listdir(directory):
+            if entry not in (version, MANIFEST) and not entry.startswith("."):
+                shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+    except (OSError, TypeError, ValueError) as e:
+        logging.warning(f"Could not write columnar cache for {table_name}: {e}")
+        _count("errors")
+        return False
+    _count("writes")
+    return True
+
+
+def read_table(table_name, token):
+    """
+    Reads a stored table through the cache: memory-mapped from disk when the cached
+    version matches `token`, otherwise from the database (and then cached).
+    """
+    if token is not None:
+        df = load(table_name, token)
+        if df is not None:
+            return df
+    df = database.read_table(table_name)
+    if token is not None and not df.empty:
+        store(table_name, token, df)
+    return df
@@ -1,31 +1,212 @@
+import logging
 import os
-from sqlalchemy import create_engine, inspect
+import tempfile
+import threading
+from contextlib import contextmanager
+import pandas as pd
+from sqlalchemy import create_engine, text
+import cache
+import catalog
+import instrumentation
 
-def get_engine():
+# A single engine (and therefore a single connection pool) is shared by every caller in
+# the process. It is created lazily on first use and re-created after a fork so that
+# gunicorn workers never share sockets inherited from the master.
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_connection_string():
+    # DATABASE_URL takes precedence so a local stand-in (e.g. SQLite) can be used in tests.
+    url = os.getenv("DATABASE_URL")
+    if url:
+        return url
     # Get PostgreSQL connection details from environment variables
     user = os.getenv("DB_USER", "your_username")
     password = os.getenv("DB_PASSWORD", "your_password")
     host = os.getenv("DB_HOST", "localhost")
     port = os.getenv("DB_PORT", "522432")
     dbname = os.getenv("DB_NAME", "financial_data")
-    
-    connection_string = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{dbname}"
-    engine = create_engine(connection_string)
-    return engine
+    return f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{dbname}"
 
-def table_exists(table_name):
+
+def get_pool_settings():
+    """Connection pool settings, tunable through DB_POOL_* environment variables."""
+    return {
+        "pool_size": _env_int("DB_POOL_SIZE", 5),
+        "max_overflow": _env_int("DB_POOL_MAX_OVERFLOW", 10),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+    }
+
+
+def _build_engine():
+    connection_string = get_connection_string()
+    if connection_string.startswith("sqlite"):
+        # SQLite uses its own pool classes which do not accept the sizing arguments.
+        engine = create_engine(connection_string)
+    else:
+        engine = create_engine(connection_string, **get_pool_settings())
+    # A new engine may point at another database: start with an empty catalog.
+    catalog.table_catalog.clear()
+    return catalog.watch_engine(instrumentation.instrument_engine(engine))
+
+
+def get_engine():
+    """Returns the process-wide engine, creating it on first use (and again after a fork)."""
+    global _engine, _engine_pid
+    pid = os.getpid()
+    if _engine is not None and _engine_pid == pid:
+        return _engine
+    with _engine_lock:
+        if _engine is not None and _engine_pid != pid:
+            # Inherited from the parent process: drop the pooled connections without
+            # closing them, as they still belong to the parent.
+            _engine.dispose(close=False)
+            _engine = None
+        if _engine is None:
+            _engine = _build_engine()
+            _engine_pid = pid
+    return _engine
+
+
+def dispose_engine():
+    """Closes all pooled connections and forgets the engine; the next call rebuilds it."""
+    global _engine, _engine_pid
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+        _engine_pid = None
+        catalog.table_catalog.clear()
+
+
+def pool_status():
+    """Returns connection pool statistics for the current process."""
     engine = get_engine()
-    inspector = inspect(engine)
-    exists = table_name in inspector.get_table_names()
-    engine.dispose()
-    return exists
+    pool = engine.pool
+    stats = {"pid": os.getpid(), "pool_class": type(pool).__name__, "status": pool.status()}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            stats[name] = method()
+    return stats
 
-def store_df_to_db(df, table_name):
+
+@contextmanager
+def advisory_lock(key):
+    """
+    Non-blocking cross-process lock; yields True if this process acquired it.
+    Uses a PostgreSQL session advisory lock (shared by every worker on every host), and
+    a local lock file for other databases.
+    """
     engine = get_engine()
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": key}).scalar()
+            try:
+                yield bool(acquired)
+            finally:
+                if acquired:
+                    conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": key})
+                conn.commit()
+        return
+    import fcntl
+    path = os.path.join(tempfile.gettempdir(), f"stock-pipeline-{key}.lock")
+    with open(path, "w") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def list_tables():
+    """Names of all tables, from the process-wide catalog (see catalog.py)."""
+    return catalog.table_catalog.tables()
+
+
+def table_exists(table_name):
+    return catalog.table_catalog.exists(table_name)
+
+
+def read_table(table_name, date_columns=("Date",)):
+    """
+    Reads a whole table with a single SELECT. Unlike pd.read_sql_table this does not
+    reflect the table first (a dozen catalog queries per table); date columns are
+    parsed by name instead.
+    """
+    quote = get_engine().dialect.identifier_preparer.quote
+    return pd.read_sql(text(f"SELECT * FROM {quote(table_name)}"), get_engine(), parse_dates=list(date_columns))
+
+
+def read_table_chunks(table_name, chunk_rows, order_by="Date", date_columns=("Date",)):
+    """Yields a table in consecutive frames of at most chunk_rows rows, ordered by order_by."""
+    quote = get_engine().dialect.identifier_preparer.quote
+    query = text(f"SELECT * FROM {quote(table_name)} ORDER BY {quote(order_by)}")
+    with get_engine().connect() as conn:
+        yield from pd.read_sql(query, conn, parse_dates=list(date_columns), chunksize=chunk_rows)
+
+
+def store_df_to_db(df, table_name):
+    try:
+        df.to_sql(table_name, get_engine(), if_exists="replace", index=True)
+        catalog.table_catalog.record_write(table_name, df)
+        cache.frame_cache.invalidate_table(table_name)
+        logging.info(f"Data stored in table '{table_name}' successfully.")
+    except Exception as e:
+        logging.error(f"Error storing data in table '{table_name}': {e}")
+
+
+def last_stored_row(table_name, date_column="Date"):
+    """Returns the most recent row of a table as a Series, or None if the table is missing or empty."""
+    if not table_exists(table_name):
+        return None
+    query = text(f'SELECT * FROM "{table_name}" ORDER BY "{date_column}" DESC LIMIT 1')
+    df = pd.read_sql(query, get_engine())
+    if df.empty:
+        return None
+    return df.iloc[0]
+
+
+def upsert_df_to_db(df, table_name, date_column="Date"):
+    """
+    Appends rows to a table, first deleting any stored rows on or after the earliest new
+    date so that overlapping ranges are replaced rather than duplicated. The table is
+    created if it does not exist yet.
+    """
+    if df.empty:
+        return 0
+    first_date = df.index.min() if df.index.name == date_column else df[date_column].min()
+    exists = table_exists(table_name)
     try:
-        df.to_sql(table_name, engine, if_exists="replace", index=True)
-        print(f"Data stored in table '{table_name}' successfully.")
+        with get_engine().begin() as conn:
+            if exists:
+                conn.execute(text(f'DELETE FROM "{table_name}" WHERE "{date_column}" >= :first_date'),
+                             {"first_date": pd.Timestamp(first_date).to_pydatetime()})
+            df.to_sql(table_name, conn, if_exists="append", index=df.index.name == date_column)
+        catalog.table_catalog.record_write(table_name)
+        cache.frame_cache.invalidate_table(table_name)
+        logging.info(f"Upserted {len(df)} rows into table '{table_name}'.")
+        return len(df)
     except Exception as e:
-        print(f"Error storing data in table '{table_name}': {e}")
-    finally:
-        engine.dispose()
\ No newline at end of file
+        logging.error(f"Error upserting data into table '{table_name}': {e}")
+        return 0
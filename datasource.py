@@ -0,0 +1,242 @@
+import os
+import re
+import tempfile
+import threading
+import pandas as pd
+
+
+class DataSource:
+    """
+    Interface for market data providers. Implementations return a DataFrame of OHLCV
+    bars indexed by date, in the same shape as yfinance's Ticker.history().
+    """
+    name = "base"
+
+    def history(self, ticker, start=None, end=None, period='3y', interval='1d'):
+        raise NotImplementedError
+
+    def download(self, ticker, start=None, end=None, interval='1d'):
+        # Providers without a separate bulk download endpoint fall back to history().
+        return self.history(ticker, start=start, end=end, interval=interval)
+
+    def preload(self):
+        """Imports the modules the provider fetches with, which otherwise happens on first use."""
+
+
+def _yfinance():
+    # yfinance (and its dependencies) is imported on the first fetch rather than at
+    # startup: it is a large share of the application's import time.
+    import yfinance
+    return yfinance
+
+
+class YFinanceSource(DataSource):
+    """Live data from Yahoo Finance."""
+    name = "yfinance"
+
+    # Longest date range Yahoo serves per request for some intraday intervals (days);
+    # longer ranges are fetched piecewise.
+    MAX_REQUEST_DAYS = {"1m": 7}
+
+    def history(self, ticker, start=None, end=None, period='3y', interval='1d'):
+        stock = _yfinance().Ticker(ticker)
+        if start and end:
+            span = self.MAX_REQUEST_DAYS.get(interval)
+            if span is None:
+                return stock.history(start=start, end=end, interval=interval)
+            edges = list(pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq=f"{span}D"))
+            edges.append(pd.Timestamp(end))
+            parts = [stock.history(start=a, end=b, interval=interval) for a, b in zip(edges, edges[1:]) if a < b]
+            if not parts:
+                return stock.history(start=start, end=end, interval=interval)
+            filled = [part for part in parts if not part.empty]
+            return pd.concat(filled) if len(filled) > 1 else (filled or parts)[0]
+        return stock.history(period=period, interval=interval)
+
+    def download(self, ticker, start=None, end=None, interval='1d'):
+        return _yfinance().download(tickers=ticker, start=start, end=end, interval=interval,
+                           progress=False, threads=False)
+
+    def preload(self):
+        _yfinance()
+
+
+_PERIOD_UNITS = {"d": "days", "wk": "weeks", "mo": "months", "y": "years"}
+
+
+def _period_offset(period):
+    match = re.fullmatch(r"(\d+)(d|wk|mo|y)", period or "")
+    if not match:
+        return None
+    return pd.DateOffset(**{_PERIOD_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def _as_index_time(value, index):
+    # Compare string bounds against tz-aware indexes in the index's own timezone.
+    ts = pd.Timestamp(value)
+    if index.tz is not None and ts.tz is None:
+        ts = ts.tz_localize(index.tz)
+    return ts
+
+
+def _parse_index(values):
+    # yfinance dates carry a UTC offset that changes with daylight saving time; such
+    # mixed offsets are parsed through UTC back into the exchange timezone.
+    try:
+        index = pd.to_datetime(values)
+    except (ValueError, TypeError):
+        index = None
+    if not isinstance(index, pd.DatetimeIndex):
+        index = pd.to_datetime(values, utc=True).tz_convert("America/New_York")
+    return index
+
+
+# One lock per fixture file, shared by every ReplaySource writing to it.
+_path_locks = {}
+_path_locks_lock = threading.Lock()
+
+
+def _path_lock(path):
+    with _path_locks_lock:
+        return _path_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+class ReplaySource(DataSource):
+    """
+    Deterministic data replayed from local fixture files, one per ticker and interval:
+    `<directory>/<TICKER>_<interval>.parquet|.csv`, falling back to `<TICKER>.parquet|.csv`
+    for daily bars. Files are read once and kept in memory.
+    """
+    name = "replay"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _candidates(self, ticker, interval):
+        stems = [f"{ticker}_{interval}"]
+        if interval == '1d':
+            stems.append(ticker)
+        for stem in stems:
+            for ext in (".parquet", ".csv"):
+                yield os.path.join(self.directory, stem + ext)
+
+    def _load(self, ticker, interval):
+        key = (ticker, interval)
+        with self._lock:
+            if key in self._frames:
+                return self._frames[key]
+        for path in self._candidates(ticker, interval):
+            if os.path.exists(path):
+                if path.endswith(".parquet"):
+                    df = pd.read_parquet(path)
+                else:
+                    df = pd.read_csv(path, index_col=0)
+                    df.index = _parse_index(df.index)
+                df.index.name = "Date"
+                df = df.sort_index()
+                with self._lock:
+                    self._frames[key] = df
+                return df
+        raise FileNotFoundError(f"No replay fixture for {ticker} ({interval}) in {self.directory}")
+
+    def history(self, ticker, start=None, end=None, period='3y', interval='1d'):
+        df = self._load(ticker, interval)
+        if df.empty:
+            return df.copy()
+        if start and end:
+            # Same half-open [start, end) convention as yfinance.
+            mask = (df.index >= _as_index_time(start, df.index)) & (df.index < _as_index_time(end, df.index))
+            return df.loc[mask].copy()
+        offset = _period_offset(period)
+        if offset is None:
+            return df.copy()
+        return df.loc[df.index > df.index[-1] - offset].copy()
+
+    def save(self, ticker, df, interval='1d', fmt='csv'):
+        """
+        Writes a fixture file that this source (or another replay source) can replay.
+        Rows already recorded for the ticker are kept, so several windows can be recorded.
+        Saves of the same file (e.g. windows recorded by concurrent fetches) run one at a
+        time, and the file is replaced atomically so readers never see a partial write.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{ticker}_{interval}.{fmt}")
+        with _path_lock(path):
+            # Read back what is on disk now, not what this source cached before another save.
+            with self._lock:
+                self._frames.pop((ticker, interval), None)
+            try:
+                existing = self._load(ticker, interval)
+            except FileNotFoundError:
+                existing = None
+            if existing is not None and not existing.empty:
+                df = pd.concat([existing, df])
+                df = df[~df.index.duplicated(keep='last')].sort_index()
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{ticker}_{interval}.", suffix=f".{fmt}")
+            os.close(fd)
+            try:
+                if fmt == 'parquet':
+                    df.to_parquet(tmp_path)
+                else:
+                    df.to_csv(tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            with self._lock:
+                self._frames.pop((ticker, interval), None)
+        return path
+
+
+class RecordingSource(DataSource):
+    """Wraps another source and saves everything it returns as replay fixtures."""
+    name = "recording"
+
+    def __init__(self, source, replay):
+        self.source = source
+        self.replay = replay
+
+    def history(self, ticker, start=None, end=None, period='3y', interval='1d'):
+        df = self.source.history(ticker, start=start, end=end, period=period, interval=interval)
+        if df is not None and not df.empty:
+            self.replay.save(ticker, df, interval=interval)
+        return df
+
+    def preload(self):
+        self.source.preload()
+
+
+_source = None
+_source_lock = threading.Lock()
+
+
+def create_data_source(name=None, replay_dir=None):
+    """Builds a data source from its name (DATA_SOURCE: yfinance, replay or record)."""
+    name = (name or os.getenv("DATA_SOURCE", "yfinance")).lower()
+    replay_dir = replay_dir or os.getenv("DATA_REPLAY_DIR", "fixtures")
+    if name == "yfinance":
+        return YFinanceSource()
+    if name == "replay":
+        return ReplaySource(replay_dir)
+    if name == "record":
+        return RecordingSource(YFinanceSource(), ReplaySource(replay_dir))
+    raise ValueError(f"Unknown data source '{name}'")
+
+
+def get_data_source():
+    """Returns the configured process-wide data source."""
+    global _source
+    if _source is None:
+        with _source_lock:
+            if _source is None:
+                _source = create_data_source()
+    return _source
+
+
+def set_data_source(source):
+    """Replaces the process-wide data source (None resets it to the configured default)."""
+    global _source
+    with _source_lock:
+        _source = source
@@ -0,0 +1,105 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import partial
+
+
+def _env_number(name, default, cast=float):
+    value = os.getenv(name)
+    return cast(value) if value not in (None, "") else default
+
+
+def default_options():
+    """Batch fetch settings, tunable through FETCH_* environment variables."""
+    return {
+        "max_workers": _env_number("FETCH_MAX_WORKERS", 4, int),
+        "timeout": _env_number("FETCH_TIMEOUT", 30.0),
+        "retries": _env_number("FETCH_RETRIES", 2, int),
+        "backoff": _env_number("FETCH_BACKOFF", 1.0),
+        "rate_limit": _env_number("FETCH_RATE_LIMIT", 5.0),
+    }
+
+
+class RateLimiter:
+    """Spaces calls so that at most `rate` of them start per second (across threads)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def fetch_batch(jobs, max_workers=None, timeout=None, retries=None, backoff=None, rate_limit=None):
+    """
+    Runs a batch of fetch jobs concurrently.
+    `jobs` maps a result key to a zero-argument callable returning a DataFrame. Each job
+    is retried up to `retries` times with exponential backoff when it raises, returns
+    None, or does not finish within `timeout` seconds. Job starts are throttled to
+    `rate_limit` per second.
+    Returns a dictionary mapping every key to its DataFrame, or None if all attempts failed.
+    """
+    options = default_options()
+    max_workers = options["max_workers"] if max_workers is None else max_workers
+    timeout = options["timeout"] if timeout is None else timeout
+    retries = options["retries"] if retries is None else retries
+    backoff = options["backoff"] if backoff is None else backoff
+    rate_limit = options["rate_limit"] if rate_limit is None else rate_limit
+    if not jobs:
+        return {}
+
+    limiter = RateLimiter(rate_limit)
+    workers = max(1, min(max_workers, len(jobs)))
+    # Attempts run on their own pool so a job can stop waiting for a hung attempt. A timed
+    # out attempt cannot be cancelled and keeps its thread until the call returns.
+    attempt_pool = ThreadPoolExecutor(max_workers=workers * (retries + 1), thread_name_prefix="fetch-attempt")
+
+    def run(key, job):
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(backoff * (2 ** (attempt - 1)))
+            limiter.acquire()
+            try:
+                df = attempt_pool.submit(job).result(timeout=timeout)
+                if df is not None:
+                    return df
+                logging.warning(f"Fetch for {key} returned no data (attempt {attempt + 1}).")
+            except FutureTimeoutError:
+                logging.warning(f"Fetch for {key} timed out after {timeout}s (attempt {attempt + 1}).")
+            except Exception as e:
+                logging.warning(f"Fetch for {key} failed (attempt {attempt + 1}): {e}")
+        logging.error(f"Giving up on {key} after {retries + 1} attempts.")
+        return None
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch") as pool:
+            futures = {key: pool.submit(run, key, job) for key, job in jobs.items()}
+            return {key: future.result() for key, future in futures.items()}
+    finally:
+        attempt_pool.shutdown(wait=False)
+
+
+def fetch_windows(fetch, tickers, windows, interval='1d', **options):
+    """
+    Fetches several tickers over several date windows concurrently with
+    fetch(ticker, start=, end=, interval=). `windows` maps a window name to a (start, end)
+    tuple; options are passed on to fetch_batch.
+    Returns a dictionary keyed by (ticker, window) with a DataFrame, or None on failure.
+    """
+    jobs = {
+        (ticker, window): partial(fetch, ticker, start=start, end=end, interval=interval)
+        for ticker in tickers
+        for window, (start, end) in windows.items()
+    }
+    return fetch_batch(jobs, **options)
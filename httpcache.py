@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from flask import Response, request
+import instrumentation
+
+# Time each data version was first served by this process, used as Last-Modified when
+# the version does not come with its own timestamp.
+_first_seen = {}
+_first_seen_lock = threading.Lock()
+
+
+class BodyCache:
+    """
+    Serialized response bodies keyed by ETag and encoding, bounded by their total size.
+    Kept apart from results.result_store so that sweeping a request parameter fills
+    this cache rather than evicting the precomputed analytics. The least recently used
+    bodies are evicted beyond max_bytes; a body larger than that is not kept at all.
+    """
+
+    def __init__(self, max_bytes, name="responses"):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._bodies = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        instrumentation.cache_lookup(self.name, body is not None)
+        if body is not None:
+            return body
+        body = compute()
+        if len(body) <= self.max_bytes:
+            with self._lock:
+                previous = self._bodies.pop(key, None)
+                self._bytes += len(body) - (len(previous) if previous is not None else 0)
+                self._bodies[key] = body
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._bodies.popitem(last=False)
+                    self._bytes -= len(evicted)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._bodies.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._bodies), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+# Response bodies of this process (API_BODY_CACHE_BYTES, default 32 MiB).
+body_cache = BodyCache(int(os.getenv("API_BODY_CACHE_BYTES", str(32 * 1024 * 1024))))
+
+
+def json_safe(value):
+    # NaN/inf are not valid JSON; report them as null.
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {str(k): json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(v) for v in value]
+    if hasattr(value, "item"):  # NumPy scalars
+        return json_safe(value.item())
+    return value
+
+
+def make_etag(*parts):
+    """Strong ETag from the data version and the request parameters that shape the payload."""
+    return hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def _last_modified(version, modified_at):
+    if modified_at is not None:
+        return modified_at
+    with _first_seen_lock:
+        if len(_first_seen) > 1024:
+            _first_seen.clear()
+        return _first_seen.setdefault(version, time.time())
+
+
+def _encoded_body(etag, build, use_gzip):
+    # Serialized (and compressed) payloads are memoized per ETag, so a 200 for a
+    # representation that was already built costs no computation either.
+    body = body_cache.get_or_compute(
+        (etag, "identity"), lambda: json.dumps(json_safe(build()), separators=(",", ":")).encode())
+    min_size = int(os.getenv("API_GZIP_MIN_BYTES", "1024"))
+    if use_gzip and len(body) >= min_size:
+        return body_cache.get_or_compute((etag, "gzip"), lambda: gzip.compress(body, 6)), True
+    return body, False
+
+
+def conditional_json(version, params, build, modified_at=None):
+    """
+    Returns a JSON response for `build()` with ETag and Last-Modified headers derived from
+    the data version, or 304 Not Modified (without calling build) when the client already
+    holds the current representation. Responses are gzip-compressed when accepted.
+    """
+    etag = make_etag(request.path, version, *params)
+    last_modified = _last_modified(version, modified_at)
+    not_modified = etag in request.if_none_match
+    if not request.if_none_match and request.if_modified_since is not None:
+        not_modified = request.if_modified_since.timestamp() >= int(last_modified)
+
+    use_gzip = "gzip" in request.accept_encodings
+    if not_modified:
+        response = Response(status=304)
+    else:
+        body, compressed = _encoded_body(etag, build, use_gzip)
+        response = Response(body, mimetype="application/json")
+        if compressed:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    response.headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
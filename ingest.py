@@ -0,0 +1,227 @@
+import os
+import threading
+import weakref
+from collections import namedtuple
+import pandas as pd
+from sqlalchemy import bindparam, inspect, text
+import catalog
+import database
+
+# Per-table high-water marks: the last stored bar and the date range fetched into the
+# table (fetched_from to fetched_until). The fetched range can run past the stored bars
+# (weekends, holidays, a ticker listed after the window started), which is what stops
+# the same empty range from being fetched again. The normalized prices table records
+# one range per ticker (see prices.coverage_key).
+STATE_TABLE = "ingest_state"
+
+# Stored rows without a recorded fetch are taken to cover a window when they start and
+# end within this many days of it (windows begin and end on weekends and holidays).
+COVERAGE_SLACK = pd.Timedelta(days=7)
+
+# A date range to fetch for a table; with replace=True the table is rewritten with the
+# whole window rather than appended to.
+Fetch = namedtuple("Fetch", "start end replace")
+
+# Engines whose state table has been created (or given the fetched_from column).
+_ready_engines = weakref.WeakSet()
+_ready_lock = threading.Lock()
+
+
+def incremental_enabled():
+    """Incremental ingestion is enabled with INGEST_MODE=incremental (default: replace)."""
+    return os.getenv("INGEST_MODE", "replace").lower() == "incremental"
+
+
+def _ensure_state_table(conn):
+    # Once per engine: state tables created before fetched_from was recorded gain the column.
+    with _ready_lock:
+        if conn.engine in _ready_engines:
+            return
+    conn.execute(text(
+        f'CREATE TABLE IF NOT EXISTS "{STATE_TABLE}" ('
+        'table_name VARCHAR(255) PRIMARY KEY, last_date VARCHAR(32), fetched_until VARCHAR(32), '
+        'fetched_from VARCHAR(32))'))
+    if "fetched_from" not in {column["name"] for column in inspect(conn).get_columns(STATE_TABLE)}:
+        conn.execute(text(f'ALTER TABLE "{STATE_TABLE}" ADD COLUMN fetched_from VARCHAR(32)'))
+    with _ready_lock:
+        _ready_engines.add(conn.engine)
+
+
+def _timestamp(value):
+    return pd.Timestamp(value) if value is not None else None
+
+
+def get_state(table_name):
+    """
+    Returns {'last_date': Timestamp, 'fetched_until': Timestamp, 'fetched_from': Timestamp}
+    for a table (fetched_from is None for states recorded before it was tracked), or None.
+    """
+    return get_states([table_name]).get(table_name)
+
+
+def get_states(table_names):
+    """get_state() for several tables in one query: {table: state} for the tables that have one."""
+    if not table_names:
+        return {}
+    query = text(f'SELECT table_name, last_date, fetched_until, fetched_from FROM "{STATE_TABLE}" '
+                 'WHERE table_name IN :tables')
+    with database.get_engine().begin() as conn:
+        _ensure_state_table(conn)
+        rows = conn.execute(query.bindparams(bindparam("tables", expanding=True)),
+                            {"tables": list(table_names)}).fetchall()
+    return {name: {"last_date": _timestamp(last), "fetched_until": pd.Timestamp(until),
+                   "fetched_from": _timestamp(fetched_from)}
+            for name, last, until, fetched_from in rows}
+
+
+def record_state(table_name, last_date, fetched_until, fetched_from=None):
+    """Records a table's state; fetched_from=None keeps the start of the range recorded before."""
+    record_states([(table_name, last_date, fetched_until, fetched_from)])
+
+
+def record_states(states):
+    """record_state() for several (table, last_date, fetched_until, fetched_from) tuples in one transaction."""
+    if not states:
+        return
+    tables = [state[0] for state in states]
+    select = text(f'SELECT table_name, fetched_from FROM "{STATE_TABLE}" WHERE table_name IN :tables')
+    delete = text(f'DELETE FROM "{STATE_TABLE}" WHERE table_name IN :tables')
+    with database.get_engine().begin() as conn:
+        _ensure_state_table(conn)
+        previous = dict(conn.execute(select.bindparams(bindparam("tables", expanding=True)),
+                                     {"tables": tables}).fetchall())
+        conn.execute(delete.bindparams(bindparam("tables", expanding=True)), {"tables": tables})
+        conn.execute(text(f'INSERT INTO "{STATE_TABLE}" (table_name, last_date, fetched_until, fetched_from) '
+                          'VALUES (:t, :l, :f, :s)'),
+                     [{"t": table, "l": pd.Timestamp(last_date).isoformat() if last_date is not None else None,
+                       "f": pd.Timestamp(fetched_until).date().isoformat(),
+                       "s": pd.Timestamp(fetched_from).date().isoformat() if fetched_from is not None
+                       else previous.get(table)}
+                      for table, last_date, fetched_until, fetched_from in states])
+
+
+def _effective_end(end):
+    # Nothing can be fetched past today, so a window ending in the future is "complete" up to today.
+    today = pd.Timestamp.now().normalize()
+    return min(pd.Timestamp(end).tz_localize(None), today + pd.Timedelta(days=1))
+
+
+def _naive_day(value):
+    value = pd.Timestamp(value)
+    return (value.tz_localize(None) if value.tz is not None else value).normalize()
+
+
+def covers(state, start, end):
+    """Whether the range recorded in a state (see get_states) covers the window [start, end)."""
+    if state is None or state.get("fetched_from") is None:
+        return False
+    return state["fetched_from"] <= pd.Timestamp(start) and state["fetched_until"] >= _effective_end(end)
+
+
+def rows_cover(first_date, last_date, start, end):
+    """
+    Whether stored rows from first_date to last_date cover the window [start, end), within
+    COVERAGE_SLACK at both ends. Used for data stored without a recorded fetch range.
+    """
+    if first_date is None or last_date is None or pd.isna(first_date) or pd.isna(last_date):
+        return False
+    return (_naive_day(first_date) <= pd.Timestamp(start) + COVERAGE_SLACK
+            and _naive_day(last_date) >= _effective_end(end) - COVERAGE_SLACK)
+
+
+def fetched_range(state, start, end):
+    """
+    The (fetched_from, fetched_until) range to record after fetching the window [start, end)
+    into data with a recorded state: the union of both when they overlap or touch, otherwise
+    the window alone.
+    """
+    end = _effective_end(end)
+    start = pd.Timestamp(start)
+    if state is None or state.get("fetched_from") is None:
+        return start, end
+    if state["fetched_from"] <= end and state["fetched_until"] >= start:
+        return min(start, state["fetched_from"]), max(end, state["fetched_until"])
+    return start, end
+
+
+def plan_window(table_names, start, end):
+    """
+    What to fetch for the per-asset tables of the window [start, end), planned from one
+    read of the ingest state and one batch of catalog statistics: {table: None} for a
+    table holding the window up to date, otherwise a Fetch. A table that is missing or
+    empty, holds rows outside the window or was fetched from a later start (e.g. after
+    the window's dates were changed) gets the whole window with replace=True; a table
+    that only ends early gets the range after its last fetch.
+    """
+    start_ts, window_end, end_ts = pd.Timestamp(start), pd.Timestamp(end), _effective_end(end)
+    whole = Fetch(start, end, True)
+    states = get_states(table_names)
+    coverage = catalog.table_catalog.stats(table_names)
+    plans = {}
+    for name in table_names:
+        stats, state = coverage.get(name), states.get(name)
+        if stats is None or not stats.rows or stats.first_date is None:
+            plans[name] = whole
+            continue
+        first, last = _naive_day(stats.first_date), _naive_day(stats.last_date)
+        if first < start_ts or last >= window_end:
+            plans[name] = whole
+            continue
+        if state is not None and state["fetched_from"] is not None:
+            if state["fetched_from"] > start_ts:
+                plans[name] = whole
+                continue
+        elif first > start_ts + COVERAGE_SLACK:
+            # No recorded fetch range to tell a late listing from a shorter earlier window.
+            plans[name] = whole
+            continue
+        fetched_until = state["fetched_until"] if state is not None else last + pd.Timedelta(days=1)
+        plans[name] = None if fetched_until >= end_ts else Fetch(fetched_until.date().isoformat(),
+                                                                 end_ts.date().isoformat(), False)
+    return plans
+
+
+def continue_processing(raw, last_row, process):
+    """
+    Processes newly fetched bars so that they continue from the last stored row:
+    Daily_Return of the first new bar is measured against the stored close, and
+    Cumulative_Return compounds on top of the stored cumulative return.
+    """
+    last_date = pd.Timestamp(last_row["Date"])
+    if raw.index.tz is not None:
+        last_date = last_date.tz_localize(raw.index.tz) if last_date.tz is None else last_date.tz_convert(raw.index.tz)
+    else:
+        last_date = last_date.tz_localize(None)
+    raw = raw[raw.index > last_date]
+    if raw.empty:
+        return raw
+    anchor = pd.DataFrame({"Close": [last_row["Close"]]}, index=pd.DatetimeIndex([last_date], name=raw.index.name))
+    # process() drops the anchor row itself, as its return cannot be computed.
+    df = process(pd.concat([anchor, raw]))
+    df['Cumulative_Return'] = (1 + last_row["Cumulative_Return"]) * (1 + df['Cumulative_Return']) - 1
+    return df
+
+
+def apply_increment(table_name, raw, process, fetched_until):
+    """
+    Processes the bars fetched for a table's missing range, upserts them and advances
+    the table's ingest state. A table without stored rows is processed and written whole.
+    Returns the number of rows written.
+    """
+    if raw is None:
+        return 0
+    last_row = database.last_stored_row(table_name)
+    if last_row is None:
+        df = process(raw)
+        database.store_df_to_db(df, table_name=table_name)
+    else:
+        df = continue_processing(raw, last_row, process)
+        database.upsert_df_to_db(df, table_name)
+    if not df.empty:
+        last_date = df.index.max()
+    elif last_row is not None:
+        last_date = last_row["Date"]
+    else:
+        return 0
+    record_state(table_name, last_date, fetched_until)
+    return len(df)
@@ -0,0 +1,345 @@
+"""
+Request-level timing and counters.
+
+Each request gets a record of how long it spent in every stage (catalog checks,
+database reads, fetching, processing, correlation, portfolio maths, rendering) and of
+how many database round trips and cache lookups it made. The record is returned in a
+Server-Timing response header; the same measurements are aggregated per process into
+Prometheus counters and histograms served by /metrics.
+
+With PROFILE_SLOW_REQUESTS_MS set, a sampling profiler thread also records the stack
+of every request that has been running longer than that threshold, every
+PROFILE_SAMPLE_INTERVAL_MS milliseconds. Slow requests are logged with their stage
+breakdown and hottest stacks, kept for /debug/profiles and, with PROFILE_DIR set,
+written there as folded stacks (the input format of flamegraph.pl and speedscope).
+"""
+import contextvars
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# Upper bounds (seconds) of the duration histogram buckets.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Metric name -> (type, help text) of everything exported by /metrics.
+METRICS = {
+    "app_requests_total": ("counter", "HTTP requests by endpoint, method and status."),
+    "app_request_duration_seconds": ("histogram", "Request duration by endpoint."),
+    "app_stage_duration_seconds": ("histogram", "Time spent in each pipeline stage."),
+    "app_db_round_trips_total": ("counter", "SQL statements sent to the database."),
+    "app_cache_lookups_total": ("counter", "Cache lookups by cache and result (hit or miss)."),
+    "app_slow_requests_total": ("counter", "Requests slower than PROFILE_SLOW_REQUESTS_MS, by endpoint."),
+}
+
+_record = contextvars.ContextVar("instrumentation_record", default=None)
+_active_stages = contextvars.ContextVar("instrumentation_stages", default=())
+
+
+def _env_float(name):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else None
+
+
+def server_timing_enabled():
+    return os.getenv("SERVER_TIMING", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def slow_request_threshold():
+    """PROFILE_SLOW_REQUESTS_MS in seconds, or None when slow-request profiling is off."""
+    ms = _env_float("PROFILE_SLOW_REQUESTS_MS")
+    return ms / 1000.0 if ms is not None else None
+
+
+class Registry:
+    """Thread-safe per-process store of labelled counters and histograms."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels=None, amount=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def value(self, name, labels=None):
+        """Current value of a counter (0 when it has not been incremented)."""
+        with self._lock:
+            return self._counters.get((name, tuple(sorted((labels or {}).items()))), 0)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self._histograms.items())
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            if kind == "counter":
+                lines += [f"{name}{_labels(labels)} {_number(value)}"
+                          for (metric, labels), value in counters if metric == name]
+                continue
+            for (metric, labels), (buckets, total, count) in histograms:
+                if metric != name:
+                    continue
+                for bound, observed in zip(self.buckets, buckets):
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {observed}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Process-wide metrics registry.
+registry = Registry()
+
+
+class RequestRecord:
+    """Stage timings and counters of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.thread_id = threading.get_ident()
+        self.stages = OrderedDict()
+        self.counters = Counter()
+        self.samples = Counter()
+        self.duration = None
+
+    def add_stage(self, name, seconds):
+        total, calls = self.stages.get(name, (0.0, 0))
+        self.stages[name] = (total + seconds, calls + 1)
+
+    def server_timing(self):
+        """Value of the Server-Timing header: stage durations, counters and the total."""
+        parts = [f"{name};dur={total * 1000:.1f}" for name, (total, _) in self.stages.items()]
+        parts += [f'{name};desc="{count}"' for name, count in sorted(self.counters.items())]
+        if self.duration is not None:
+            parts.append(f"total;dur={self.duration * 1000:.1f}")
+        return ", ".join(parts)
+
+    def summary(self):
+        return {
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "stages_ms": {name: round(total * 1000, 1) for name, (total, _) in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+
+def current():
+    """The record of the request being handled, or None outside of requests."""
+    return _record.get()
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a block as pipeline stage `name`, both for the current request and in the
+    stage histogram. A stage nested in a stage of the same name is not counted twice.
+    """
+    active = _active_stages.get()
+    if name in active:
+        yield
+        return
+    token = _active_stages.set(active + (name,))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _active_stages.reset(token)
+        record = _record.get()
+        if record is not None:
+            record.add_stage(name, elapsed)
+        registry.observe("app_stage_duration_seconds", {"stage": name}, elapsed)
+
+
+def timed(name):
+    """Decorator timing every call of a function as stage `name`."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, amount=1):
+    """Adds to a per-request counter (reported in Server-Timing)."""
+    record = _record.get()
+    if record is not None:
+        record.counters[name] += amount
+
+
+def cache_lookup(cache_name, hit):
+    """Records a hit or miss of one of the caches (frames, results, columnar)."""
+    result = "hit" if hit else "miss"
+    registry.inc("app_cache_lookups_total", {"cache": cache_name, "result": result})
+    count(f"{cache_name}_{result}")
+
+
+def db_round_trip():
+    registry.inc("app_db_round_trips_total")
+    count("db_round_trips")
+
+
+def instrument_engine(engine):
+    """Counts every statement an SQLAlchemy engine executes as one database round trip."""
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        db_round_trip()
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    return engine
+
+
+def begin_request():
+    """Starts recording a request in the current context; returns the record."""
+    record = RequestRecord()
+    _record.set(record)
+    if slow_request_threshold() is not None:
+        profiler.watch(record)
+    return record
+
+
+def finish_request(endpoint, method, status):
+    """
+    Stops recording the current request, updates the request metrics and handles it as
+    a slow request if it exceeded PROFILE_SLOW_REQUESTS_MS. Returns the record (or None
+    when no request was being recorded).
+    """
+    record = _record.get()
+    if record is None:
+        return None
+    _record.set(None)
+    profiler.unwatch(record)
+    record.duration = time.perf_counter() - record.started
+    endpoint = endpoint or "unmatched"
+    registry.inc("app_requests_total", {"endpoint": endpoint, "method": method, "status": str(status)})
+    registry.observe("app_request_duration_seconds", {"endpoint": endpoint}, record.duration)
+    threshold = slow_request_threshold()
+    if threshold is not None and record.duration >= threshold:
+        registry.inc("app_slow_requests_total", {"endpoint": endpoint})
+        profiler.report(record, endpoint, method)
+    return record
+
+
+def _frame_stack(frame):
+    # Root-first "file:function" entries of a frame's call stack.
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class SlowRequestProfiler:
+    """
+    Sampling profiler for slow requests. One daemon thread per process wakes up every
+    PROFILE_SAMPLE_INTERVAL_MS and samples the stacks of the requests that have been
+    running for longer than the slow-request threshold; faster requests cost nothing
+    beyond registering and unregistering. Samples therefore cover a slow request from
+    the moment it crossed the threshold.
+    """
+
+    def __init__(self, keep=20):
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.recent = deque(maxlen=keep)
+
+    def _ensure_thread(self):
+        # (Re)started lazily so each gunicorn worker samples its own threads after the fork.
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+            self._thread.start()
+
+    def watch(self, record):
+        with self._lock:
+            self._watched[id(record)] = record
+            self._ensure_thread()
+
+    def unwatch(self, record):
+        with self._lock:
+            self._watched.pop(id(record), None)
+
+    def _run(self):
+        while True:
+            interval = (_env_float("PROFILE_SAMPLE_INTERVAL_MS") or 5.0) / 1000.0
+            time.sleep(interval)
+            threshold = slow_request_threshold()
+            if threshold is None:
+                continue
+            now = time.perf_counter()
+            with self._lock:
+                slow = [r for r in self._watched.values() if now - r.started >= threshold]
+            if not slow:
+                continue
+            frames = sys._current_frames()
+            for record in slow:
+                frame = frames.get(record.thread_id)
+                if frame is not None:
+                    record.samples[_frame_stack(frame)] += 1
+
+    def report(self, record, endpoint, method, top=10):
+        """Logs a slow request, keeps it for /debug/profiles and writes its folded stacks to PROFILE_DIR."""
+        summary = dict(record.summary(), endpoint=endpoint, method=method, samples=sum(record.samples.values()),
+                       at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        hottest = record.samples.most_common(top)
+        summary["top_stacks"] = [{"stack": stack, "samples": n} for stack, n in hottest]
+        self.recent.append(summary)
+        logging.warning(f"Slow request {method} {endpoint}: {summary['duration_ms']} ms, "
+                        f"stages {summary['stages_ms']}, counters {summary['counters']}")
+        for stack, n in hottest:
+            logging.warning(f"  {n} samples: {stack}")
+        directory = os.getenv("PROFILE_DIR")
+        if directory and record.samples:
+            path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{endpoint}.folded")
+            try:
+                os.makedirs(directory, exist_ok=True)
+                with open(path, "w") as out:
+                    out.writelines(f"{stack} {n}\n" for stack, n in record.samples.items())
+            except OSError as e:
+                logging.error(f"Could not write profile {path}: {e}")
+
+
+# Process-wide slow-request profiler.
+profiler = SlowRequestProfiler()
@@ -0,0 +1,329 @@
+"""
+Asynchronous jobs for long-running computations (ingestion, large backtests and
+optimizations).
+
+A job is submitted with a kind and JSON parameters and returns an id immediately; it
+runs on a per-worker thread pool and records its status and progress in the `jobs`
+table, so any worker can report on it. CPU-bound parts are handed to a per-worker
+process pool through the job context (run_cpu / map_cpu), which keeps them off the
+GIL of the web worker. Results are stored with the job as JSON.
+
+Jobs are deduplicated by a key made of their kind, parameters and a data version:
+submitting a job identical to one that is queued, running or (for kinds whose results
+can be reused) has succeeded returns the existing job instead of running it again. A
+unique index on the keys of pending jobs makes this hold across threads and workers
+submitting at the same time.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+import database
+import httpcache
+
+JOBS_TABLE = "jobs"
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+PENDING = (QUEUED, RUNNING)
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_seconds(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def ensure_schema():
+    with database.get_engine().begin() as conn:
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{JOBS_TABLE}" ('
+            'id VARCHAR(32) PRIMARY KEY, kind VARCHAR(32) NOT NULL, job_key VARCHAR(40) NOT NULL, '
+            'params TEXT, status VARCHAR(16) NOT NULL, progress DOUBLE PRECISION, message TEXT, '
+            'result TEXT, error TEXT, pid INTEGER, created_at DOUBLE PRECISION, '
+            'started_at DOUBLE PRECISION, finished_at DOUBLE PRECISION, updated_at DOUBLE PRECISION)'))
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS jobs_job_key ON "{JOBS_TABLE}" (job_key)'))
+        # At most one queued or running job per key.
+        conn.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS jobs_pending_key ON "{JOBS_TABLE}" (job_key) '
+                          f"WHERE status IN ('{QUEUED}', '{RUNNING}')"))
+
+
+def job_key(kind, params, version=None):
+    """Deduplication key of a job: a hash of its kind, parameters and data version."""
+    payload = json.dumps([kind, params, version], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _timestamp(value):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(value)) if value is not None else None
+
+
+class JobContext:
+    """Handed to a running job: progress reporting and the worker's process pool."""
+
+    # Progress is written to the database at most this often (seconds).
+    PROGRESS_INTERVAL = 0.5
+
+    def __init__(self, manager, job_id):
+        self.manager = manager
+        self.job_id = job_id
+        self._last_update = 0.0
+
+    def progress(self, fraction, message=None):
+        """Reports progress (0..1); also serves as the job's heartbeat."""
+        now = time.monotonic()
+        if fraction < 1.0 and now - self._last_update < self.PROGRESS_INTERVAL:
+            return
+        self._last_update = now
+        self.manager._update(self.job_id, progress=max(0.0, min(float(fraction), 1.0)), message=message)
+
+    def run_cpu(self, func, *args):
+        """Runs func(*args) in the process pool (inline when JOB_PROCESSES=0) and returns its result."""
+        pool = self.manager.process_pool()
+        return func(*args) if pool is None else pool.submit(func, *args).result()
+
+    def imap_cpu(self, func, arg_tuples, message=None):
+        """
+        map_cpu() as a generator: yields the results in the order of the arguments, with
+        at most two tasks per process submitted ahead of the one awaited, so a caller that
+        folds the results as they come (e.g. montecarlo.merge) holds only a few at a time.
+        """
+        arg_tuples = list(arg_tuples)
+        pool = self.manager.process_pool()
+        if pool is None:
+            for i, args in enumerate(arg_tuples):
+                result = func(*args)
+                self.progress((i + 1) / len(arg_tuples), message)
+                yield result
+            return
+        ahead = 2 * self.manager.process_count()
+        futures = deque(pool.submit(func, *args) for args in arg_tuples[:ahead])
+        for i in range(len(arg_tuples)):
+            result = futures.popleft().result()
+            if i + ahead < len(arg_tuples):
+                futures.append(pool.submit(func, *arg_tuples[i + ahead]))
+            self.progress((i + 1) / len(arg_tuples), message)
+            yield result
+
+    def map_cpu(self, func, arg_tuples, message=None):
+        """
+        Runs func(*args) for every tuple of arguments in the process pool, reporting
+        progress as they complete. Returns the results in the order of the arguments.
+        """
+        arg_tuples = list(arg_tuples)
+        results = [None] * len(arg_tuples)
+        pool = self.manager.process_pool()
+        if pool is None:
+            for i, args in enumerate(arg_tuples):
+                results[i] = func(*args)
+                self.progress((i + 1) / len(arg_tuples), message)
+            return results
+        futures = {pool.submit(func, *args): i for i, args in enumerate(arg_tuples)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            self.progress(done / len(arg_tuples), message)
+        return results
+
+
+class JobManager:
+    """
+    Submits, runs and reports on jobs. Handlers are registered per kind and called as
+    handler(params, context) on a thread of the worker's job pool (JOB_THREADS
+    concurrent jobs); they return a JSON-serializable result or raise to fail the job.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self._reuse = {}
+        self._lock = threading.Lock()
+        self._threads = None
+        self._processes = None
+        self._pid = None
+        self._running = set()
+
+    def register(self, kind, handler, reuse_results=True):
+        """
+        Registers the handler of a job kind. With reuse_results=False (e.g. ingestion,
+        which should re-run when asked to) only queued or running jobs are deduplicated.
+        """
+        self._handlers[kind] = handler
+        self._reuse[kind] = reuse_results
+
+    def _pools(self):
+        # Created lazily, and again after a fork, so every gunicorn worker has its own pools.
+        with self._lock:
+            if self._pid != os.getpid():
+                self._threads = ThreadPoolExecutor(max_workers=_env_int("JOB_THREADS", 4),
+                                                   thread_name_prefix="job")
+                self._processes = None
+                self._running = set()
+                self._pid = os.getpid()
+            return self._threads
+
+    def process_count(self):
+        """Processes of the worker's process pool (JOB_PROCESSES, default min(2, CPUs))."""
+        return _env_int("JOB_PROCESSES", min(2, os.cpu_count() or 1))
+
+    def process_pool(self):
+        """The worker's process pool for CPU-bound job steps, or None when JOB_PROCESSES=0."""
+        self._pools()
+        with self._lock:
+            if self._processes is None:
+                workers = self.process_count()
+                if workers <= 0:
+                    return None
+                # Spawned rather than forked: the web worker has threads (request handlers,
+                # refresher, job threads) whose locks must not be copied into the children.
+                self._processes = ProcessPoolExecutor(max_workers=workers,
+                                                      mp_context=multiprocessing.get_context("spawn"))
+            return self._processes
+
+    def submit(self, kind, params, version=None, force=False):
+        """
+        Submits a job and returns (job, created). An identical job (same kind, parameters
+        and data version) that is pending, or has succeeded and may be reused, is
+        returned instead of starting a new one; with force=True only a pending one is.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"unknown job kind '{kind}'")
+        ensure_schema()
+        self._prune()
+        key = job_key(kind, params, version)
+        if not force:
+            existing = self._find(key, reuse_results=self._reuse[kind])
+            if existing is not None:
+                return existing, False
+        job_id = uuid.uuid4().hex
+        for attempt in range(3):
+            try:
+                self._insert(job_id, kind, key, params)
+                break
+            except IntegrityError:
+                # An identical job became pending since the lookup above (the unique index
+                # on pending keys makes the check and the insert atomic). It is returned,
+                # unless it has finished or was found abandoned in the meantime.
+                existing = self._find(key, reuse_results=False)
+                if existing is not None:
+                    return existing, False
+                if attempt == 2:
+                    raise
+        threads = self._pools()
+        with self._lock:
+            self._running.add(job_id)
+        threads.submit(self._run, job_id, kind, params)
+        return self.get(job_id), True
+
+    def _insert(self, job_id, kind, key, params):
+        now = time.time()
+        with database.get_engine().begin() as conn:
+            conn.execute(text(
+                f'INSERT INTO "{JOBS_TABLE}" (id, kind, job_key, params, status, progress, pid, created_at, updated_at) '
+                'VALUES (:id, :kind, :key, :params, :status, 0, :pid, :now, :now)'),
+                {"id": job_id, "kind": kind, "key": key, "params": json.dumps(params, default=str),
+                 "status": QUEUED, "pid": os.getpid(), "now": now})
+
+    def _find(self, key, reuse_results=True):
+        statuses = PENDING + (SUCCEEDED,) if reuse_results else PENDING
+        with database.get_engine().connect() as conn:
+            rows = conn.execute(text(
+                f'SELECT id FROM "{JOBS_TABLE}" WHERE job_key = :key ORDER BY created_at DESC'), {"key": key}).fetchall()
+        for (job_id,) in rows:
+            job = self.get(job_id)
+            if job is not None and job["status"] in statuses:
+                return job
+        return None
+
+    def _run(self, job_id, kind, params):
+        self._update(job_id, status=RUNNING, started_at=time.time(), pid=os.getpid())
+        try:
+            result = self._handlers[kind](params, JobContext(self, job_id))
+            self._update(job_id, status=SUCCEEDED, progress=1.0, finished_at=time.time(),
+                         result=json.dumps(httpcache.json_safe(result)))
+        except Exception as e:
+            logging.error(f"Job {job_id} ({kind}) failed: {e}")
+            self._update(job_id, status=FAILED, finished_at=time.time(), error=str(e) or type(e).__name__)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+    def _update(self, job_id, **fields):
+        fields.setdefault("updated_at", time.time())
+        assignments = ", ".join(f"{name} = :{name}" for name in fields)
+        with database.get_engine().begin() as conn:
+            conn.execute(text(f'UPDATE "{JOBS_TABLE}" SET {assignments} WHERE id = :id'), dict(fields, id=job_id))
+
+    def _row(self, job_id):
+        ensure_schema()
+        with database.get_engine().connect() as conn:
+            row = conn.execute(text(f'SELECT * FROM "{JOBS_TABLE}" WHERE id = :id'), {"id": job_id}).mappings().fetchone()
+        return dict(row) if row is not None else None
+
+    def get(self, job_id):
+        """
+        Status of a job: id, kind, params, status, progress, message, error and
+        timestamps, or None for an unknown id. A pending job whose worker has not
+        reported for JOB_STALE_AFTER seconds is marked as failed.
+        """
+        row = self._row(job_id)
+        if row is None:
+            return None
+        stale_after = _env_seconds("JOB_STALE_AFTER", 3600.0)
+        with self._lock:
+            local = job_id in self._running and self._pid == os.getpid()
+        if row["status"] in PENDING and not local and time.time() - (row["updated_at"] or 0) > stale_after:
+            error = "job was abandoned: its worker stopped reporting progress"
+            self._update(job_id, status=FAILED, finished_at=time.time(), error=error)
+            row.update(status=FAILED, error=error)
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "params": json.loads(row["params"]) if row["params"] else {},
+            "status": row["status"],
+            "progress": row["progress"],
+            "message": row["message"],
+            "error": row["error"],
+            "created_at": _timestamp(row["created_at"]),
+            "started_at": _timestamp(row["started_at"]),
+            "finished_at": _timestamp(row["finished_at"]),
+        }
+
+    def result(self, job_id):
+        """(job, result) for a job; the result is None until the job has succeeded."""
+        job = self.get(job_id)
+        if job is None or job["status"] != SUCCEEDED:
+            return job, None
+        row = self._row(job_id)
+        return job, json.loads(row["result"]) if row["result"] else None
+
+    def wait(self, job_id, timeout=None, poll=0.05):
+        """Blocks until a job has finished (or timeout seconds have passed) and returns its status."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] not in PENDING:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+            time.sleep(poll)
+
+    def _prune(self):
+        # Finished jobs (and their results) are kept for JOB_RETENTION seconds.
+        cutoff = time.time() - _env_seconds("JOB_RETENTION", 7 * 86400.0)
+        with database.get_engine().begin() as conn:
+            conn.execute(text(f'DELETE FROM "{JOBS_TABLE}" WHERE status IN (:ok, :failed) AND finished_at < :cutoff'),
+                         {"ok": SUCCEEDED, "failed": FAILED, "cutoff": cutoff})
+
+
+# Process-wide job manager; job kinds are registered by the app.
+manager = JobManager()
@@ -0,0 +1,225 @@
+"""
+Monte Carlo projections of a portfolio's value.
+
+Future daily returns of the assets are simulated over a horizon, either by
+bootstrapping whole days of historical returns (which keeps the assets' co-movement and
+fat tails) or by drawing from a multivariate normal distribution with a given mean and
+covariance (e.g. the shrunk training covariance used by the optimizer). The portfolio
+is held from its initial weights (buy and hold, like the predicted values of the test
+window) or rebalanced to them daily; weights summing to less than one keep the rest in
+cash. The result is the distribution of the investment's value: percentile bands over
+the horizon and statistics of the final value.
+
+Paths are generated in chunks, so at most one chunk's paths x days x assets returns are
+in memory. Each chunk draws from its own random stream spawned from one seed, so a
+projection depends only on the seed and the chunk size, not on the order in which
+chunks run or on how they are spread over processes (see chunks() and merge(), used
+with a process pool).
+
+A chunk is reduced before it is returned: the values at each band day are counted on a
+histogram grid shared by all chunks (set from a small pilot simulation), and the final
+values are summed. Merging adds the counts, so memory does not grow with the number of
+paths; percentiles are interpolated within the histogram's bins.
+"""
+import os
+import numpy as np
+
+METHODS = ("bootstrap", "normal")
+
+# Percentiles of the value reported by default.
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Days of the horizon at which percentile bands are reported (at most).
+BAND_POINTS = 64
+
+# Bins of the histogram of each band day's values, between the grid's bounds (values
+# outside them are counted in an underflow and an overflow bin).
+HISTOGRAM_BINS = 1024
+
+# Paths simulated up front to place the histogram grid.
+PILOT_PATHS = 1000
+
+
+def chunk_values():
+    """Simulated returns held in memory at once (MONTE_CARLO_CHUNK_VALUES, default 4 million)."""
+    return int(os.getenv("MONTE_CARLO_CHUNK_VALUES", "4000000"))
+
+
+def normal_factor(cov):
+    """
+    A matrix F with F @ F.T = cov, for drawing correlated normal returns. Uses the
+    eigendecomposition with negative eigenvalues clipped, so singular or slightly
+    indefinite covariance matrices are accepted.
+    """
+    cov = np.atleast_2d(np.asarray(cov, dtype=np.float64))
+    eigenvalues, eigenvectors = np.linalg.eigh((cov + cov.T) / 2)
+    return eigenvectors * np.sqrt(np.clip(eigenvalues, 0.0, None))
+
+
+def band_days(horizon, points=BAND_POINTS):
+    """Days (1-based, ending with the horizon) at which percentile bands are reported."""
+    return np.unique(np.linspace(1, horizon, min(horizon, points)).round().astype(np.intp))
+
+
+def simulate(model, weights, horizon, paths, rng, rebalance=False, days=None):
+    """
+    Simulates `paths` portfolio paths over `horizon` days. `model` is ("bootstrap",
+    history) with a days x assets matrix of historical returns, or ("normal", mean,
+    factor) with per-asset mean returns and a normal_factor() of the covariance.
+    Returns the portfolio values (starting from 1) as a paths x days array, at the
+    given 1-based days (default every day).
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    if model[0] == "bootstrap":
+        history = model[1]
+        returns = history[rng.integers(0, len(history), size=(paths, horizon))]
+    elif model[0] == "normal":
+        mean, factor = model[1], model[2]
+        draws = rng.standard_normal((paths * horizon, factor.shape[1]))
+        returns = (draws @ factor.T).reshape(paths, horizon, -1)
+        returns += mean
+    else:
+        raise ValueError(f"Unknown simulation method '{model[0]}' (one of {', '.join(METHODS)})")
+    if rebalance:
+        values = np.cumprod(1.0 + returns @ weights, axis=1)
+    else:
+        values = np.cumprod(1.0 + returns, axis=1) @ weights + (1.0 - weights.sum())
+    return values if days is None else values[:, np.asarray(days) - 1]
+
+
+def histogram_grid(model, weights, horizon, rng, rebalance=False, days=None, paths=PILOT_PATHS, chunk_paths=None):
+    """
+    (low, high) bounds of the histogram of the values at each of `days`, from a pilot
+    simulation of `paths` paths (in pieces of chunk_paths): the range of the pilot's
+    values widened by half of it on both sides.
+    """
+    chunk_paths = chunk_paths or paths
+    low = high = None
+    for offset in range(0, paths, chunk_paths):
+        values = simulate(model, weights, horizon, min(chunk_paths, paths - offset), rng, rebalance, days)
+        low = values.min(axis=0) if low is None else np.minimum(low, values.min(axis=0))
+        high = values.max(axis=0) if high is None else np.maximum(high, values.max(axis=0))
+    margin = np.maximum((high - low) / 2, np.maximum(np.abs(low), 1.0) * 1e-6)
+    return low - margin, high + margin
+
+
+def summarize(values, grid):
+    """
+    Reduces a paths x days array of run values to what merge() needs: the number of
+    paths, the sum of the final values, the number of final values below 1, the
+    per-day minimum and maximum and the per-day counts on the histogram grid
+    (underflow bin, HISTOGRAM_BINS bins, overflow bin).
+    """
+    low, high = grid
+    bins = HISTOGRAM_BINS
+    width = (high - low) / bins
+    index = np.floor((values - low) / width)
+    index = np.where(values < low, -1, np.minimum(index, bins)).astype(np.intp) + 1
+    index += np.arange(values.shape[1]) * (bins + 2)
+    counts = np.bincount(index.ravel(), minlength=values.shape[1] * (bins + 2)).reshape(values.shape[1], bins + 2)
+    final = values[:, -1]
+    return {"paths": len(values), "sum": float(final.sum()), "losses": int((final < 1.0).sum()),
+            "min": values.min(axis=0), "max": values.max(axis=0), "counts": counts, "grid": grid}
+
+
+def run_chunk(model, weights, horizon, paths, seed, rebalance, days, grid):
+    """
+    One chunk of simulate() with its own random stream (a SeedSequence or an int seed),
+    reduced on the histogram grid (see summarize).
+    """
+    return summarize(simulate(model, weights, horizon, paths, np.random.default_rng(seed), rebalance, days), grid)
+
+
+def chunks(model, weights, horizon, paths, seed=None, rebalance=False, chunk_paths=None):
+    """
+    Argument tuples of run_chunk() covering `paths` paths, each with a random stream
+    spawned from `seed`, and the histogram grid shared by all of them (placed by a
+    pilot simulation with a stream of its own). Chunks hold at most
+    MONTE_CARLO_CHUNK_VALUES simulated returns unless chunk_paths is given.
+    """
+    assets = len(np.asarray(weights))
+    if chunk_paths is None:
+        chunk_paths = max(1, chunk_values() // max(1, horizon * assets))
+    sizes = [min(chunk_paths, paths - offset) for offset in range(0, paths, chunk_paths)]
+    *streams, pilot = np.random.SeedSequence(seed).spawn(len(sizes) + 1)
+    days = band_days(horizon)
+    grid = histogram_grid(model, weights, horizon, np.random.default_rng(pilot), rebalance, days,
+                          min(paths, PILOT_PATHS), chunk_paths)
+    return [(model, weights, horizon, size, stream, rebalance, days, grid) for size, stream in zip(sizes, streams)]
+
+
+def _percentiles(counts, low, high, minimum, maximum, total, percentiles):
+    # Percentiles of one day's values from their histogram, interpolated linearly within
+    # bins; the underflow and overflow bins reach to the smallest and largest value.
+    edges = np.concatenate([[min(minimum, low)], np.linspace(low, high, HISTOGRAM_BINS + 1), [max(maximum, high)]])
+    cumulative = np.concatenate([[0], np.cumsum(counts)])
+    return np.interp(np.asarray(percentiles, dtype=np.float64) / 100 * total, cumulative, edges)
+
+
+def merge(parts, horizon, investment=1.0, percentiles=PERCENTILES):
+    """
+    Summarizes the run_chunk() results of a projection for an investment: the value's
+    percentile bands at band_days(horizon), and the mean, percentiles and probability
+    of a loss of the final value. `parts` may be any iterable (e.g. results arriving
+    from a process pool); each is folded in as it comes, so only the merged histograms
+    are held.
+    """
+    merged = None
+    for part in parts:
+        if merged is None:
+            merged = dict(part, counts=part["counts"].copy())
+            continue
+        merged["paths"] += part["paths"]
+        merged["sum"] += part["sum"]
+        merged["losses"] += part["losses"]
+        merged["counts"] += part["counts"]
+        merged["min"] = np.minimum(merged["min"], part["min"])
+        merged["max"] = np.maximum(merged["max"], part["max"])
+    total = merged["paths"]
+    low, high = merged["grid"]
+    bands = np.array([_percentiles(merged["counts"][day], low[day], high[day], merged["min"][day],
+                                   merged["max"][day], total, percentiles)
+                      for day in range(len(low))]).T * investment
+    return {
+        "paths": total,
+        "days": band_days(horizon).tolist(),
+        "bands": {str(p): band.tolist() for p, band in zip(percentiles, bands)},
+        "final": {
+            "mean": merged["sum"] / total * investment,
+            "percentiles": {str(p): float(band[-1]) for p, band in zip(percentiles, bands)},
+            "probability_of_loss": merged["losses"] / total,
+        },
+    }
+
+
+def scale(projection, investment):
+    """A merge() summary of a unit investment (investment=1) scaled to another investment."""
+    return {
+        "paths": projection["paths"],
+        "days": projection["days"],
+        "bands": {p: [value * investment for value in band] for p, band in projection["bands"].items()},
+        "final": {
+            "mean": projection["final"]["mean"] * investment,
+            "percentiles": {p: value * investment for p, value in projection["final"]["percentiles"].items()},
+            "probability_of_loss": projection["final"]["probability_of_loss"],
+        },
+    }
+
+
+def project(model, weights, horizon, paths, investment=1.0, seed=None, rebalance=False,
+            percentiles=PERCENTILES, chunk_paths=None, executor=None):
+    """
+    Projects an investment in a portfolio over `horizon` days with `paths` simulated
+    paths (see simulate() for the model). Chunks run in turn, or on `executor` (e.g. a
+    ProcessPoolExecutor) when given; either way the result is the same for one seed.
+    """
+    if model[0] not in METHODS:
+        raise ValueError(f"Unknown simulation method '{model[0]}' (one of {', '.join(METHODS)})")
+    if horizon < 1 or paths < 1:
+        raise ValueError("horizon and paths must be positive")
+    arguments = chunks(model, weights, horizon, paths, seed, rebalance, chunk_paths)
+    if executor is None:
+        parts = (run_chunk(*args) for args in arguments)
+    else:
+        parts = executor.map(run_chunk, *zip(*arguments))
+    return merge(parts, horizon, investment, percentiles)
@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+
+
+def frame_dates(df):
+    """
+    Bar timestamps of a processed frame as UTC-naive datetimes. Freshly processed frames
+    are indexed by a tz-aware Date, frames read back from the database carry a Date
+    column (tz-aware on PostgreSQL, UTC-naive on SQLite); all of them compare equal here.
+    """
+    dates = pd.DatetimeIndex(df['Date'] if 'Date' in df.columns else df.index)
+    if dates.tz is not None:
+        dates = dates.tz_convert("UTC").tz_localize(None)
+    return dates
+
+
+def aligned_columns(frames, columns, dtype=np.float64):
+    """
+    Aligns several columns of many processed frames on the union of their dates.
+    Returns (dates, names, {column: values}) where each values array is dates x assets
+    with NaN where an asset has no bar. The dates are aligned once for all columns, and
+    each asset is placed with one get_indexer call, so the cost grows linearly with the
+    number of assets.
+    """
+    names = list(frames)
+    if not names:
+        return pd.DatetimeIndex([]), names, {column: np.empty((0, 0), dtype=dtype) for column in columns}
+    dates_by_asset = [frame_dates(frames[name]) for name in names]
+    dates = dates_by_asset[0]
+    for other in dates_by_asset[1:]:
+        if not dates.equals(other):
+            dates = dates.union(other)
+    values = {column: np.full((len(dates), len(names)), np.nan, dtype=dtype) for column in columns}
+    for i, (name, asset_dates) in enumerate(zip(names, dates_by_asset)):
+        rows = np.arange(len(dates)) if asset_dates is dates else dates.get_indexer(asset_dates)
+        for column in columns:
+            values[column][rows, i] = frames[name][column].to_numpy(dtype=dtype)
+    return dates, names, values
+
+
+def returns_matrix(frames, column='Daily_Return', dtype=np.float64):
+    """
+    Aligns one column of many processed frames on the union of their dates.
+    Returns (dates, names, values) where values is a dates x assets NumPy array with NaN
+    where an asset has no bar.
+    """
+    dates, names, values = aligned_columns(frames, [column], dtype=dtype)
+    return dates, names, values[column]
+
+
+def complete_rows(values):
+    """Rows (dates) on which every asset has a value, i.e. DataFrame.dropna() on the matrix."""
+    return values[~np.isnan(values).any(axis=1)]
+
+
+def correlation(values):
+    """Pearson correlation of the columns of a dates x assets matrix over complete rows."""
+    values = complete_rows(values)
+    if values.shape[1] == 1:
+        return np.ones((1, 1))
+    if len(values) < 2:
+        return np.full((values.shape[1], values.shape[1]), np.nan)
+    return np.corrcoef(values, rowvar=False)
+
+
+def column_stats(returns, cumulative):
+    """
+    Per-asset mean and sample standard deviation of the returns (ignoring NaN, like
+    pandas) and the last available cumulative return, for dates x assets matrices.
+    """
+    counts = (~np.isnan(returns)).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nansum(returns, axis=0) / counts
+        squares = np.nansum((returns - mean) ** 2, axis=0)
+        std = np.sqrt(squares / (counts - 1))
+    std[counts < 2] = np.nan
+    # Last non-NaN cumulative return of each column.
+    valid = ~np.isnan(cumulative)
+    last_row = len(cumulative) - 1 - np.argmax(valid[::-1], axis=0)
+    last = cumulative[last_row, np.arange(cumulative.shape[1])] if len(cumulative) else np.full(cumulative.shape[1], np.nan)
+    return mean, std, last
+
+
+class ReturnsPanel:
+    """
+    Daily and cumulative returns of many assets aligned on their dates: dense dates x
+    assets arrays indexed by asset name and date, with NaN where an asset has no bar.
+    A panel is built once per data set (see from_frames) and shared read-only by the
+    analytics. The validity mask, the complete rows, column statistics and the
+    correlation matrix are computed on first use and kept with the panel.
+
+    Date-range slices (between) are views. Asset subsets (select) are views when the
+    assets are adjacent, and otherwise copy just the selected columns; column
+    statistics already computed carry over to subsets.
+    """
+
+    def __init__(self, dates, names, returns, cumulative=None):
+        self.dates = dates
+        self.names = list(names)
+        self.returns = returns
+        self.cumulative = cumulative
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        self._cached = {}
+
+    @classmethod
+    def from_frames(cls, frames):
+        """Aligns the Daily_Return and Cumulative_Return columns of processed frames keyed by asset."""
+        dates, names, values = aligned_columns(frames, ['Daily_Return', 'Cumulative_Return'])
+        return cls(dates, names, values['Daily_Return'], values['Cumulative_Return'])
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    @property
+    def shape(self):
+        return self.returns.shape
+
+    def _memo(self, name, compute):
+        # Panels are read-only, so a result is computed at most once (a concurrent first
+        # use may compute it twice, which is harmless).
+        value = self._cached.get(name)
+        if value is None:
+            value = self._cached[name] = compute()
+        return value
+
+    @property
+    def mask(self):
+        """Boolean dates x assets array: True where an asset has a return."""
+        return self._memo("mask", lambda: ~np.isnan(self.returns))
+
+    @property
+    def complete_mask(self):
+        """Boolean per date: True where every asset has a return."""
+        return self._memo("complete_mask", lambda: self.mask.all(axis=1))
+
+    def complete_returns(self):
+        """The rows (dates) on which every asset has a return, like DataFrame.dropna()."""
+        return self._memo("complete_returns", lambda: self.returns[self.complete_mask])
+
+    def stats(self):
+        """
+        Per-asset (mean, sample standard deviation, last cumulative return); see
+        column_stats(). Without cumulative returns the last is NaN.
+        """
+        def compute():
+            cumulative = self.cumulative if self.cumulative is not None else np.full(self.shape, np.nan)
+            return column_stats(self.returns, cumulative)
+        return self._memo("stats", compute)
+
+    def correlation(self):
+        """Pearson correlation of the assets over the complete rows."""
+        return self._memo("correlation", lambda: correlation(self.returns))
+
+    def positions(self, names):
+        """Column positions of asset names; raises KeyError for an unknown name."""
+        return [self._positions[name] for name in names]
+
+    def select(self, names):
+        """The panel restricted to the named assets, in the order given."""
+        names = list(names)
+        positions = self.positions(names)
+        if positions and positions == list(range(positions[0], positions[0] + len(positions))):
+            columns = slice(positions[0], positions[0] + len(positions))
+        else:
+            columns = positions
+        cumulative = self.cumulative[:, columns] if self.cumulative is not None else None
+        subset = ReturnsPanel(self.dates, names, self.returns[:, columns], cumulative)
+        if "stats" in self._cached:
+            subset._cached["stats"] = tuple(values[columns] for values in self._cached["stats"])
+        return subset
+
+    def between(self, start=None, end=None):
+        """The panel over the dates in [start, end) (UTC-naive timestamps or date strings)."""
+        first = 0 if start is None else int(self.dates.searchsorted(pd.Timestamp(start), side="left"))
+        last = len(self.dates) if end is None else int(self.dates.searchsorted(pd.Timestamp(end), side="left"))
+        rows = slice(first, max(first, last))
+        cumulative = self.cumulative[rows] if self.cumulative is not None else None
+        return ReturnsPanel(self.dates[rows], self.names, self.returns[rows], cumulative)
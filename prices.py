@@ -0,0 +1,197 @@
+import io
+import logging
+import os
+import re
+import numpy as np
+import pandas as pd
+from sqlalchemy import text, bindparam, DateTime
+import bars
+import database
+import cache
+import processing
+
+# Long-format price table shared by every ticker, asset class and window. Windows are
+# just date ranges over it, so overlapping windows (train/test) share their rows.
+PRICES_TABLE = "prices"
+COLUMNS = ["ticker", "asset_class", "date", "open", "high", "low", "close", "volume", "daily_return"]
+_SOURCE_COLUMNS = {"Open": "open", "High": "high", "Low": "low", "Close": "close",
+                   "Volume": "volume", "Daily_Return": "daily_return"}
+_LEGACY_TABLE = re.compile(r"^(stock|asset)_(train|test)_(.+)$")
+
+
+def normalized_enabled():
+    """The normalized layout is enabled with STORAGE_LAYOUT=normalized (default: tables)."""
+    return os.getenv("STORAGE_LAYOUT", "tables").lower() == "normalized"
+
+
+def ensure_schema():
+    """Creates the prices table; its primary key doubles as the (ticker, date) index."""
+    with database.get_engine().begin() as conn:
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{PRICES_TABLE}" ('
+            'ticker VARCHAR(32) NOT NULL, asset_class VARCHAR(16) NOT NULL, '
+            'date TIMESTAMP WITH TIME ZONE NOT NULL, '
+            'open DOUBLE PRECISION, high DOUBLE PRECISION, low DOUBLE PRECISION, '
+            'close DOUBLE PRECISION, volume DOUBLE PRECISION, daily_return DOUBLE PRECISION, '
+            'PRIMARY KEY (ticker, date))'))
+
+
+def to_long_frame(df, ticker, asset_class):
+    """
+    Converts a per-ticker price frame (fetched, or read back from a legacy table) into
+    the long format of the prices table. Daily returns are computed from Close when the
+    frame does not carry them yet. The first bar of a fetch is kept without a return
+    (copy_frame() keeps a return stored for it by an earlier, longer fetch), so a window
+    read back holds every bar that was fetched for it.
+    """
+    if "Date" in df.columns:
+        df = df.set_index("Date")
+    long_df = pd.DataFrame({"date": pd.to_datetime(df.index, utc=True)})
+    for source, target in _SOURCE_COLUMNS.items():
+        long_df[target] = df[source].to_numpy() if source in df.columns else np.nan
+    if "Daily_Return" not in df.columns:
+        long_df["daily_return"] = df["Close"].pct_change().to_numpy()
+    long_df["ticker"] = ticker
+    long_df["asset_class"] = asset_class
+    return long_df.loc[long_df["close"].notna(), COLUMNS].reset_index(drop=True)
+
+
+def coverage_key(ticker):
+    """Key of a ticker's fetched date range in the ingest state (see ingest.py)."""
+    return f"{PRICES_TABLE}/{ticker}"
+
+
+def copy_frame(long_df):
+    """
+    Bulk-loads long-format rows into the prices table, replacing rows with the same
+    (ticker, date); a missing daily return does not replace a stored one. On PostgreSQL
+    the rows are streamed with COPY from an in-memory CSV buffer into a temporary staging
+    table and merged with a single INSERT ... ON CONFLICT. Returns the number of rows written.
+    """
+    if long_df.empty:
+        return 0
+    long_df = long_df[COLUMNS].drop_duplicates(subset=["ticker", "date"], keep="last")
+    ensure_schema()
+    engine = database.get_engine()
+    if engine.dialect.name == "postgresql":
+        buffer = io.StringIO()
+        long_df.to_csv(buffer, index=False, header=False, date_format="%Y-%m-%d %H:%M:%S%z")
+        buffer.seek(0)
+        columns = ", ".join(COLUMNS)
+        updates = ", ".join(f'{c} = COALESCE(EXCLUDED.{c}, "{PRICES_TABLE}".{c})' if c == "daily_return"
+                            else f"{c} = EXCLUDED.{c}" for c in COLUMNS if c not in ("ticker", "date"))
+        raw = engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                cur.execute(f'CREATE TEMP TABLE prices_staging (LIKE "{PRICES_TABLE}") ON COMMIT DROP')
+                cur.copy_expert(f"COPY prices_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+                cur.execute(f'INSERT INTO "{PRICES_TABLE}" ({columns}) SELECT {columns} FROM prices_staging '
+                            f'ON CONFLICT (ticker, date) DO UPDATE SET {updates}')
+            raw.commit()
+        finally:
+            raw.close()
+    else:
+        # Portable fallback (e.g. SQLite in tests): delete the overlapping keys, then append.
+        with engine.begin() as conn:
+            bounds = (bindparam("s", type_=DateTime(timezone=True)), bindparam("e", type_=DateTime(timezone=True)))
+            where = 'WHERE ticker = :t AND date >= :s AND date <= :e'
+            stored = text(f'SELECT date, daily_return FROM "{PRICES_TABLE}" {where} AND daily_return IS NOT NULL')
+            delete = text(f'DELETE FROM "{PRICES_TABLE}" {where}')
+            groups = []
+            for ticker, group in long_df.groupby("ticker"):
+                params = {"t": ticker, "s": group["date"].min().to_pydatetime(),
+                          "e": group["date"].max().to_pydatetime()}
+                if group["daily_return"].isna().any():
+                    rows = conn.execute(stored.bindparams(*bounds), params).fetchall()
+                    if rows:
+                        returns = pd.Series([row[1] for row in rows],
+                                            index=pd.to_datetime([row[0] for row in rows], utc=True))
+                        returns = returns[~returns.index.duplicated()]
+                        group = group.assign(daily_return=group["daily_return"].fillna(
+                            pd.Series(returns.reindex(group["date"]).to_numpy(), index=group.index)))
+                conn.execute(delete.bindparams(*bounds), params)
+                groups.append(group)
+            pd.concat(groups).to_sql(PRICES_TABLE, conn, if_exists="append", index=False, method="multi",
+                                     chunksize=1000)
+    cache.frame_cache.invalidate_table(PRICES_TABLE)
+    logging.info(f"Copied {len(long_df)} rows into table '{PRICES_TABLE}'.")
+    return len(long_df)
+
+
+def load_prices(tickers, start, end):
+    """Loads the rows of every ticker in [start, end) with a single query, ordered by ticker and date."""
+    if not tickers or not database.table_exists(PRICES_TABLE):
+        return pd.DataFrame(columns=COLUMNS)
+    query = text(f'SELECT {", ".join(COLUMNS)} FROM "{PRICES_TABLE}" '
+                 'WHERE ticker IN :tickers AND date >= :start AND date < :end ORDER BY ticker, date')
+    query = query.bindparams(bindparam("tickers", expanding=True),
+                             bindparam("start", type_=DateTime(timezone=True)),
+                             bindparam("end", type_=DateTime(timezone=True)))
+    params = {"tickers": list(tickers), "start": pd.Timestamp(start, tz="UTC").to_pydatetime(),
+              "end": pd.Timestamp(end, tz="UTC").to_pydatetime()}
+    df = pd.read_sql(query, database.get_engine(), params=params)
+    df["date"] = pd.to_datetime(df["date"], utc=True)
+    return df
+
+
+def returns_matrix(long_df):
+    """Pivots long-format rows into the wide daily returns matrix (dates x tickers)."""
+    return long_df.pivot(index="date", columns="ticker", values="daily_return").sort_index()
+
+
+def to_processed_frames(long_df):
+    """
+    Splits long-format rows (ordered by ticker and date, as load_prices() returns them)
+    back into per-ticker frames shaped like the per-table layout (Date column, OHLCV,
+    Daily_Return, Cumulative_Return, Predicted_Direction). The rows are processed like a
+    fetch of the window in the per-table layout: returns are taken between the bars
+    read, so each ticker's first bar has none and is dropped, and cumulative returns are
+    compounded from there. The derived columns are computed for all tickers in one
+    vectorized pass before splitting.
+    """
+    df = long_df.rename(columns={"date": "Date", **{v: k for k, v in _SOURCE_COLUMNS.items()}})
+    tickers = df["ticker"].to_numpy()
+    returns = processing.daily_returns(df["Close"].to_numpy(dtype=np.float64))
+    returns[1:][tickers[1:] != tickers[:-1]] = np.nan
+    keep = ~np.isnan(returns)
+    df = df.assign(Daily_Return=returns)[keep]
+    returns = returns[keep]
+    df = df.assign(Cumulative_Return=processing.cumulative_by_group(returns, df["ticker"]),
+                   Predicted_Direction=processing.direction(returns))
+    frames = {}
+    for ticker, group in df.groupby("ticker", sort=False):
+        frames[ticker] = group.drop(columns=["ticker", "asset_class"]).reset_index(drop=True)
+    return frames
+
+
+def migrate_legacy_tables(asset_tickers=None):
+    """
+    Copies every legacy per-ticker table of daily bars (stock_train_AAPL, asset_test_Gold,
+    ...) into the prices table; tables of other intervals are skipped. `asset_tickers` maps benchmark names used in legacy asset table
+    names to their tickers (e.g. {'Gold': 'GLD'}). Returns the number of rows copied.
+    """
+    asset_tickers = asset_tickers or {}
+    total = 0
+    for table_name in database.list_tables():
+        match = _LEGACY_TABLE.match(table_name)
+        if not match:
+            continue
+        kind, _, name = match.groups()
+        if name.partition("_")[0] in bars.INTERVALS:
+            # Intraday tables (stock_train_5m_AAPL); the prices table holds daily bars only.
+            continue
+        ticker = asset_tickers.get(name, name) if kind == "asset" else name
+        df = database.read_table(table_name)
+        if not df.empty:
+            total += copy_frame(to_long_frame(df, ticker, kind))
+    return total
+
+
+if __name__ == "__main__":
+    # python prices.py migrate -- one-off copy of the legacy per-ticker tables.
+    import sys
+    from app import benchmarks
+    if sys.argv[1:] == ["migrate"]:
+        print(f"Migrated {migrate_legacy_tables(benchmarks)} rows into '{PRICES_TABLE}'.")
+    else:
+        print("usage: python prices.py migrate")
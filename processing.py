@@ -0,0 +1,93 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Predicted_Direction is stored as a two-value categorical rather than object strings;
+# comparisons such as `== 'Increase'` keep working.
+DIRECTION_CATEGORIES = ["Decrease", "Increase"]
+
+
+def default_dtype():
+    """Float dtype of processed frames, set with PROCESS_DTYPE (float64 or float32)."""
+    return np.dtype(os.getenv("PROCESS_DTYPE", "float64"))
+
+
+def daily_returns(close):
+    """Simple returns of a 1-D or 2-D (dates x tickers) close array; the first row is NaN."""
+    close = np.asarray(close, dtype=np.float64)
+    returns = np.empty_like(close)
+    returns[:1] = np.nan
+    np.divide(close[1:], close[:-1], out=returns[1:])
+    returns[1:] -= 1
+    return returns
+
+
+def cumulative_returns(returns):
+    """Compounded returns along the first axis; NaN returns count as flat days."""
+    growth = np.where(np.isnan(returns), 1.0, 1.0 + returns)
+    return np.cumprod(growth, axis=0) - 1
+
+
+def direction(returns, as_bool=False):
+    """Predicted_Direction for an array of returns, as booleans or a categorical of labels."""
+    increase = returns > 0
+    if as_bool:
+        return increase
+    return pd.Categorical.from_codes(increase.astype(np.int8), categories=DIRECTION_CATEGORIES)
+
+
+def calculate_daily_returns(df):
+    df = df.copy()
+    df['Daily_Return'] = daily_returns(df['Close'].to_numpy())
+    return df
+
+
+def clean_missing_data(df):
+    return df.dropna(subset=['Daily_Return'])
+
+
+def process_price_data(df, dtype=None, bool_direction=False):
+    """
+    Adds Daily_Return, Cumulative_Return and Predicted_Direction to a price frame and
+    drops the first bar (which has no return). Everything is computed on NumPy arrays in
+    one pass, and the input frame is copied only once (by the row selection).
+    With dtype=float32 the float columns are stored in single precision; returns are
+    still compounded in double precision.
+    """
+    dtype = np.dtype(dtype) if dtype is not None else default_dtype()
+    returns = daily_returns(df['Close'].to_numpy())
+    keep = np.flatnonzero(~np.isnan(returns))
+    out = df.take(keep)
+    returns = returns[keep]
+    if dtype != np.float64:
+        float_columns = out.select_dtypes(include="float64").columns
+        out = out.astype({column: dtype for column in float_columns})
+    out['Daily_Return'] = returns.astype(dtype, copy=False)
+    out['Cumulative_Return'] = cumulative_returns(returns).astype(dtype, copy=False)
+    out['Predicted_Direction'] = direction(returns, as_bool=bool_direction)
+    return out
+
+
+def process_panel(close, dtype=None):
+    """
+    Processes a whole wide close-price panel (dates x tickers) in one vectorized pass.
+    Tickers may start on different dates: leading NaN prices give NaN returns and the
+    cumulative return stays at zero until a ticker's first return.
+    Returns a dictionary of dates x tickers frames: Daily_Return, Cumulative_Return and
+    Predicted_Direction (boolean).
+    """
+    dtype = np.dtype(dtype) if dtype is not None else default_dtype()
+    returns = daily_returns(close.to_numpy())
+    cumulative = cumulative_returns(returns)
+    frame = lambda values: pd.DataFrame(values, index=close.index, columns=close.columns)
+    return {
+        'Daily_Return': frame(returns.astype(dtype, copy=False)),
+        'Cumulative_Return': frame(cumulative.astype(dtype, copy=False)),
+        'Predicted_Direction': frame(direction(returns, as_bool=True)),
+    }
+
+
+def cumulative_by_group(returns, groups):
+    """Cumulative returns of a long-format return column, compounded separately per group."""
+    growth = pd.Series(1.0 + np.asarray(returns, dtype=np.float64))
+    return (growth.groupby(np.asarray(groups), sort=False).cumprod() - 1).to_numpy()
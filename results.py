@@ -0,0 +1,112 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+import pandas as pd
+import instrumentation
+
+
+# Content hashes of individual Series/DataFrames, keyed by object id. Cached frames are
+# shared read-only objects, so each one is hashed once; entries are dropped when the
+# object is garbage collected.
+_value_hashes = {}
+_value_hashes_lock = threading.Lock()
+
+
+def _value_hash(values):
+    key = id(values)
+    with _value_hashes_lock:
+        cached = _value_hashes.get(key)
+    if cached is not None:
+        return cached
+    columns = values.columns if isinstance(values, pd.DataFrame) else [values.name]
+    digest = hashlib.sha1(str(list(columns)).encode())
+    digest.update(pd.util.hash_pandas_object(values, index=True).values.tobytes())
+    value_hash = digest.digest()
+    with _value_hashes_lock:
+        _value_hashes[key] = value_hash
+    weakref.finalize(values, _forget_value_hash, key)
+    return value_hash
+
+
+def _forget_value_hash(key):
+    with _value_hashes_lock:
+        _value_hashes.pop(key, None)
+
+
+def fingerprint(data):
+    """
+    Returns a content hash for a mapping of name -> Series/DataFrame. Two inputs with the
+    same names (in the same order), index and values produce the same hash, regardless of
+    object identity. Values must not be modified in place after they have been hashed.
+    """
+    digest = hashlib.sha1()
+    for name, values in data.items():
+        digest.update(str(name).encode())
+        digest.update(_value_hash(values))
+    return digest.hexdigest()
+
+
+class ResultStore:
+    """
+    Versioned store for derived analytics (correlation matrices, rendered HTML, metrics).
+    Results are keyed by a name and the content hash of the inputs they were computed
+    from, so they are computed once per distinct input and reused until the data changes.
+    The most recent version of each named result is tracked for cheap lookups.
+    """
+
+    def __init__(self, max_entries=128, name="results"):
+        self.name = name
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._latest = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, name, version, compute):
+        key = (name, version)
+        with self._lock:
+            hit = key in self._results
+            if hit:
+                self._results.move_to_end(key)
+                self.hits += 1
+                value = self._results[key]
+            else:
+                self.misses += 1
+        instrumentation.cache_lookup(self.name, hit)
+        if hit:
+            return value
+        # Compute outside the lock; concurrent misses for the same key produce equal results.
+        value = compute()
+        with self._lock:
+            self._results[key] = value
+            self._results.move_to_end(key)
+            self._latest[name] = version
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return value
+
+    def latest(self, name):
+        """Returns (version, value) of the most recently computed result for name, or (None, None)."""
+        with self._lock:
+            version = self._latest.get(name)
+            return version, self._results.get((name, version))
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self._latest.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._results),
+                "hits": self.hits,
+                "misses": self.misses,
+                "versions": dict(self._latest),
+            }
+
+
+# Process-wide store of precomputed analytics.
+result_store = ResultStore()
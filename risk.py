@@ -0,0 +1,121 @@
+"""
+Risk metrics of daily returns, computed for every asset of a dates x assets matrix at once.
+
+Value at risk and conditional value at risk (expected shortfall) are reported as
+positive daily losses at a confidence level, both historically (from the empirical
+quantile of the returns) and parametrically (assuming normally distributed returns).
+Drawdowns compound the returns; downside deviation and the Sortino ratio are taken
+against a target daily return (0 by default); beta is measured against a market
+return series on the dates where both have a return. Missing returns (NaN) are
+skipped, as pandas does, so assets with different histories share one matrix.
+"""
+from statistics import NormalDist
+import numpy as np
+
+# Metric names, in the order they are reported.
+METRICS = ("VaR", "CVaR", "Parametric VaR", "Parametric CVaR", "Max Drawdown",
+           "Downside Deviation", "Sortino Ratio", "Beta")
+
+
+def historical_var(returns, level=0.95):
+    """
+    Historical VaR and CVaR per column: the loss at the (1 - level) quantile of the
+    returns (linearly interpolated, like numpy and pandas) and the average loss at or
+    beyond it. Returns (var, cvar); NaN for columns without returns.
+    """
+    ordered = np.sort(returns, axis=0)  # NaN sorts last
+    counts = (~np.isnan(returns)).sum(axis=0)
+    position = np.maximum(counts - 1, 0) * (1 - level)
+    lower = np.floor(position).astype(np.intp)
+    upper = np.minimum(lower + 1, np.maximum(counts - 1, 0))
+    columns = np.arange(returns.shape[1])
+    if len(ordered):
+        quantile = ordered[lower, columns] + (position - lower) * (ordered[upper, columns] - ordered[lower, columns])
+    else:
+        quantile = np.full(returns.shape[1], np.nan)
+    quantile[counts == 0] = np.nan
+    with np.errstate(invalid="ignore"):
+        tail = ordered <= quantile
+        cvar = np.where(tail, ordered, 0.0).sum(axis=0) / tail.sum(axis=0)
+    return -quantile, -cvar
+
+
+def parametric_var(mean, std, level=0.95):
+    """Gaussian VaR and CVaR from per-column mean and standard deviation. Returns (var, cvar)."""
+    normal = NormalDist()
+    z = normal.inv_cdf(1 - level)
+    var = -(mean + z * std)
+    cvar = -(mean - std * normal.pdf(z) / (1 - level))
+    return var, cvar
+
+
+def max_drawdown(returns):
+    """
+    Largest peak-to-trough decline of each column's compounded returns, as a negative
+    fraction (0 when the value never fell). Missing returns leave the value unchanged.
+    """
+    if not len(returns):
+        return np.full(returns.shape[1], np.nan)
+    wealth = np.cumprod(1 + np.nan_to_num(returns), axis=0)
+    peak = np.maximum(np.maximum.accumulate(wealth, axis=0), 1.0)
+    drawdown = (wealth / peak - 1).min(axis=0)
+    drawdown[np.isnan(returns).all(axis=0)] = np.nan
+    return np.minimum(drawdown, 0.0)
+
+
+def downside_deviation(returns, target=0.0):
+    """Root mean square of the shortfalls below the target return, over each column's returns."""
+    counts = (~np.isnan(returns)).sum(axis=0)
+    shortfall = np.minimum(np.nan_to_num(returns - target, nan=0.0), 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.sqrt((shortfall ** 2).sum(axis=0) / counts)
+
+
+def beta(returns, market):
+    """
+    Beta of each column against a market return series (sample covariance over sample
+    variance), on the dates where both have a return. NaN with fewer than two such dates.
+    """
+    market = np.broadcast_to(market.reshape(-1, 1), returns.shape)
+    both = ~np.isnan(returns) & ~np.isnan(market)
+    counts = both.sum(axis=0)
+    x = np.where(both, market, 0.0)
+    y = np.where(both, returns, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x, mean_y = x.sum(axis=0) / counts, y.sum(axis=0) / counts
+        covariance = (np.where(both, (x - mean_x) * (y - mean_y), 0.0)).sum(axis=0)
+        variance = (np.where(both, (x - mean_x) ** 2, 0.0)).sum(axis=0)
+        result = covariance / variance
+    result[counts < 2] = np.nan
+    return result
+
+
+def risk_metrics(returns, market=None, level=0.95, target=0.0, mean=None, std=None):
+    """
+    Every metric of METRICS for each column of a dates x assets returns matrix, as
+    {metric: array}. `market` is the market's returns on the same dates (Beta is NaN
+    without it); `mean` and `std` may pass per-column statistics already computed
+    (see panel.column_stats).
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    if mean is None or std is None:
+        counts = (~np.isnan(returns)).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.nansum(returns, axis=0) / counts
+            std = np.sqrt(np.nansum((returns - mean) ** 2, axis=0) / (counts - 1))
+        std[counts < 2] = np.nan
+    var, cvar = historical_var(returns, level)
+    parametric, parametric_cvar = parametric_var(mean, std, level)
+    downside = downside_deviation(returns, target)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sortino = np.where(downside > 0, (mean - target) / downside, np.nan)
+    return {
+        "VaR": var,
+        "CVaR": cvar,
+        "Parametric VaR": parametric,
+        "Parametric CVaR": parametric_cvar,
+        "Max Drawdown": max_drawdown(returns),
+        "Downside Deviation": downside,
+        "Sortino Ratio": sortino,
+        "Beta": beta(returns, market) if market is not None else np.full(returns.shape[1], np.nan),
+    }
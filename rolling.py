@@ -0,0 +1,133 @@
+"""
+Rolling and streaming correlation of daily returns.
+
+Correlations over a trailing window of days are computed from running sums: per pair
+of assets the number of days both have a return, the sums of each asset's returns and
+squared returns over those days, and the sum of cross products. Appending a day adds
+its outer products and removes those of the day leaving the window, which is O(N^2)
+per day instead of recomputing an O(N^2 * W) correlation. Missing returns (NaN) are
+skipped pairwise, like pandas' rolling corr.
+"""
+import threading
+import numpy as np
+
+
+def _masked(values):
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    mask = ~np.isnan(values)
+    return np.where(mask, values, 0.0), mask.astype(np.float64)
+
+
+def correlation_from_sums(count, sx, sxx, sxy, min_periods=2):
+    """
+    Pairwise correlation from running sums, where entry (i, j) of sx/sxx is the sum of
+    asset i's returns/squared returns over the days on which j also has a return.
+    """
+    sy, syy = sx.T, sxx.T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sy / count
+        var_x = sxx - sx * sx / count
+        var_y = syy - sy * sy / count
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[(count < min_periods) | ~np.isfinite(corr)] = np.nan
+    np.clip(corr, -1.0, 1.0, out=corr)
+    return corr
+
+
+def window_correlation(values, min_periods=2):
+    """Pairwise-complete correlation matrix of a block of rows (dates x assets), via four matrix products."""
+    x, m = _masked(values)
+    return correlation_from_sums(m.T @ m, x.T @ m, (x * x).T @ m, x.T @ x, min_periods)
+
+
+def pair_series(x, y, window, min_periods=2):
+    """Rolling correlation of two return series over `window` days, for every date (O(T) with cumulative sums)."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    both = ~(np.isnan(x) | np.isnan(y))
+    x, y = np.where(both, x, 0.0), np.where(both, y, 0.0)
+
+    def rolling_sum(values):
+        total = np.concatenate(([0.0], np.cumsum(values)))
+        start = np.maximum(np.arange(1, len(values) + 1) - window, 0)
+        return total[1:] - total[start]
+
+    n = rolling_sum(both.astype(np.float64))
+    sx, sy = rolling_sum(x), rolling_sum(y)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = rolling_sum(x * y) - sx * sy / n
+        corr = cov / np.sqrt((rolling_sum(x * x) - sx * sx / n) * (rolling_sum(y * y) - sy * sy / n))
+    corr[(n < min_periods) | ~np.isfinite(corr)] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+class RollingCorrelation:
+    """
+    Streaming rolling correlation matrix over the last `window` appended days.
+    The sums are recomputed exactly from the buffered rows once every `window` appends,
+    so floating-point error from repeated add/subtract does not accumulate; the
+    amortized cost stays O(N^2) per day. Memory is a few N x N matrices plus the
+    window x N buffer.
+    """
+
+    def __init__(self, names, window, min_periods=None):
+        self.names = list(names)
+        self.window = int(window)
+        self.min_periods = min_periods if min_periods is not None else max(2, self.window // 2)
+        n = len(self.names)
+        self._rows = np.full((self.window, n), np.nan)
+        self._next = 0
+        self.appended = 0
+        self.last_date = None
+        self._count = np.zeros((n, n))
+        self._sx = np.zeros((n, n))
+        self._sxx = np.zeros((n, n))
+        self._sxy = np.zeros((n, n))
+        self._lock = threading.Lock()
+
+    def _add(self, row, sign):
+        x, m = _masked(row)
+        x, m = x[0], m[0]
+        self._count += sign * np.outer(m, m)
+        self._sx += sign * np.outer(x, m)
+        self._sxx += sign * np.outer(x * x, m)
+        self._sxy += sign * np.outer(x, x)
+
+    def _resync(self):
+        x, m = _masked(self._rows)
+        self._count, self._sx, self._sxx, self._sxy = m.T @ m, x.T @ m, (x * x).T @ m, x.T @ x
+
+    def append(self, rows, dates=None):
+        """Appends one day (a vector over the assets) or several (a dates x assets block)."""
+        rows = np.atleast_2d(np.asarray(rows, dtype=np.float64))
+        with self._lock:
+            if len(rows) >= self.window:
+                # Only the last `window` days matter: load them directly.
+                self._rows = rows[-self.window:].copy()
+                self._next = 0
+                self.appended += len(rows)
+                self._resync()
+                rows = rows[:0]
+            for row in rows:
+                if self.appended >= self.window:
+                    self._add(self._rows[self._next], -1.0)
+                self._rows[self._next] = row
+                self._add(row, 1.0)
+                self._next = (self._next + 1) % self.window
+                self.appended += 1
+                if self.appended % self.window == 0:
+                    self._resync()
+            if dates is not None and len(dates):
+                self.last_date = dates[-1]
+
+    def recent(self):
+        """The buffered days (at most `window`), oldest first."""
+        with self._lock:
+            count = min(self.appended, self.window)
+            order = (np.arange(self._next - count, self._next)) % self.window
+            return self._rows[order].copy()
+
+    def matrix(self):
+        """Current correlation matrix (NaN for pairs with fewer than min_periods common days)."""
+        with self._lock:
+            return correlation_from_sums(self._count, self._sx, self._sxx, self._sxy, self.min_periods)
@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+import time
+from sqlalchemy import text
+import cache
+import database
+
+# Advisory lock id shared by every worker; only the holder fetches from the data source.
+REFRESH_LOCK_KEY = 815001
+# Single-row table recording when the data was last refreshed from the source. Workers
+# compare it with their snapshot version to pick up refreshes made by another worker.
+STATE_TABLE = "refresh_state"
+
+
+def _env_seconds(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def enabled():
+    """The background refresher is enabled with BACKGROUND_REFRESH=1."""
+    return os.getenv("BACKGROUND_REFRESH", "").lower() in ("1", "true", "yes", "on")
+
+
+def read_marker():
+    """Returns the time (epoch seconds) of the last refresh from the source, or None."""
+    with database.get_engine().begin() as conn:
+        conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{STATE_TABLE}" (name VARCHAR(32) PRIMARY KEY, refreshed_at DOUBLE PRECISION)'))
+        row = conn.execute(text(f'SELECT refreshed_at FROM "{STATE_TABLE}" WHERE name = \'data\'')).fetchone()
+    return row[0] if row else None
+
+
+def write_marker(refreshed_at):
+    with database.get_engine().begin() as conn:
+        conn.execute(text(f'DELETE FROM "{STATE_TABLE}" WHERE name = \'data\''))
+        conn.execute(text(f'INSERT INTO "{STATE_TABLE}" (name, refreshed_at) VALUES (\'data\', :t)'), {"t": refreshed_at})
+
+
+class Snapshot:
+    """The last good set of loaded data, tagged with the refresh it was built from."""
+
+    def __init__(self, data, version, built_at):
+        self.data = data
+        self.version = version
+        self.built_at = built_at
+
+
+class Refresher:
+    """
+    Keeps a per-process snapshot of the pipeline data up to date off the request path.
+    `load_snapshot` builds the snapshot data from the database (warming caches), and
+    `refresh_sources` re-fetches from the data source and stores the result. Every
+    `poll` seconds a worker checks whether a refresh is due; the one that wins the
+    advisory lock refreshes the sources, and every worker rebuilds its snapshot once the
+    shared refresh marker changes. Failures keep the previous snapshot.
+    """
+
+    def __init__(self, load_snapshot, refresh_sources, interval=None, poll=None):
+        self.load_snapshot = load_snapshot
+        self.refresh_sources = refresh_sources
+        self.interval = interval if interval is not None else _env_seconds("REFRESH_INTERVAL", 86400.0)
+        self.poll = poll if poll is not None else _env_seconds("REFRESH_POLL", 60.0)
+        self._snapshot = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self._stop = threading.Event()
+        self._fork_hook = False
+        self.last_error = None
+        self.last_run = None
+
+    def snapshot(self):
+        return self._snapshot
+
+    def wait(self, timeout=None):
+        """Waits up to `timeout` seconds for the first snapshot; returns it, or None if there is none yet."""
+        self._ready.wait(timeout)
+        return self._snapshot
+
+    def run_once(self, force=False):
+        """Refreshes the sources if due (and this worker holds the lock), then updates the snapshot."""
+        with self._lock:
+            try:
+                marker = read_marker()
+                if force or marker is None or time.time() - marker >= self.interval:
+                    with database.advisory_lock(REFRESH_LOCK_KEY) as acquired:
+                        if acquired:
+                            # Re-check under the lock: another worker may have just finished.
+                            marker = read_marker()
+                            if force or marker is None or time.time() - marker >= self.interval:
+                                logging.info("Refreshing market data from the source.")
+                                self.refresh_sources()
+                                marker = time.time()
+                                write_marker(marker)
+                if marker is None:
+                    # Another worker holds the lock for the initial fetch; try again next poll.
+                    return self._snapshot
+                if force or self._snapshot is None or self._snapshot.version != marker:
+                    cache.frame_cache.clear()
+                    self._snapshot = Snapshot(self.load_snapshot(), marker, time.time())
+                    self._ready.set()
+                self.last_error = None
+            except Exception as e:
+                logging.error(f"Background refresh failed: {e}")
+                self.last_error = str(e)
+            finally:
+                self.last_run = time.time()
+            return self._snapshot
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.poll)
+
+    def start(self):
+        """
+        Starts the refresh thread in this process; idempotent. A process forked after the
+        thread started (e.g. a gunicorn worker of a --preload master) starts its own
+        thread right away, keeping the snapshot it inherited.
+        """
+        pid = os.getpid()
+        if self._thread is not None and self._thread_pid == pid and self._thread.is_alive():
+            return
+        if not self._fork_hook and hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+            self._fork_hook = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="data-refresher", daemon=True)
+        self._thread_pid = pid
+        self._thread.start()
+
+    def _after_fork(self):
+        # The parent's thread does not exist in the child, and it may have held the lock.
+        self._lock = threading.Lock()
+        if self._thread is not None and not self._stop.is_set():
+            self.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        """Staleness indicator for the snapshot served to requests."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            warming_up = self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive()
+            return {"available": False, "stale": True, "warming_up": warming_up, "last_error": self.last_error}
+        age = time.time() - snapshot.version
+        return {
+            "available": True,
+            "refreshed_at": snapshot.version,
+            "age_seconds": round(age, 1),
+            "stale": self.last_error is not None or age > 2 * self.interval,
+            "last_error": self.last_error,
+        }
+
+
+if __name__ == "__main__":
+    # python scheduler.py [--loop] -- refresh from a cron job / separate process instead of the web workers.
+    import sys
+    import app
+    refresher = app.refresher
+    if "--loop" in sys.argv[1:]:
+        refresher._loop()
+    else:
+        refresher.run_once(force=True)
+        print(refresher.status())
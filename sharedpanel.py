@@ -0,0 +1,242 @@
+"""
+Returns panel shared by every worker process on a host.
+
+The universe's training and test data are published once as aligned dates x assets
+matrices (close prices, daily returns and cumulative returns) with a small index of
+dates, asset names and asset kinds, written as NumPy files to SHARED_PANEL_DIR (use a
+tmpfs such as /dev/shm). Every worker maps the same files read-only, so the panel is
+held once per host instead of once per worker, and only the first worker to need a
+version pays for building it: it builds under a host-wide file lock while the others
+wait and then map its result.
+
+Each published panel is tagged with the data version it was built from. A newer
+version is written to its own directory and swapped in by atomically replacing the
+manifest, so readers never see a half-written panel; workers still reading the old
+version keep their mappings until they move on. Matrices are stored column-major, so
+each asset's series is contiguous and per-asset frames are zero-copy views.
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import panel
+
+MANIFEST = "current.json"
+LOCK_FILE = ".lock"
+
+# Columns of the processed frames held in the panel.
+COLUMNS = ("Close", "Daily_Return", "Cumulative_Return")
+
+
+def panel_dir():
+    """Directory of the shared panel (SHARED_PANEL_DIR), or None when sharing is disabled."""
+    return os.getenv("SHARED_PANEL_DIR") or None
+
+
+def enabled():
+    return panel_dir() is not None
+
+
+def _recheck_seconds():
+    value = os.getenv("SHARED_PANEL_RECHECK")
+    return float(value) if value not in (None, "") else 5.0
+
+
+class SharedPanel:
+    """
+    One published version of the panel. `windows` maps a window name to its dates
+    (DatetimeIndex), asset names, asset kinds and {column: dates x assets matrix}.
+    """
+
+    def __init__(self, version, windows, directory=None):
+        self.version = version
+        self.windows = windows
+        self.directory = directory
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def matrix(self, window, column="Daily_Return"):
+        """(dates, asset names, dates x assets matrix) of one column, like panel.returns_matrix()."""
+        entry = self.windows[window]
+        return entry["dates"], entry["assets"], entry["values"][column]
+
+    def frames(self, window, kind=None):
+        """
+        Per-asset frames of a window (optionally only assets of one kind), indexed by
+        Date with the panel's columns over each asset's own dates. Assets with bars on
+        a contiguous run of the panel's dates (the usual case) get views of the shared
+        matrices; others get a copy of their rows. Built once per process and reused.
+        """
+        key = (window, kind)
+        with self._lock:
+            frames = self._frames.get(key)
+        if frames is not None:
+            return frames
+        frames = {}
+        entry = self.windows.get(window)
+        if entry is not None:
+            dates, values = entry["dates"], entry["values"]
+            for i, (name, asset_kind) in enumerate(zip(entry["assets"], entry["kinds"])):
+                if kind is not None and asset_kind != kind:
+                    continue
+                rows = np.flatnonzero(~np.isnan(values["Daily_Return"][:, i]))
+                if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+                    rows = slice(rows[0], rows[-1] + 1)
+                frames[name] = pd.DataFrame({column: values[column][rows, i] for column in COLUMNS},
+                                            index=dates[rows], copy=False)
+        with self._lock:
+            self._frames[key] = frames
+        return frames
+
+
+class PanelStore:
+    """Publishes panels to SHARED_PANEL_DIR and maps the current one, once per version per process."""
+
+    def __init__(self):
+        self._attached = None
+        self._stamp = None
+        self._version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def _path(self, *parts):
+        return os.path.join(panel_dir(), *parts)
+
+    @contextmanager
+    def _host_lock(self):
+        # Serializes building and publishing between the processes of this host.
+        os.makedirs(panel_dir(), exist_ok=True)
+        with open(self._path(LOCK_FILE), "w") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def attach(self):
+        """The currently published panel, mapped read-only (once per version), or None."""
+        try:
+            stat = os.stat(self._path(MANIFEST))
+        except OSError:
+            return None
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            if self._attached is not None and self._stamp == stamp:
+                return self._attached
+        try:
+            with open(self._path(MANIFEST)) as handle:
+                manifest = json.load(handle)
+            directory = self._path(manifest["directory"])
+            windows = {}
+            for window, entry in manifest["windows"].items():
+                load = lambda name: np.load(os.path.join(directory, f"{window}.{name}.npy"), mmap_mode="r")
+                windows[window] = {
+                    "dates": pd.DatetimeIndex(load("dates").view("datetime64[ns]"), name="Date"),
+                    "assets": entry["assets"],
+                    "kinds": entry["kinds"],
+                    "values": {column: load(column) for column in COLUMNS},
+                }
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Shared panel in {panel_dir()} is unreadable: {e}")
+            return None
+        shared = SharedPanel(manifest["version"], windows, directory)
+        with self._lock:
+            self._attached, self._stamp = shared, stamp
+        return shared
+
+    def get(self, read_version, build):
+        """
+        The shared panel of the current data version, or None if it cannot be published.
+        read_version() returns the data version (called at most every SHARED_PANEL_RECHECK
+        seconds); build() returns {window: (frames, kinds)} with the processed frames by
+        asset name and the asset kind of each, and is only called by the one process
+        that publishes a version.
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = self._checked_at is None or now - self._checked_at >= _recheck_seconds()
+        if due:
+            version = read_version()
+            with self._lock:
+                self._version, self._checked_at = version, now
+        version = self._version
+        shared = self.attach()
+        if shared is not None and shared.version == version:
+            return shared
+        try:
+            with self._host_lock():
+                # Another worker may have published this version while we waited.
+                shared = self.attach()
+                if shared is None or shared.version != version:
+                    self.publish(version, build())
+                    shared = self.attach()
+        except OSError as e:
+            logging.warning(f"Could not publish the shared panel to {panel_dir()}: {e}")
+            return None
+        return shared if shared is not None and shared.version == version else None
+
+    def expire(self):
+        """Makes the next get() read the data version again (e.g. right after a refresh)."""
+        with self._lock:
+            self._checked_at = None
+
+    def publish(self, version, windows):
+        """
+        Writes a panel for `version` from {window: (frames, kinds)} and swaps it in.
+        The two most recent versions are kept on disk so readers that have just read
+        the previous manifest can still open its files.
+        """
+        os.makedirs(panel_dir(), exist_ok=True)
+        staging = tempfile.mkdtemp(dir=panel_dir(), prefix=".tmp-")
+        manifest = {"version": version, "published_at": time.time(), "pid": os.getpid(), "windows": {}}
+        try:
+            for window, (frames, kinds) in windows.items():
+                dates = None
+                for column in COLUMNS:
+                    dates, names, values = panel.returns_matrix(frames, column=column)
+                    np.save(os.path.join(staging, f"{window}.{column}.npy"), np.asfortranarray(values),
+                            allow_pickle=False)
+                np.save(os.path.join(staging, f"{window}.dates.npy"),
+                        dates.to_numpy(dtype="datetime64[ns]").view("int64"), allow_pickle=False)
+                manifest["windows"][window] = {"assets": names, "kinds": [kinds[name] for name in names],
+                                               "rows": len(dates)}
+            directory = f"v{time.time_ns()}-{os.getpid()}"
+            os.rename(staging, self._path(directory))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        manifest["directory"] = directory
+        handle, manifest_tmp = tempfile.mkstemp(dir=panel_dir(), prefix=".manifest-")
+        with os.fdopen(handle, "w") as out:
+            json.dump(manifest, out)
+        os.replace(manifest_tmp, self._path(MANIFEST))
+        self.builds += 1
+        versions = sorted(entry for entry in os.listdir(panel_dir()) if entry.startswith("v"))
+        for entry in versions[:-2]:
+            shutil.rmtree(self._path(entry), ignore_errors=True)
+        logging.info(f"Published shared panel version {version} to {self._path(directory)}.")
+
+    def status(self):
+        shared = self._attached
+        if not enabled():
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "directory": panel_dir(),
+            "version": shared.version if shared is not None else None,
+            "windows": {window: {"rows": len(entry["dates"]), "assets": len(entry["assets"])}
+                        for window, entry in shared.windows.items()} if shared is not None else {},
+            "builds": self.builds,
+        }
+
+
+# Process-wide handle on the host's shared panel.
+store = PanelStore()
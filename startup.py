@@ -0,0 +1,169 @@
+"""
+Startup timing: how long the process took to import its modules, to build the
+application and to serve its first response.
+
+app.py starts the import timer before its own imports, so every module it imports
+directly is timed including the modules that one pulls in (e.g. `database` includes
+pandas and SQLAlchemy). Times are measured from the start of the process when the
+platform reports it (Linux), so interpreter startup is included; otherwise from the
+import of this module. The report is logged when the application is ready and after
+the first response, checked against STARTUP_TARGET_SECONDS, and served by
+/debug/startup.
+
+With gunicorn --preload the application is built once in the master process and the
+workers inherit the import and ready times; each worker records its own first
+response.
+"""
+import builtins
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _process_age():
+    # Seconds since this process started, from /proc (0 where unavailable).
+    try:
+        with open("/proc/self/stat") as handle:
+            # The command name may contain spaces; the fields after it are fixed.
+            fields = handle.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as handle:
+            uptime = float(handle.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+_started = time.perf_counter() - _process_age()
+
+
+def elapsed():
+    """Seconds since the process started."""
+    return time.perf_counter() - _started
+
+
+def target_seconds():
+    """Startup budget in seconds (STARTUP_TARGET_SECONDS), or None when unset."""
+    value = os.getenv("STARTUP_TARGET_SECONDS")
+    return float(value) if value not in (None, "") else None
+
+
+class ImportTimer:
+    """
+    Times the outermost imports made by the installing thread while installed. Each
+    module imported for the first time is recorded with the seconds spent importing it,
+    including its own imports.
+    """
+
+    def __init__(self):
+        self.times = {}
+        self._original = None
+        self._thread = None
+        self._depth = 0
+
+    def install(self):
+        if self._original is None:
+            self._original = builtins.__import__
+            self._thread = threading.get_ident()
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        # Another hook installed on top of this one still calls it, so it then stays in
+        # place and only stops timing.
+        if self._original is not None and builtins.__import__ == self._import:
+            builtins.__import__ = self._original
+            self._original = None
+        self._thread = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if (self._depth or level or threading.get_ident() != self._thread
+                or name in sys.modules):
+            return self._original(name, globals, locals, fromlist, level)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            self._depth -= 1
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+
+
+class StartupReport:
+    """Per-process startup milestones (seconds since process start) and phase durations."""
+
+    def __init__(self):
+        self.imports = ImportTimer()
+        self.imports_done = None
+        self.ready = None
+        self.first_response = None
+        self.first_response_pid = None
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def begin_imports(self):
+        self.imports.install()
+
+    def end_imports(self):
+        self.imports.uninstall()
+        if self.imports_done is None:
+            self.imports_done = elapsed()
+
+    @contextmanager
+    def phase(self, name):
+        """Times a named startup step (e.g. a preload)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def mark_ready(self):
+        """Records when the application is ready to serve (once) and logs the report."""
+        with self._lock:
+            if self.ready is not None:
+                return
+            self.ready = elapsed()
+        slowest = sorted(self.imports.times.items(), key=lambda item: -item[1])[:5]
+        logging.info(f"Application ready {self.ready:.2f}s after process start "
+                     f"(imports {self.imports_done or 0:.2f}s; slowest: "
+                     + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in slowest) + ").")
+        self._check_target("ready", self.ready)
+
+    def mark_response(self):
+        """Records the first response of this process (a forked worker records its own)."""
+        pid = os.getpid()
+        if self.first_response_pid == pid:
+            return
+        with self._lock:
+            if self.first_response_pid == pid:
+                return
+            self.first_response, self.first_response_pid = elapsed(), pid
+        logging.info(f"First response {self.first_response:.2f}s after process start (pid {pid}).")
+        self._check_target("first response", self.first_response)
+
+    def _check_target(self, milestone, seconds):
+        target = target_seconds()
+        if target is not None and seconds > target:
+            logging.warning(f"Startup target missed: {milestone} after {seconds:.2f}s "
+                            f"(STARTUP_TARGET_SECONDS={target:g}).")
+
+    def status(self):
+        target = target_seconds()
+        first_response = self.first_response if self.first_response_pid == os.getpid() else None
+        reached = first_response if first_response is not None else self.ready
+        return {
+            "pid": os.getpid(),
+            "imports_seconds": self.imports_done,
+            "imports": dict(sorted(self.imports.times.items(), key=lambda item: -item[1])),
+            "phases": dict(self.phases),
+            "ready_seconds": self.ready,
+            "first_response_seconds": first_response,
+            "target_seconds": target,
+            "within_target": None if target is None or reached is None else reached <= target,
+        }
+
+
+# Startup report of this process.
+startup_report = StartupReport()
@@ -1,20 +1,16 @@
-import yfinance as yf
-import pandas as pd
 import logging
+import fetcher
+import datasource
+import processing
 
-# Set up basic logging configuration
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+def _history(ticker, start=None, end=None, period='3y', interval='1d'):
+    # Raises on failure; used directly by the batch fetcher so it can retry.
+    return datasource.get_data_source().history(ticker, start=start, end=end, period=period, interval=interval)
 
 def fetch_stock_data(ticker, start=None, end=None, period='3y', interval='1d'):
     try:
         logging.info(f"Fetching data for {ticker} with start={start}, end={end}, period={period}, interval={interval}")
-        stock = yf.Ticker(ticker)
-        if start and end:
-            print(f"Fetching data for {ticker} from {start} to {end} with interval {interval}")
-            print(stock.history(period=period, interval=interval))
-            df = stock.history(start=start, end=end, interval=interval)
-        else:
-            df = stock.history(period=period, interval=interval)
+        df = _history(ticker, start=start, end=end, period=period, interval=interval)
         
         if df.empty:
             logging.warning(f"No data returned for {ticker} using the specified parameters.")
@@ -26,17 +22,16 @@ def fetch_stock_data(ticker, start=None, end=None, period='3y', interval='1d'):
         logging.error(f"Error fetching data for {ticker}: {e}")
         return None
 
-def calculate_daily_returns(df):
-    df = df.copy()
-    df['Daily_Return'] = df['Close'].pct_change()
-    return df
+def fetch_stocks_batch(tickers, windows, interval='1d', fetch=None, **options):
+    """
+    Fetches several tickers over several date windows concurrently (see
+    fetcher.fetch_windows); `fetch` defaults to the data source's history call.
+    """
+    return fetcher.fetch_windows(fetch or _history, tickers, windows, interval=interval, **options)
 
-def clean_missing_data(df):
-    return df.dropna(subset=['Daily_Return'])
+# Processing is shared with assets.py; see processing.py.
+calculate_daily_returns = processing.calculate_daily_returns
+clean_missing_data = processing.clean_missing_data
 
-def process_stock_data(df):
-    df = calculate_daily_returns(df)
-    df = clean_missing_data(df)
-    df['Cumulative_Return'] = (1 + df['Daily_Return']).cumprod() - 1
-    df['Predicted_Direction'] = df['Daily_Return'].apply(lambda x: 'Increase' if x > 0 else 'Decrease')
-    return df
\ No newline at end of file
+def process_stock_data(df, dtype=None):
+    return processing.process_price_data(df, dtype=dtype)
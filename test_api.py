@@ -0,0 +1,325 @@
+# Tests for the JSON API, using the benchmark environment (replayed synthetic data in SQLite).
+import gzip
+import json
+import os
+import unittest
+from unittest.mock import patch
+import pandas as pd
+import jobs
+from benchmark import BenchmarkEnvironment, make_intraday_panel, make_price_panel
+
+
+class TestAnalyticsApi(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.env = BenchmarkEnvironment(n_tickers=12, days=330).__enter__()
+        cls.client = cls.env.app.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.env.__exit__(None, None, None)
+
+    def test_metrics_and_not_modified(self):
+        response = self.client.get("/api/metrics?group=stocks")
+        self.assertEqual(response.status_code, 200)
+        metrics = response.get_json()["metrics"]
+        self.assertEqual(set(metrics), set(self.env.stock_tickers))
+        etag = response.headers["ETag"]
+
+        again = self.client.get("/api/metrics?group=stocks", headers={"If-None-Match": etag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.data, b"")
+        modified = self.client.get("/api/metrics?group=stocks",
+                                   headers={"If-Modified-Since": response.headers["Last-Modified"]})
+        self.assertEqual(modified.status_code, 304)
+
+    def test_parameters_change_etag(self):
+        first = self.client.get("/api/portfolio?investment=1000")
+        second = self.client.get("/api/portfolio?investment=2000")
+        self.assertNotEqual(first.headers["ETag"], second.headers["ETag"])
+        body = second.get_json()
+        self.assertEqual(body["investment"], 2000.0)
+        self.assertIn("equal_weighted", body)
+        self.assertIn("composition", body["optimized"])
+
+    def test_response_bodies_do_not_evict_analytics(self):
+        results = self.env.results
+        self.client.get("/api/portfolio?investment=1")
+        stored = dict(results.result_store._results)
+        # Every investment is a distinct representation with its own body.
+        with patch.object(self.env.app.httpcache.body_cache, "max_bytes", 20000):
+            for investment in range(2, results.result_store.max_entries + 10):
+                self.assertEqual(self.client.get(f"/api/portfolio?investment={investment}").status_code, 200)
+            self.assertLessEqual(self.env.app.httpcache.body_cache.stats()["bytes"], 20000)
+        self.assertTrue(set(stored) <= set(results.result_store._results))
+
+    def test_ticker_subset(self):
+        tickers = self.env.stock_tickers[:2] + ["Bench0"]
+        body = self.client.get(f"/api/correlation?tickers={','.join(tickers)}").get_json()
+        self.assertEqual(body["assets"], tickers)
+        self.assertEqual(len(body["matrix"]), 3)
+        self.assertAlmostEqual(body["matrix"][0][0], 1.0)
+
+    def test_gzip_when_accepted(self):
+        response = self.client.get("/api/correlation", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers.get("Content-Encoding"), "gzip")
+        body = json.loads(gzip.decompress(response.data))
+        self.assertEqual(len(body["assets"]), 16)
+
+    def test_adhoc_window_and_ticker(self):
+        # A ticker outside the configured universe, available from the data source.
+        extra = "X999"
+        self.env.replay.save(extra, make_price_panel([extra], 330, seed=5)[extra])
+        response = self.client.get(
+            f"/api/metrics?tickers={self.env.stock_tickers[0]},{extra}&start=2022-03-01&end=2022-06-30")
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body["window"], {"start": "2022-03-01", "end": "2022-06-30"})
+        self.assertEqual(set(body["metrics"]), {self.env.stock_tickers[0], extra})
+        self.assertEqual(self.client.get("/api/metrics?start=2022-06-30&end=2022-03-01").status_code, 400)
+
+        # Ad-hoc windows are neither configured windows (refreshed) nor sizing the frame cache.
+        app = self.env.app
+        max_entries = self.env.cache.frame_cache.max_entries
+        for day in range(1, 25):
+            self.client.get(f"/api/metrics?tickers={extra}&start=2022-03-{day:02d}&end=2022-06-30")
+        self.assertEqual(set(app.WINDOWS), {"train", "test"})
+        self.assertEqual(self.env.cache.frame_cache.max_entries, max_entries)
+
+    def test_changed_window_dates_are_fetched_again(self):
+        app = self.env.app
+        specs = app.stock_specs()[:2]
+        start, end = app.WINDOWS["train"]
+        app.load_assets(specs, "train")
+        later = (pd.Timestamp(start) + pd.Timedelta(days=60)).date().isoformat()
+        try:
+            # Both ingest modes plan from the same stored coverage, so incremental mode
+            # rewrites the tables too instead of appending to the other window's rows.
+            for mode in ("replace", "incremental"):
+                for dates in ((later, end), (start, end)):
+                    with patch.dict(app.WINDOWS, {"train": dates}), patch.dict(os.environ, {"INGEST_MODE": mode}):
+                        self.env.reset_caches()
+                        frames = app.load_assets(specs, "train")
+                    for df in frames.values():
+                        first = app.panel.frame_dates(df).min().tz_localize(None)
+                        self.assertTrue(pd.Timestamp(dates[0]) <= first <= pd.Timestamp(dates[0]) + pd.Timedelta(days=7))
+        finally:
+            self.env.reset_caches()
+
+    def test_optimize(self):
+        response = self.client.get("/api/optimize?method=min_variance&max_weight=0.2")
+        self.assertEqual(response.status_code, 200)
+        portfolio = response.get_json()["portfolio"]
+        self.assertEqual(set(portfolio["weights"]), set(self.env.stock_tickers))
+        self.assertAlmostEqual(sum(portfolio["weights"].values()), 1.0)
+        self.assertLessEqual(max(portfolio["weights"].values()), 0.2 + 1e-9)
+        self.assertIn("Sharpe Ratio", portfolio["metrics"])
+        self.assertEqual(self.client.get("/api/optimize?max_weight=0.01").status_code, 400)
+        self.assertEqual(self.client.get("/api/optimize?method=bogus").status_code, 400)
+
+    def test_backtest(self):
+        tickers = self.env.stock_tickers[:3]
+        response = self.client.post("/api/backtest", json={
+            "tickers": tickers, "weights": [[1, 0, 0], {tickers[1]: 0.5, tickers[2]: 0.5}],
+            "rebalance": ["none", "weekly"], "investments": [1000, 500]})
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body["assets"], tickers)
+        # Daily bars are labelled with plain dates.
+        self.assertRegex(body["dates"]["start"], r"^2023-01-0\d$")
+        self.assertRegex(body["dates"]["end"], r"^\d{4}-\d{2}-\d{2}$")
+        buy_and_hold = body["results"]["none"]
+        self.assertEqual(len(buy_and_hold["sharpe_ratio"]), 2)
+        self.assertAlmostEqual(buy_and_hold["final_values"][0][1], 500 * (1 + buy_and_hold["cumulative_return"][0]))
+
+        sweep = self.client.get(f"/api/backtest?tickers={','.join(tickers)}&portfolios=500&seed=1&rebalance=daily")
+        body = sweep.get_json()
+        self.assertEqual(body["portfolios"], 500)
+        self.assertEqual(len(body["results"]["daily"]["max_drawdown"]), 500)
+        self.assertEqual(self.client.post("/api/backtest", json={"weights": [[1, 0]]}).status_code, 400)
+        self.assertEqual(self.client.get("/api/backtest?rebalance=yearly").status_code, 400)
+
+    def test_jobs(self):
+        tickers = self.env.stock_tickers[:3]
+        params = {"tickers": tickers, "portfolios": 3000, "seed": 2, "rebalance": ["monthly"]}
+        with patch.dict(os.environ, {"JOB_BACKTEST_SLICE": "1000"}):
+            submitted = self.client.post("/api/jobs", json={"kind": "backtest", "params": params})
+            self.assertEqual(submitted.status_code, 202)
+            job = submitted.get_json()
+            self.assertEqual(jobs.manager.wait(job["id"], timeout=60)["status"], jobs.SUCCEEDED)
+        result = self.client.get(job["result_url"])
+        self.assertEqual(result.status_code, 200)
+        expected = self.client.post("/api/backtest", json=params).get_json()
+        self.assertEqual(result.get_json()["results"]["monthly"]["final_values"],
+                         expected["results"]["monthly"]["final_values"])
+        # Resubmitting the same job returns the stored result.
+        again = self.client.post("/api/jobs", json={"kind": "backtest", "params": params})
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.get_json()["id"], job["id"])
+
+        optimize = self.client.post("/api/jobs", json={"kind": "optimize", "params": {"method": "min_variance"}})
+        job = jobs.manager.wait(optimize.get_json()["id"], timeout=60)
+        self.assertEqual(job["status"], jobs.SUCCEEDED, job["error"])
+        weights = self.client.get(f"/api/jobs/{job['id']}/result").get_json()["portfolio"]["weights"]
+        expected = self.client.get("/api/optimize?method=min_variance").get_json()["portfolio"]["weights"]
+        for asset, weight in expected.items():
+            self.assertAlmostEqual(weights[asset], weight)
+
+        self.assertEqual(self.client.post("/api/jobs", json={"kind": "nope"}).status_code, 400)
+        self.assertEqual(self.client.post("/api/jobs", json={"kind": "backtest",
+                                                             "params": {"rebalance": ["yearly"]}}).status_code, 400)
+        self.assertEqual(self.client.get("/api/jobs/missing").status_code, 404)
+
+    def test_backtest_rejects_bad_seed_and_disjoint_history(self):
+        tickers = ",".join(self.env.stock_tickers[:2])
+        response = self.client.get(f"/api/backtest?tickers={tickers}&seed=abc&portfolios=3")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["error"], "seed must be an integer")
+        self.assertEqual(self.client.post("/api/jobs", json={"kind": "backtest", "params": {
+            "tickers": tickers, "seed": "abc", "portfolios": 3}}).status_code, 400)
+
+        # YA stops trading before YB starts, so no test date has a return for both.
+        panel = make_price_panel(["YA", "YB"], self.env.days, seed=9)
+        self.env.replay.save("YA", panel["YA"].loc[:"2023-01-31"])
+        self.env.replay.save("YB", panel["YB"].loc["2023-02-01":])
+        response = self.client.get("/api/backtest?tickers=YA,YB")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("not enough history", response.get_json()["error"])
+
+    def test_job_submission_does_not_load_data(self):
+        app = self.env.app
+        params = {"tickers": self.env.stock_tickers[:3], "method": "min_variance"}
+        # The version covers stored tables; the first load creates them.
+        app.load_assets(app.specs_for(params["tickers"]), "train")
+        with patch.object(app, "current_data", side_effect=AssertionError("loaded on submission")), \
+                patch.object(app, "load_assets", side_effect=AssertionError("loaded on submission")):
+            submitted = self.client.post("/api/jobs", json={"kind": "optimize", "params": params})
+            # The job may already have failed by the time the response is built.
+            self.assertIn(submitted.status_code, (200, 202))
+            jobs.manager.wait(submitted.get_json()["id"], timeout=60)
+        first = self.client.post("/api/jobs", json={"kind": "optimize", "params": params, "force": True})
+        job = jobs.manager.wait(first.get_json()["id"], timeout=60)
+        self.assertEqual(job["status"], jobs.SUCCEEDED, job["error"])
+        self.assertEqual(self.client.post("/api/jobs", json={"kind": "optimize", "params": params}).get_json()["id"],
+                         job["id"])
+        # Rewriting one of the job's tables is a new data version.
+        table = app.table_name("stock", "train", self.env.stock_tickers[0])
+        stored = self.env.database.read_table(table).set_index("Date")
+        self.env.database.store_df_to_db(stored.iloc[:-1], table_name=table)
+        again = self.client.post("/api/jobs", json={"kind": "optimize", "params": params})
+        self.assertNotEqual(again.get_json()["id"], job["id"])
+        jobs.manager.wait(again.get_json()["id"], timeout=60)
+        self.env.database.store_df_to_db(stored, table_name=table)
+
+    def test_job_params_as_strings(self):
+        # Job parameters may be given as in the query string: comma-separated strings.
+        tickers = self.env.stock_tickers[:2]
+        params = {"tickers": ",".join(tickers), "rebalance": "monthly,weekly", "investments": "1000, 500"}
+        submitted = self.client.post("/api/jobs", json={"kind": "backtest", "params": params})
+        self.assertEqual(submitted.status_code, 202)
+        job = jobs.manager.wait(submitted.get_json()["id"], timeout=60)
+        self.assertEqual(job["status"], jobs.SUCCEEDED, job["error"])
+        result = self.client.get(f"/api/jobs/{job['id']}/result").get_json()
+        self.assertEqual(result["assets"], tickers)
+        self.assertEqual(set(result["results"]), {"monthly", "weekly"})
+        self.assertEqual(len(result["results"]["monthly"]["final_values"][0]), 2)
+        self.assertEqual(self.client.post("/api/jobs", json={"kind": "backtest",
+                                                             "params": {"rebalance": "monthly,yearly"}}).status_code, 400)
+
+    def test_projection(self):
+        query = "/api/projection?paths=4000&horizon=21&seed=5"
+        first = self.client.get(query).get_json()
+        self.assertEqual(first, self.client.get(query).get_json())
+        self.assertEqual(first["assets"], self.env.stock_tickers)
+        self.assertEqual(first["projection"]["paths"], 4000)
+        self.assertEqual(first["projection"]["days"][-1], 21)
+        final = first["projection"]["final"]["percentiles"]
+        self.assertLess(final["5"], final["50"])
+        self.assertLess(final["50"], final["95"])
+        self.assertNotEqual(first, self.client.get("/api/projection?paths=4000&horizon=21&seed=6").get_json())
+
+        body = {"tickers": [self.env.stock_tickers[0], "Bench0"], "weights": {"Bench0": 1.0},
+                "method": "normal", "paths": 2000, "investment": 500, "seed": 1}
+        normal = self.client.post("/api/projection", json=body).get_json()
+        self.assertEqual(normal["weights"], {self.env.stock_tickers[0]: 0.0, "Bench0": 1.0})
+        self.assertAlmostEqual(normal["projection"]["final"]["mean"], 500, delta=50)
+
+        submitted = self.client.post("/api/jobs", json={"kind": "projection",
+                                                        "params": {"paths": 4000, "horizon": 21, "seed": 5}})
+        job = jobs.manager.wait(submitted.get_json()["id"], timeout=60)
+        self.assertEqual(job["status"], jobs.SUCCEEDED, job["error"])
+        result = self.client.get(f"/api/jobs/{job['id']}/result").get_json()
+        self.assertEqual(result["projection"], first["projection"])
+
+        self.assertEqual(self.client.get("/api/projection?method=student").status_code, 400)
+        self.assertEqual(self.client.get("/api/projection?paths=10000000").status_code, 400)
+        self.assertEqual(self.client.post("/api/projection", json={"weights": [1.0]}).status_code, 400)
+
+    def test_rolling_correlation(self):
+        body = self.client.get("/api/rolling-correlation?days=30&group=stocks").get_json()
+        self.assertEqual(body["assets"], self.env.stock_tickers)
+        self.assertAlmostEqual(body["matrix"][0][0], 1.0)
+        dated = self.client.get("/api/rolling-correlation?days=30&group=stocks&date=" + body["date"]).get_json()
+        self.assertEqual(dated["date"], body["date"])
+        for streamed, direct in zip(body["matrix"][1], dated["matrix"][1]):
+            self.assertAlmostEqual(streamed, direct)
+
+        pair = self.env.stock_tickers[:2]
+        series = self.client.get(f"/api/rolling-correlation?days=30&pair={','.join(pair)}").get_json()
+        self.assertEqual(len(series["dates"]), len(series["correlation"]))
+        self.assertRegex(body["date"], r"^\d{4}-\d{2}-\d{2}$")
+        self.assertTrue(all(len(date) == 10 for date in series["dates"]))
+        self.assertIsNone(series["correlation"][0])
+        self.assertEqual(self.client.get("/api/rolling-correlation?days=1").status_code, 400)
+
+    def test_risk_metrics(self):
+        with patch.dict(os.environ, {"RISK_MARKET_TICKER": "B000"}):
+            body = self.client.get("/api/risk?group=all&confidence=0.99").get_json()
+            portfolio = self.client.get("/api/portfolio?investment=1000").get_json()
+        self.assertEqual(body["market"], "Bench0")
+        self.assertEqual(body["confidence"], 0.99)
+        self.assertEqual(set(body["metrics"]), set(self.env.stock_tickers) | set(self.env.bench_tickers))
+        self.assertAlmostEqual(body["metrics"]["Bench0"]["Beta"], 1.0)
+        for row in body["metrics"].values():
+            self.assertGreaterEqual(row["CVaR"], row["VaR"])
+            self.assertLessEqual(row["Max Drawdown"], 0)
+        self.assertIn("VaR", portfolio["equal_weighted"]["metrics"])
+        self.assertIn("Sortino Ratio", portfolio["optimized"]["risk"])
+
+        subset = self.client.get(f"/api/risk?tickers={self.env.stock_tickers[0]}").get_json()
+        self.assertEqual(list(subset["metrics"]), [self.env.stock_tickers[0]])
+        self.assertEqual(self.client.get("/api/risk?confidence=1.5").status_code, 400)
+
+    def test_intraday_bars_and_resampling(self):
+        tickers = self.env.stock_tickers[:3]
+        for ticker, df in make_intraday_panel(tickers, days=5, minutes=5, start="2022-03-01").items():
+            self.env.replay.save(ticker, df, interval="5m")
+        query = f"tickers={','.join(tickers)}&start=2022-03-01&end=2022-03-08&interval=5m"
+
+        raw = self.client.get(f"/api/rolling-correlation?days=20&pair={','.join(tickers[:2])}&{query}").get_json()
+        self.assertEqual(len(raw["dates"]), 5 * 78 - 1)
+        self.assertIn("T", raw["dates"][0])
+        window = self.env.app.register_window("2022-03-01", "2022-03-08")
+        self.assertTrue(self.env.database.table_exists(f"stock_{window}_5m_{tickers[0]}"))
+
+        hourly = self.client.get(f"/api/metrics?{query}&resample=1h").get_json()
+        self.assertEqual(hourly["window"], {"start": "2022-03-01", "end": "2022-03-08",
+                                            "interval": "5m", "resample": "1h"})
+        self.assertEqual(set(hourly["metrics"]), set(tickers))
+        daily = self.client.get(f"/api/correlation?{query}&resample=1d").get_json()
+        self.assertEqual(daily["assets"], tickers)
+
+        frames = self.env.app.load_assets(self.env.app.specs_for(tickers[:1]), window, interval="5m", resample="1h")
+        self.assertEqual(len(frames[tickers[0]]), 5 * 7 - 1)
+        self.assertEqual(self.client.get(f"/api/metrics?{query}&resample=1m").status_code, 400)
+        self.assertEqual(self.client.get("/api/metrics?interval=3m").status_code, 400)
+
+    def test_group_metrics_and_errors(self):
+        groups = self.client.get("/api/group-metrics").get_json()["groups"]
+        self.assertIn("Average Daily Return", groups["Stocks"])
+        self.assertEqual(self.client.get("/api/metrics?group=bonds").status_code, 400)
+        self.assertEqual(self.client.get("/api/portfolio?investment=abc").status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
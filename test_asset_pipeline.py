@@ -3,6 +3,7 @@
 # of critical functions (such as daily return calculations and data cleaning),
 # and allowed more time to focus on integrating and refining the overall system.
 import unittest
+from unittest.mock import MagicMock, patch
 import pandas as pd
 import numpy as np
 from assets import fetch_asset_data, calculate_daily_returns, clean_missing_data, process_asset_data
@@ -52,5 +53,11 @@ class TestAssetDataPipeline(unittest.TestCase):
         # Verify that the expected columns exist.
         self.assertIn("Close", df.columns)
 
+    def test_fetch_asset_data_keeps_interval_with_dates(self):
+        source = MagicMock()
+        with patch("datasource.get_data_source", return_value=source):
+            fetch_asset_data("GLD", start="2024-01-02", end="2024-01-05", interval="15m")
+        source.history.assert_called_once_with("GLD", start="2024-01-02", end="2024-01-05", interval="15m")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
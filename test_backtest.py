@@ -0,0 +1,79 @@
+# Tests for the vectorized backtesting engine.
+import unittest
+import numpy as np
+import backtest
+
+
+def reference_equity(returns, weights, period):
+    # Straightforward day-by-day simulation of one portfolio.
+    holdings = np.array(weights, dtype=float)
+    cash = 1.0 - holdings.sum()
+    curve = []
+    for day, r in enumerate(returns):
+        if period and day and day % period == 0:
+            value = holdings.sum() + cash
+            holdings = np.array(weights) * value
+            cash = (1.0 - sum(weights)) * value
+        holdings = holdings * (1 + r)
+        curve.append(holdings.sum() + cash)
+    return np.array(curve)
+
+
+class TestBacktest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.returns = rng.normal(0.001, 0.02, (45, 4))
+        self.weights = backtest.random_weights(6, 4, seed=1)
+
+    def test_matches_day_by_day_simulation(self):
+        for period in (None, 1, 5, 21, 45):
+            equity = backtest.equity_curves(self.returns, self.weights, period)
+            for i, weights in enumerate(self.weights):
+                np.testing.assert_allclose(equity[:, i], reference_equity(self.returns, weights, period))
+
+    def test_cash_and_daily_rebalancing(self):
+        weights = np.array([[0.25, 0.25, 0.0, 0.0]])
+        equity = backtest.equity_curves(self.returns, weights, 1)[:, 0]
+        expected = np.cumprod(1 + self.returns[:, :2].mean(axis=1) / 2)
+        np.testing.assert_allclose(equity, expected)
+
+    def test_summary_metrics(self):
+        report = backtest.run(self.returns, self.weights, schedules=("daily",), investments=(1000, 2000))
+        stats = report["daily"]
+        daily = self.returns @ self.weights[0]
+        self.assertAlmostEqual(stats["cumulative_return"][0], np.prod(1 + daily) - 1)
+        self.assertAlmostEqual(stats["volatility"][0], daily.std(ddof=1))
+        self.assertAlmostEqual(stats["sharpe_ratio"][0], daily.mean() / daily.std(ddof=1))
+        equity = np.cumprod(1 + daily)
+        drawdown = (equity / np.maximum.accumulate(np.maximum(equity, 1)) - 1).min()
+        self.assertAlmostEqual(stats["max_drawdown"][0], drawdown)
+        np.testing.assert_allclose(stats["final_values"][0], np.array([1000, 2000]) * (1 + stats["cumulative_return"][0]))
+
+    def test_chunking_does_not_change_results(self):
+        weights = backtest.random_weights(50, 4, seed=2)
+        whole = backtest.run(self.returns, weights, schedules=("weekly",))
+        chunked = backtest.run(self.returns, weights, schedules=("weekly",), chunk_size=7)
+        for metric in backtest.METRICS:
+            np.testing.assert_allclose(whole["weekly"][metric], chunked["weekly"][metric])
+
+    def test_schedules(self):
+        self.assertIsNone(backtest.rebalance_period("none"))
+        self.assertEqual(backtest.rebalance_period("monthly"), 21)
+        self.assertEqual(backtest.rebalance_period("10"), 10)
+        for bad in ("yearly", 0):
+            with self.assertRaises(ValueError):
+                backtest.rebalance_period(bad)
+
+    def test_empty_returns_are_rejected(self):
+        with self.assertRaises(ValueError):
+            backtest.run(np.empty((0, 2)), [[0.5, 0.5]])
+
+    def test_random_weights_are_fully_invested(self):
+        for long_only in (True, False):
+            weights = backtest.random_weights(100, 5, seed=0, long_only=long_only)
+            np.testing.assert_allclose(weights.sum(axis=1), 1.0)
+        self.assertTrue((backtest.random_weights(100, 5, seed=0) >= 0).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# Tests for bar intervals and OHLCV resampling.
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import bars
+import database
+from benchmark import make_intraday_panel
+
+
+def pandas_resample(df, rule):
+    # Reference aggregation with DataFrame.resample (empty buckets dropped).
+    df = df.tz_convert("UTC").tz_localize(None)
+    out = df.resample(rule).agg({"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"})
+    return out[out["Close"].notna()]
+
+
+class TestResample(unittest.TestCase):
+    def setUp(self):
+        self.bars = make_intraday_panel(["A"], days=6, minutes=5)["A"]
+
+    def test_matches_pandas_resample(self):
+        for target, rule in (("1h", "60min"), ("1d", "1D"), ("1wk", "W-SUN")):
+            got = bars.resample_ohlcv(self.bars, target)
+            expected = pandas_resample(self.bars, rule)
+            np.testing.assert_allclose(got[list(bars.OHLCV)].to_numpy(), expected.to_numpy())
+            if target != "1wk":
+                self.assertTrue((got.index == expected.index).all())
+        self.assertEqual(len(bars.resample_ohlcv(self.bars, "1d")), 6)
+
+    def test_chunks_match_whole_frame(self):
+        whole = bars.resample_ohlcv(self.bars, "1h")
+        for size in (7, 100, 1000):
+            chunked = bars.resample_chunks(bars.frame_chunks(self.bars, size), "1h")
+            pd.testing.assert_frame_equal(chunked, whole)
+
+    def test_frames_with_a_date_column(self):
+        stored = self.bars.tz_convert("UTC").tz_localize(None).reset_index()
+        pd.testing.assert_frame_equal(bars.resample_ohlcv(stored, "1d"), bars.resample_ohlcv(self.bars, "1d"))
+
+    def test_validate(self):
+        bars.validate("5m", "1h")
+        for interval, target in (("7m", None), ("1h", "5m"), ("1d", "1d"), ("1d", "2wk")):
+            with self.assertRaises(ValueError):
+                bars.validate(interval, target)
+        self.assertTrue(bars.is_intraday("90m"))
+        self.assertFalse(bars.is_intraday("1d"))
+        self.assertEqual(bars.resolution("5m", "1h"), "5m>1h")
+
+
+class TestReadResampled(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"DATABASE_URL": f"sqlite:///{os.path.join(self.tmp.name, 'test.db')}"})
+        self.env.start()
+        database.dispose_engine()
+
+    def tearDown(self):
+        database.dispose_engine()
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_stored_table_is_resampled_in_chunks(self):
+        raw = make_intraday_panel(["A"], days=4, minutes=1)["A"]
+        database.store_df_to_db(raw, "stock_recent_1m_A")
+        with patch("pandas.read_sql", wraps=pd.read_sql) as read_sql:
+            got = bars.read_resampled("stock_recent_1m_A", "1h", size=500)
+        self.assertEqual(read_sql.call_args.kwargs["chunksize"], 500)
+        # SQLite stores the exchange's wall-clock times without the offset.
+        pd.testing.assert_frame_equal(got, bars.resample_ohlcv(raw.tz_localize(None), "1h"), check_freq=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+# Smoke test for the benchmark suite: runs every stage on a tiny synthetic panel.
+import unittest
+from benchmark import make_price_panel, run_benchmarks, compare
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+    def test_price_panel_shape(self):
+        panel = make_price_panel(['A', 'B'], days=10, seed=1)
+        self.assertEqual(set(panel), {'A', 'B'})
+        self.assertEqual(len(panel['A']), 10)
+        self.assertIn('Close', panel['A'].columns)
+
+    def test_run_and_compare(self):
+        report = run_benchmarks(n_tickers=2, days=330, repeat=1)
+        stages = report["results"]
+        self.assertIn("GET / (warm)", stages)
+        self.assertIn("calculate_portfolio_metrics", stages)
+        for entry in stages.values():
+            self.assertGreater(entry["seconds"], 0)
+
+        slower = {"results": {stage: dict(entry, seconds=entry["seconds"] * 2) for stage, entry in stages.items()}}
+        rows = compare(slower, report, threshold=0.5)
+        self.assertEqual(len(rows), len(stages))
+        self.assertTrue(all(regressed for *_, regressed in rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# Tests for the in-process DataFrame cache and its use by the app loaders.
+import unittest
+from unittest import mock
+import pandas as pd
+import cache
+from cache import DataFrameCache
+
+
+class TestDataFrameCache(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({'Daily_Return': [0.01, -0.02]})
+
+    def test_hit_and_miss_counters(self):
+        frames = DataFrameCache(max_entries=4)
+        self.assertIsNone(frames.get(('AAPL', 'train', '1d')))
+        frames.set(('AAPL', 'train', '1d'), self.df)
+        self.assertIs(frames.get(('AAPL', 'train', '1d')), self.df)
+        stats = frames.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_lru_eviction(self):
+        frames = DataFrameCache(max_entries=2)
+        frames.set('a', self.df)
+        frames.set('b', self.df)
+        frames.get('a')  # 'b' is now the least recently used entry
+        frames.set('c', self.df)
+        self.assertIsNotNone(frames.get('a'))
+        self.assertIsNone(frames.get('b'))
+        self.assertEqual(frames.stats()["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        frames = DataFrameCache(max_entries=2, ttl=10)
+        with mock.patch('cache.time.monotonic', return_value=100.0):
+            frames.set('a', self.df)
+        with mock.patch('cache.time.monotonic', return_value=105.0):
+            self.assertIsNotNone(frames.get('a'))
+        with mock.patch('cache.time.monotonic', return_value=111.0):
+            self.assertIsNone(frames.get('a'))
+
+    def test_invalidate_table(self):
+        frames = DataFrameCache()
+        frames.set(('AAPL', 'train', '1d'), self.df, table_name='stock_train_AAPL')
+        frames.set(('TSLA', 'train', '1d'), self.df, table_name='stock_train_TSLA')
+        self.assertEqual(frames.invalidate_table('stock_train_AAPL'), 1)
+        self.assertIsNone(frames.get(('AAPL', 'train', '1d')))
+        self.assertIsNotNone(frames.get(('TSLA', 'train', '1d')))
+
+
+class TestLoaderUsesCache(unittest.TestCase):
+    def setUp(self):
+        cache.frame_cache.clear()
+
+    def tearDown(self):
+        cache.frame_cache.clear()
+
+    def test_second_load_skips_database(self):
+        import app
+        df = pd.DataFrame({'Daily_Return': [0.01], 'Cumulative_Return': [0.01]})
+        with mock.patch('app.ingest.plan_window', return_value={'stock_train_AAPL': None}) as exists, \
+                mock.patch('app.database.read_table', return_value=df) as read:
+            first = app.load_asset_window("stock", "AAPL", "AAPL", "train")
+            second = app.load_asset_window("stock", "AAPL", "AAPL", "train")
+        self.assertIs(first, second)
+        self.assertEqual(exists.call_count, 1)
+        self.assertEqual(read.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
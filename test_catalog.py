@@ -0,0 +1,112 @@
+# Tests for the cached database catalog, run against a temporary SQLite database.
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+import catalog
+import database
+import instrumentation
+
+
+def make_frame(start, days):
+    index = pd.DatetimeIndex(pd.bdate_range(start, periods=days, tz="America/New_York"), name="Date")
+    return pd.DataFrame({"Close": 100 + np.arange(days, dtype=float), "Daily_Return": np.full(days, 0.01)}, index=index)
+
+
+class TestTableCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self._url = os.environ.get("DATABASE_URL")
+        self.url = f"sqlite:///{os.path.join(self.tmp.name, 'test.db')}"
+        os.environ["DATABASE_URL"] = self.url
+        database.dispose_engine()
+        self.catalog = catalog.table_catalog
+
+    def tearDown(self):
+        database.dispose_engine()
+        if self._url is None:
+            del os.environ["DATABASE_URL"]
+        else:
+            os.environ["DATABASE_URL"] = self._url
+        self.tmp.cleanup()
+
+    def count_round_trips(self, func):
+        record = instrumentation.begin_request()
+        try:
+            func()
+        finally:
+            instrumentation.finish_request("test", "GET", 200)
+        return record.counters["db_round_trips"]
+
+    def test_existence_checks_use_the_cached_catalog(self):
+        self.assertEqual(self.catalog.missing(["stock_train_A"]), ["stock_train_A"])
+        database.store_df_to_db(make_frame("2023-01-02", 5), "stock_train_A")
+        # Known from the write itself, without another catalog scan.
+        trips = self.count_round_trips(lambda: [database.table_exists("stock_train_A") for _ in range(20)])
+        self.assertEqual(trips, 0)
+        self.assertIn("stock_train_A", database.list_tables())
+
+    def test_ddl_statements_update_the_catalog(self):
+        self.catalog.tables()
+        with database.get_engine().begin() as conn:
+            conn.execute(text('CREATE TABLE IF NOT EXISTS "raw_table" (x INTEGER)'))
+        self.assertTrue(self.catalog.exists("raw_table"))
+        with database.get_engine().begin() as conn:
+            conn.execute(text('DROP TABLE "raw_table"'))
+        self.assertNotIn("raw_table", self.catalog.tables())
+
+    def test_tables_created_elsewhere_are_found_on_recheck(self):
+        self.catalog.tables()
+        other = create_engine(self.url)
+        make_frame("2023-01-02", 3).to_sql("stock_train_B", other)
+        other.dispose()
+        self.catalog.recheck = 0
+        try:
+            self.assertEqual(self.catalog.missing(["stock_train_B"]), [])
+        finally:
+            self.catalog.recheck = None
+
+    def test_stats_for_many_tables_in_one_query(self):
+        for i in range(5):
+            database.store_df_to_db(make_frame("2023-01-02", 10 + i), f"stock_train_T{i}")
+        names = [f"stock_train_T{i}" for i in range(5)] + ["stock_train_missing"]
+        self.catalog.tables()
+        stats = {}
+        trips = self.count_round_trips(lambda: stats.update(self.catalog.stats(names, refresh=True)))
+        self.assertEqual(trips, 1)
+        self.assertEqual(set(stats), set(names[:5]))
+        self.assertEqual(stats["stock_train_T2"].rows, 12)
+        self.assertEqual(stats["stock_train_T2"].checksum, float(sum(100 + np.arange(12))))
+        self.assertLess(stats["stock_train_T2"].first_date, stats["stock_train_T2"].last_date)
+
+    def test_stats_expire_so_writes_elsewhere_are_seen(self):
+        database.store_df_to_db(make_frame("2023-01-02", 5), "stock_train_C")
+        self.assertEqual(self.catalog.stats(["stock_train_C"])["stock_train_C"].rows, 5)
+        other = create_engine(self.url)
+        make_frame("2023-01-02", 8).to_sql("stock_train_C", other, if_exists="replace")
+        other.dispose()
+        self.assertEqual(self.catalog.stats(["stock_train_C"])["stock_train_C"].rows, 5)
+        self.catalog.stats_ttl = 0
+        try:
+            self.assertEqual(self.catalog.stats(["stock_train_C"])["stock_train_C"].rows, 8)
+        finally:
+            self.catalog.stats_ttl = None
+
+    def test_stats_skip_tables_without_the_columns(self):
+        database.store_df_to_db(make_frame("2023-01-02", 4), "stock_train_C")
+        pd.DataFrame({"x": [1]}).to_sql("other", database.get_engine(), index=False)
+        stats = self.catalog.stats(["stock_train_C", "other"], refresh=True)
+        self.assertEqual(list(stats), ["stock_train_C"])
+
+    def test_read_table_matches_read_sql_table(self):
+        database.store_df_to_db(make_frame("2023-01-02", 6), "stock_train_D")
+        trips = self.count_round_trips(lambda: database.read_table("stock_train_D"))
+        self.assertEqual(trips, 1)
+        pd.testing.assert_frame_equal(database.read_table("stock_train_D"),
+                                      pd.read_sql_table("stock_train_D", database.get_engine()))
+
+
+if __name__ == '__main__':
+    unittest.main()
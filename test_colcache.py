@@ -0,0 +1,75 @@
+# Tests for the columnar cache tier, run against a temporary SQLite database.
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import colcache
+import database
+import stocks
+
+
+def processed_frame(days=30, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2024-01-01", periods=days, tz="America/New_York", name="Date")
+    close = 100 * np.cumprod(1 + rng.normal(0, 0.01, days))
+    raw = pd.DataFrame({"Open": close, "High": close, "Low": close, "Close": close,
+                        "Volume": rng.integers(1, 1000, days)}, index=index)
+    return stocks.process_stock_data(raw)
+
+
+class TestColumnarCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self._env = {key: os.environ.get(key) for key in ("DATABASE_URL", "COLUMNAR_CACHE_DIR")}
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(self.tmp.name, 'test.db')}"
+        os.environ["COLUMNAR_CACHE_DIR"] = os.path.join(self.tmp.name, "columnar")
+        database.dispose_engine()
+
+    def tearDown(self):
+        database.dispose_engine()
+        for key, value in self._env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        self.tmp.cleanup()
+
+    def test_read_through_and_memory_mapped_hit(self):
+        database.store_df_to_db(processed_frame(), "stock_train_BRK-B")
+        token = colcache.table_versions(["stock_train_BRK-B"])["stock_train_BRK-B"]
+        from_db = colcache.read_table("stock_train_BRK-B", token)
+        cached = colcache.load("stock_train_BRK-B", token)
+        self.assertIsNotNone(cached)
+        self.assertEqual(list(cached.columns), list(from_db.columns))
+        pd.testing.assert_series_equal(cached["Close"], from_db["Close"])
+        self.assertTrue((cached["Date"] == from_db["Date"]).all())
+        self.assertTrue((cached["Predicted_Direction"].astype(str) == from_db["Predicted_Direction"]).all())
+        # Zero-copy: the float columns are views of read-only memory maps.
+        self.assertFalse(cached["Close"].to_numpy().flags.writeable)
+
+    def test_database_changes_invalidate(self):
+        database.store_df_to_db(processed_frame(), "stock_train_AAPL")
+        token = colcache.table_versions(["stock_train_AAPL"])["stock_train_AAPL"]
+        colcache.read_table("stock_train_AAPL", token)
+        database.store_df_to_db(processed_frame(seed=1), "stock_train_AAPL")
+        new_token = colcache.table_versions(["stock_train_AAPL"])["stock_train_AAPL"]
+        self.assertNotEqual(token, new_token)
+        self.assertIsNone(colcache.load("stock_train_AAPL", new_token))
+        colcache.read_table("stock_train_AAPL", new_token)
+        self.assertIsNotNone(colcache.load("stock_train_AAPL", new_token))
+        # Only the current version is kept on disk.
+        entries = [e for e in os.listdir(os.path.join(os.environ["COLUMNAR_CACHE_DIR"], "stock_train_AAPL"))
+                   if not e.startswith(".")]
+        self.assertEqual(len(entries), 2)
+
+    def test_versions_for_many_tables_in_one_query(self):
+        for ticker in ("A", "B", "C"):
+            database.store_df_to_db(processed_frame(), f"stock_train_{ticker}")
+        versions = colcache.table_versions([f"stock_train_{t}" for t in ("A", "B", "C")])
+        self.assertEqual(len(versions), 3)
+        self.assertEqual(colcache.table_versions(["missing_table"]), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,7 @@ import unittest
 import os
 import pandas as pd
 from sqlalchemy.engine import Engine
+import database
 from database import get_engine, table_exists, store_df_to_db
 
 class TestDatabaseFunctions(unittest.TestCase):
@@ -26,6 +27,30 @@ class TestDatabaseFunctions(unittest.TestCase):
         self.assertIsInstance(engine, Engine)
         engine.dispose()
 
+    def test_get_engine_is_shared(self):
+        # The engine (and its connection pool) is created once per process and reused.
+        database.dispose_engine()
+        self.assertIs(get_engine(), get_engine())
+
+    def test_get_engine_rebuilt_after_fork(self):
+        # An engine inherited from another process id is replaced rather than reused.
+        engine = get_engine()
+        database._engine_pid = -1
+        self.assertIsNot(get_engine(), engine)
+
+    def test_pool_settings_from_env(self):
+        os.environ["DB_POOL_SIZE"] = "3"
+        os.environ["DB_POOL_MAX_OVERFLOW"] = "0"
+        try:
+            database.dispose_engine()
+            stats = database.pool_status()
+            self.assertEqual(stats["size"], 3)
+            self.assertEqual(stats["checkedout"], 0)
+        finally:
+            del os.environ["DB_POOL_SIZE"]
+            del os.environ["DB_POOL_MAX_OVERFLOW"]
+            database.dispose_engine()
+
     def test_store_and_table_exists(self):
         # Create a sample DataFrame for testing.
         df = pd.DataFrame({
@@ -0,0 +1,88 @@
+# Tests for the pluggable market data sources, using file-backed replay fixtures.
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import datasource
+from datasource import ReplaySource, RecordingSource, DataSource, create_data_source
+from stocks import fetch_stock_data
+from assets import fetch_asset_data
+
+
+def make_prices(start="2023-01-02", days=30):
+    index = pd.bdate_range(start, periods=days, tz="America/New_York", name="Date")
+    close = 100 * np.cumprod(1 + np.linspace(-0.01, 0.01, days))
+    return pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close,
+                         'Volume': np.arange(days)}, index=index)
+
+
+class TestReplaySource(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = ReplaySource(self.tmp.name)
+        self.prices = make_prices()
+        self.source.save('AAPL', self.prices)
+
+    def tearDown(self):
+        datasource.set_data_source(None)
+        self.tmp.cleanup()
+
+    def test_history_filters_half_open_window(self):
+        df = ReplaySource(self.tmp.name).history('AAPL', start='2023-01-03', end='2023-01-06')
+        self.assertEqual(len(df), 3)
+        self.assertEqual(df.index[0], pd.Timestamp('2023-01-03', tz='America/New_York'))
+        np.testing.assert_allclose(df['Close'].values, self.prices['Close'].iloc[1:4].values)
+
+    def test_history_by_period(self):
+        df = ReplaySource(self.tmp.name).history('AAPL', period='5d')
+        self.assertLessEqual(len(df), 5)
+        self.assertEqual(df.index[-1], self.prices.index[-1])
+
+    def test_missing_fixture_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            self.source.history('MSFT', period='1mo')
+
+    def test_pipeline_fetches_use_configured_source(self):
+        datasource.set_data_source(ReplaySource(self.tmp.name))
+        stock_df = fetch_stock_data('AAPL', start='2023-01-01', end='2023-02-01')
+        asset_df = fetch_asset_data('AAPL', start='2023-01-01', end='2023-02-01')
+        self.assertEqual(len(stock_df), len(asset_df))
+        self.assertFalse(stock_df.empty)
+        # Missing fixtures are reported like any other fetch error.
+        self.assertIsNone(fetch_stock_data('MSFT', period='1mo'))
+
+    def test_recording_source_merges_windows(self):
+        class Stub(DataSource):
+            def history(self, ticker, start=None, end=None, period='3y', interval='1d'):
+                return make_prices(start, days=5)
+
+        replay = ReplaySource(os.path.join(self.tmp.name, 'recorded'))
+        recorder = RecordingSource(Stub(), replay)
+        recorder.history('SPY', start='2023-01-02', end='2023-01-09')
+        recorder.history('SPY', start='2023-02-01', end='2023-02-08')
+        self.assertEqual(len(ReplaySource(replay.directory).history('SPY', period='1y')), 10)
+
+    def test_concurrent_recordings_keep_every_window(self):
+        class Stub(DataSource):
+            def history(self, ticker, start=None, end=None, period='3y', interval='1d'):
+                return make_prices(start, days=5)
+
+        replay = ReplaySource(os.path.join(self.tmp.name, 'concurrent'))
+        recorder = RecordingSource(Stub(), replay)
+        starts = [str(day.date()) for day in pd.bdate_range('2023-01-02', periods=40, freq='7B')]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda start: recorder.history('QQQ', start=start, end=start), starts))
+        self.assertEqual(len(ReplaySource(replay.directory).history('QQQ', period='5y')), 5 * len(starts))
+        self.assertEqual(os.listdir(replay.directory), ['QQQ_1d.csv'])
+
+    def test_create_data_source_by_name(self):
+        self.assertEqual(create_data_source('replay', self.tmp.name).name, 'replay')
+        self.assertEqual(create_data_source('yfinance').name, 'yfinance')
+        with self.assertRaises(ValueError):
+            create_data_source('unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+# Tests for the concurrent batch fetcher, using a local stub data source instead of yfinance.
+import threading
+import time
+import unittest
+import pandas as pd
+from fetcher import fetch_batch, RateLimiter
+from stocks import fetch_stocks_batch
+from assets import fetch_assets_batch
+
+
+class StubSource:
+    """Returns a small price frame per ticker and records how it was called."""
+
+    def __init__(self, delay=0.0, failures=None):
+        self.delay = delay
+        self.failures = dict(failures or {})
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, ticker, start=None, end=None, interval='1d'):
+        with self._lock:
+            self.calls.append((ticker, start, end, interval))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if self.failures.get(ticker, 0) > 0:
+                self.failures[ticker] -= 1
+                raise ConnectionError(f"stub failure for {ticker}")
+            return pd.DataFrame({'Close': [100.0, 101.0, 102.0]})
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class TestFetchBatch(unittest.TestCase):
+    def test_stocks_batch_returns_every_ticker_and_window(self):
+        source = StubSource()
+        windows = {'train': ('2022-01-01', '2022-12-31'), 'test': ('2023-01-01', '2023-03-31')}
+        results = fetch_stocks_batch(['AAPL', 'MSFT'], windows, fetch=source, rate_limit=0, backoff=0)
+        self.assertEqual(set(results), {('AAPL', 'train'), ('AAPL', 'test'), ('MSFT', 'train'), ('MSFT', 'test')})
+        self.assertIn(('AAPL', '2023-01-01', '2023-03-31', '1d'), source.calls)
+
+    def test_runs_concurrently_up_to_max_workers(self):
+        source = StubSource(delay=0.05)
+        fetch_assets_batch(['SPY', 'GLD', 'SLV', 'USO'], {'train': ('2022-01-01', '2022-12-31')},
+                           fetch=source, max_workers=2, rate_limit=0)
+        self.assertEqual(source.max_active, 2)
+
+    def test_retries_failures_with_backoff(self):
+        source = StubSource(failures={'AAPL': 1, 'TSLA': 5})
+        results = fetch_stocks_batch(['AAPL', 'TSLA'], {'train': ('2022-01-01', '2022-12-31')},
+                                     fetch=source, retries=2, backoff=0, rate_limit=0)
+        self.assertIsNotNone(results[('AAPL', 'train')])
+        self.assertIsNone(results[('TSLA', 'train')])
+        self.assertEqual(len([c for c in source.calls if c[0] == 'TSLA']), 3)
+
+    def test_timeout_marks_job_failed(self):
+        results = fetch_batch({'slow': lambda: time.sleep(0.5)}, timeout=0.05, retries=0, rate_limit=0)
+        self.assertIsNone(results['slow'])
+
+    def test_rate_limiter_spaces_calls(self):
+        limiter = RateLimiter(rate=20)
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# Tests for incremental ingestion, run against a temporary SQLite database.
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import database
+import ingest
+from stocks import process_stock_data
+
+
+def make_prices(start, days):
+    index = pd.bdate_range(start, periods=days, name="Date")
+    close = 100 * np.cumprod(1 + np.sin(np.arange(days)) / 50)
+    return pd.DataFrame({'Close': close}, index=index)
+
+
+class TestIncrementalIngestion(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self._url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(self.tmp.name, 'test.db')}"
+        database.dispose_engine()
+        self.prices = make_prices("2023-01-02", 40)
+
+    def tearDown(self):
+        database.dispose_engine()
+        if self._url is None:
+            del os.environ["DATABASE_URL"]
+        else:
+            os.environ["DATABASE_URL"] = self._url
+        self.tmp.cleanup()
+
+    def test_continue_processing_matches_full_processing(self):
+        full = process_stock_data(self.prices)
+        head = full.iloc[:20].reset_index()
+        tail = ingest.continue_processing(self.prices.iloc[15:], head.iloc[-1], process_stock_data)
+        np.testing.assert_allclose(tail['Daily_Return'].values, full['Daily_Return'].iloc[20:].values)
+        np.testing.assert_allclose(tail['Cumulative_Return'].values, full['Cumulative_Return'].iloc[20:].values)
+
+    def test_apply_increment_appends_only_new_rows(self):
+        table = "stock_train_Y"
+        ingest.apply_increment(table, self.prices.iloc[:20], process_stock_data, "2023-01-28")
+        plan = ingest.plan_window([table], "2023-01-01", "2023-03-01")[table]
+        self.assertEqual(plan, ingest.Fetch("2023-01-28", "2023-03-01", False))
+        start, end = plan.start, plan.end
+        new_bars = self.prices[self.prices.index >= start]
+        written = ingest.apply_increment(table, new_bars, process_stock_data, end)
+        self.assertEqual(written, len(new_bars))
+
+        stored = pd.read_sql_table(table, database.get_engine())
+        full = process_stock_data(self.prices)
+        self.assertEqual(len(stored), len(full))
+        np.testing.assert_allclose(stored['Cumulative_Return'].values, full['Cumulative_Return'].values)
+        self.assertIsNone(ingest.plan_window([table], "2023-01-01", "2023-03-01")[table])
+
+    def test_plan_window_compares_stored_dates_with_the_window(self):
+        stored = process_stock_data(self.prices)  # 2023-01-03 .. 2023-02-24
+        for table in ("stock_train_A", "stock_train_B"):
+            database.store_df_to_db(stored, table)
+        ingest.record_state("stock_train_A", stored.index.max(), "2023-03-01", "2023-01-01")
+        plans = ingest.plan_window(["stock_train_A", "stock_train_B", "stock_train_C"], "2023-01-01", "2023-03-01")
+        # B has no recorded fetch, so its coverage ends the day after its last row.
+        self.assertEqual(plans, {"stock_train_A": None,
+                                 "stock_train_B": ingest.Fetch("2023-02-25", "2023-03-01", False),
+                                 "stock_train_C": ingest.Fetch("2023-01-01", "2023-03-01", True)})
+        # The window's dates changed: rows before the new start, a later start or an earlier end.
+        self.assertTrue(ingest.plan_window(["stock_train_A"], "2023-01-10", "2023-03-01")["stock_train_A"].replace)
+        self.assertTrue(ingest.plan_window(["stock_train_A"], "2022-12-01", "2023-03-01")["stock_train_A"].replace)
+        self.assertTrue(ingest.plan_window(["stock_train_A"], "2023-01-01", "2023-02-01")["stock_train_A"].replace)
+        # A longer window only needs the range after the last fetch.
+        self.assertEqual(ingest.plan_window(["stock_train_A"], "2023-01-01", "2023-04-01")["stock_train_A"],
+                         ingest.Fetch("2023-03-01", "2023-04-01", False))
+
+    def test_plan_window_keeps_a_late_listing_with_recorded_range(self):
+        stored = process_stock_data(self.prices.iloc[20:])
+        database.store_df_to_db(stored, "stock_train_L")
+        # Without a recorded range the late first row looks like a shorter earlier window.
+        self.assertTrue(ingest.plan_window(["stock_train_L"], "2023-01-01", "2023-03-01")["stock_train_L"].replace)
+        ingest.record_state("stock_train_L", stored.index.max(), "2023-03-01", "2023-01-01")
+        self.assertIsNone(ingest.plan_window(["stock_train_L"], "2023-01-01", "2023-03-01")["stock_train_L"])
+
+
+if __name__ == '__main__':
+    unittest.main()
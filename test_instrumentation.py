@@ -0,0 +1,130 @@
+# Tests for request timing, counters, the Prometheus registry and the slow-request profiler.
+import os
+import time
+import unittest
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+import instrumentation
+from benchmark import BenchmarkEnvironment
+
+
+class TestStages(unittest.TestCase):
+    def setUp(self):
+        self.record = instrumentation.begin_request()
+
+    def tearDown(self):
+        instrumentation.finish_request("test", "GET", 200)
+
+    def test_stage_times_and_nesting(self):
+        with instrumentation.stage("db_read"):
+            with instrumentation.stage("db_read"):
+                time.sleep(0.01)
+            with instrumentation.stage("process"):
+                pass
+        total, calls = self.record.stages["db_read"]
+        self.assertEqual(calls, 1)
+        self.assertGreaterEqual(total, 0.01)
+        self.assertIn("process", self.record.stages)
+
+    def test_timed_decorator(self):
+        @instrumentation.timed("correlation")
+        def compute(x):
+            return x * 2
+
+        self.assertEqual(compute(3), 6)
+        self.assertEqual(self.record.stages["correlation"][1], 1)
+
+    def test_counts_db_round_trips_and_cache_lookups(self):
+        engine = instrumentation.instrument_engine(create_engine("sqlite://"))
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+        instrumentation.cache_lookup("frames", True)
+        instrumentation.cache_lookup("frames", False)
+        self.assertEqual(self.record.counters["db_round_trips"], 2)
+        self.assertEqual(self.record.counters["frames_hit"], 1)
+        self.assertEqual(self.record.counters["frames_miss"], 1)
+
+    def test_server_timing_header(self):
+        with instrumentation.stage("render"):
+            pass
+        instrumentation.count("db_round_trips", 3)
+        record = instrumentation.finish_request("test", "GET", 200)
+        header = record.server_timing()
+        self.assertRegex(header, r"^render;dur=\d+\.\d")
+        self.assertIn('db_round_trips;desc="3"', header)
+        self.assertRegex(header, r"total;dur=\d+\.\d$")
+
+
+class TestRegistry(unittest.TestCase):
+    def test_prometheus_text(self):
+        registry = instrumentation.Registry(buckets=(0.1, 1.0))
+        registry.inc("app_requests_total", {"endpoint": "index", "method": "GET", "status": "200"})
+        registry.inc("app_requests_total", {"endpoint": "index", "method": "GET", "status": "200"})
+        registry.observe("app_stage_duration_seconds", {"stage": "db_read"}, 0.5)
+        text_format = registry.render()
+        self.assertIn('app_requests_total{endpoint="index",method="GET",status="200"} 2', text_format)
+        self.assertIn('app_stage_duration_seconds_bucket{stage="db_read",le="0.1"} 0', text_format)
+        self.assertIn('app_stage_duration_seconds_bucket{stage="db_read",le="1.0"} 1', text_format)
+        self.assertIn('app_stage_duration_seconds_bucket{stage="db_read",le="+Inf"} 1', text_format)
+        self.assertIn('app_stage_duration_seconds_sum{stage="db_read"} 0.5', text_format)
+        self.assertIn("# TYPE app_db_round_trips_total counter", text_format)
+
+    def test_label_values_are_escaped(self):
+        registry = instrumentation.Registry()
+        registry.inc("app_slow_requests_total", {"endpoint": 'a"b'})
+        self.assertIn('app_slow_requests_total{endpoint="a\\"b"} 1', registry.render())
+
+
+class TestSlowRequestProfiler(unittest.TestCase):
+    def test_samples_slow_requests(self):
+        with patch.dict(os.environ, {"PROFILE_SLOW_REQUESTS_MS": "10", "PROFILE_SAMPLE_INTERVAL_MS": "1"}):
+            instrumentation.begin_request()
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                pass
+            record = instrumentation.finish_request("slow", "GET", 200)
+        self.assertGreater(sum(record.samples.values()), 0)
+        self.assertTrue(any("test_samples_slow_requests" in stack for stack in record.samples))
+        self.assertEqual(instrumentation.profiler.recent[-1]["endpoint"], "slow")
+
+    def test_fast_requests_are_not_sampled(self):
+        with patch.dict(os.environ, {"PROFILE_SLOW_REQUESTS_MS": "10000", "PROFILE_SAMPLE_INTERVAL_MS": "1"}):
+            instrumentation.begin_request()
+            time.sleep(0.02)
+            record = instrumentation.finish_request("fast", "GET", 200)
+        self.assertEqual(sum(record.samples.values()), 0)
+
+
+class TestAppInstrumentation(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.env = BenchmarkEnvironment(n_tickers=4, days=200).__enter__()
+        cls.client = cls.env.app.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.env.__exit__(None, None, None)
+
+    def test_server_timing_and_metrics_endpoint(self):
+        response = self.client.get("/api/metrics?group=stocks")
+        self.assertEqual(response.status_code, 200)
+        header = response.headers["Server-Timing"]
+        self.assertIn("metrics;dur=", header)
+        self.assertIn("db_round_trips;desc=", header)
+        self.assertIn("total;dur=", header)
+
+        # Served from the frame cache the second time.
+        again = self.client.get("/api/metrics?group=stocks").headers["Server-Timing"]
+        self.assertRegex(again, r'frames_hit;desc="\d+"')
+        self.assertNotIn("frames_miss", again)
+
+        metrics = self.client.get("/metrics")
+        self.assertTrue(metrics.content_type.startswith("text/plain"))
+        body = metrics.get_data(as_text=True)
+        self.assertIn('app_requests_total{endpoint="api_metrics",method="GET",status="200"}', body)
+        self.assertIn('app_stage_duration_seconds_count{stage="db_read"}', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+# Tests for the job subsystem, run against a temporary SQLite database.
+import operator
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+import database
+import jobs
+from jobs import JobManager
+
+
+def slow_square(params, context):
+    for step in range(4):
+        context.progress(step / 4, f"step {step}")
+        time.sleep(0.01)
+    return {"square": params["x"] ** 2}
+
+
+def failing(params, context):
+    raise RuntimeError("boom")
+
+
+def pooled_products(params, context):
+    return context.map_cpu(operator.mul, [(x, x) for x in params["xs"]])
+
+
+class TestJobManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self._environ = patch.dict(os.environ, {
+            "DATABASE_URL": f"sqlite:///{os.path.join(self.tmp.name, 'test.db')}", "JOB_PROCESSES": "0"})
+        self._environ.start()
+        database.dispose_engine()
+        self.manager = JobManager()
+        self.manager.register("square", slow_square)
+        self.manager.register("fail", failing)
+        self.manager.register("products", pooled_products)
+        self.manager.register("square_once", slow_square, reuse_results=False)
+
+    def tearDown(self):
+        database.dispose_engine()
+        self._environ.stop()
+        self.tmp.cleanup()
+
+    def test_submit_runs_and_stores_result(self):
+        job, created = self.manager.submit("square", {"x": 7})
+        self.assertTrue(created)
+        self.assertIn(job["status"], jobs.PENDING)
+        finished = self.manager.wait(job["id"], timeout=10)
+        self.assertEqual(finished["status"], jobs.SUCCEEDED)
+        self.assertEqual(finished["progress"], 1.0)
+        self.assertIsNotNone(finished["finished_at"])
+        self.assertEqual(self.manager.result(job["id"])[1], {"square": 49})
+
+    def test_identical_jobs_are_deduplicated(self):
+        first, _ = self.manager.submit("square", {"x": 3}, version="v1")
+        second, created = self.manager.submit("square", {"x": 3}, version="v1")
+        self.assertFalse(created)
+        self.assertEqual(first["id"], second["id"])
+        self.manager.wait(first["id"], timeout=10)
+        # Finished results are reused, until the data version changes or the job is forced.
+        self.assertEqual(self.manager.submit("square", {"x": 3}, version="v1")[0]["id"], first["id"])
+        self.assertNotEqual(self.manager.submit("square", {"x": 3}, version="v2")[0]["id"], first["id"])
+        self.assertTrue(self.manager.submit("square", {"x": 3}, version="v1", force=True)[1])
+
+    def test_results_not_reused_for_rerunnable_kinds(self):
+        first, _ = self.manager.submit("square_once", {"x": 2})
+        self.manager.wait(first["id"], timeout=10)
+        second, created = self.manager.submit("square_once", {"x": 2})
+        self.assertTrue(created)
+        self.assertNotEqual(first["id"], second["id"])
+
+    def test_concurrent_identical_submissions_start_one_job(self):
+        release = threading.Event()
+        self.manager.register("blocked", lambda params, context: release.wait(10))
+        barrier = threading.Barrier(8)
+        # Every submitter finds no existing job before any of them inserts one.
+        lookup = self.manager._find
+        with patch.object(self.manager, "_find",
+                          side_effect=lambda key, reuse_results=True: None if reuse_results else lookup(key, False)):
+            def submit():
+                barrier.wait()
+                return self.manager.submit("blocked", {"x": 1}, version="v1")
+            threads = [threading.Thread(target=lambda: submitted.append(submit())) for _ in range(8)]
+            submitted = []
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        release.set()
+        self.assertEqual(len({job["id"] for job, _ in submitted}), 1)
+        self.assertEqual(sum(created for _, created in submitted), 1)
+        self.manager.wait(submitted[0][0]["id"], timeout=10)
+
+    def test_failed_job(self):
+        job, _ = self.manager.submit("fail", {})
+        finished = self.manager.wait(job["id"], timeout=10)
+        self.assertEqual(finished["status"], jobs.FAILED)
+        self.assertEqual(finished["error"], "boom")
+        self.assertIsNone(self.manager.result(job["id"])[1])
+
+    def test_unknown_kind_and_id(self):
+        with self.assertRaises(ValueError):
+            self.manager.submit("nope", {})
+        self.assertIsNone(self.manager.get("missing"))
+
+    def test_abandoned_job_is_marked_failed(self):
+        job, _ = self.manager.submit("square", {"x": 1})
+        self.manager.wait(job["id"], timeout=10)
+        self.manager._update(job["id"], status=jobs.RUNNING, updated_at=time.time() - 7200)
+        status = self.manager.get(job["id"])
+        self.assertEqual(status["status"], jobs.FAILED)
+        self.assertIn("abandoned", status["error"])
+
+    def test_process_pool(self):
+        with patch.dict(os.environ, {"JOB_PROCESSES": "1"}):
+            job, _ = self.manager.submit("products", {"xs": [1, 2, 3]})
+            finished = self.manager.wait(job["id"], timeout=60)
+        self.assertEqual(finished["status"], jobs.SUCCEEDED, finished["error"])
+        self.assertEqual(self.manager.result(job["id"])[1], [1, 4, 9])
+        self.manager.process_pool().shutdown()
+
+    def test_imap_cpu_yields_in_order(self):
+        for processes in ("0", "1"):
+            with patch.dict(os.environ, {"JOB_PROCESSES": processes}):
+                manager = JobManager()
+                context = jobs.JobContext(manager, "none")
+                with patch.object(manager, "_update"):
+                    results = context.imap_cpu(operator.mul, [(x, x) for x in range(7)])
+                    self.assertEqual(next(results), 0)
+                    self.assertEqual(list(results), [x * x for x in range(1, 7)])
+                if manager.process_pool() is not None:
+                    manager.process_pool().shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# Tests for the Monte Carlo projection engine.
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import montecarlo
+
+
+class TestMonteCarlo(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        self.history = rng.normal(0.0005, 0.01, (250, 3))
+        self.weights = np.array([0.5, 0.3, 0.2])
+
+    def test_seeded_projection_is_reproducible_across_executors(self):
+        model = ("bootstrap", self.history)
+        serial = montecarlo.project(model, self.weights, 20, 5000, 1000.0, seed=11, chunk_paths=700)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            pooled = montecarlo.project(model, self.weights, 20, 5000, 1000.0, seed=11, chunk_paths=700,
+                                        executor=executor)
+        self.assertEqual(serial, pooled)
+        self.assertEqual(serial["paths"], 5000)
+        self.assertEqual(serial["days"][-1], 20)
+        self.assertNotEqual(serial, montecarlo.project(model, self.weights, 20, 5000, 1000.0, seed=12,
+                                                       chunk_paths=700))
+        bands = [serial["bands"][p][-1] for p in ("5", "25", "50", "75", "95")]
+        self.assertEqual(bands, sorted(bands))
+        self.assertEqual(serial["bands"]["50"][-1], serial["final"]["percentiles"]["50"])
+
+    def test_buy_and_hold_rebalanced_and_cash(self):
+        # With a single day to draw from, every path is the same.
+        model = ("bootstrap", np.array([[0.1, -0.05]]))
+        hold = montecarlo.project(model, [0.5, 0.5], 5, 10, seed=0)
+        self.assertAlmostEqual(hold["final"]["mean"], 0.5 * 1.1 ** 5 + 0.5 * 0.95 ** 5)
+        daily = montecarlo.project(model, [0.5, 0.5], 5, 10, seed=0, rebalance=True)
+        self.assertAlmostEqual(daily["final"]["mean"], 1.025 ** 5)
+        cash = montecarlo.project(model, [0.5, 0.0], 5, 10, seed=0)
+        self.assertAlmostEqual(cash["final"]["mean"], 0.5 * 1.1 ** 5 + 0.5)
+        self.assertEqual(cash["final"]["probability_of_loss"], 0.0)
+
+    def test_normal_model_matches_moments(self):
+        cov = np.array([[0.0004, 0.0002], [0.0002, 0.0004]])
+        factor = montecarlo.normal_factor(cov)
+        np.testing.assert_allclose(factor @ factor.T, cov, atol=1e-12)
+        model = ("normal", np.array([0.001, 0.002]), factor)
+        values = montecarlo.simulate(model, [0.5, 0.5], 1, 200000, np.random.default_rng(1))[:, 0]
+        self.assertAlmostEqual(values.mean(), 1.0015, delta=1e-4)
+        self.assertAlmostEqual(values.std(), np.sqrt(0.0003), delta=1e-4)
+
+    def test_singular_covariance_and_chunking(self):
+        factor = montecarlo.normal_factor(np.ones((2, 2)) * 1e-4)
+        np.testing.assert_allclose(factor @ factor.T, np.ones((2, 2)) * 1e-4, atol=1e-12)
+        with mock.patch.dict("os.environ", {"MONTE_CARLO_CHUNK_VALUES": "3000"}):
+            chunks = montecarlo.chunks(("bootstrap", self.history), self.weights, 10, 1000)
+        # 3000 returns per chunk = 100 paths of 10 days x 3 assets.
+        self.assertEqual([args[3] for args in chunks], [100] * 10)
+        with self.assertRaises(ValueError):
+            montecarlo.project(("student", self.history), self.weights, 10, 100)
+
+    def test_chunks_are_reduced_to_histograms(self):
+        model = ("bootstrap", self.history)
+        arguments = montecarlo.chunks(model, self.weights, 30, 20000, seed=2, chunk_paths=2500)
+        parts = [montecarlo.run_chunk(*args) for args in arguments]
+        # A chunk's summary has the same size whatever its number of paths.
+        days = len(montecarlo.band_days(30))
+        self.assertEqual({part["counts"].shape for part in parts}, {(days, montecarlo.HISTOGRAM_BINS + 2)})
+        projection = montecarlo.merge(iter(parts), 30)
+        self.assertEqual(projection["paths"], 20000)
+        # The percentiles interpolated from the merged histograms match those of the paths.
+        values = np.concatenate([montecarlo.simulate(*args[:3], args[3], np.random.default_rng(args[4]),
+                                                     args[5], args[6]) for args in arguments])
+        exact = np.percentile(values, montecarlo.PERCENTILES, axis=0)
+        for p, band in zip(montecarlo.PERCENTILES, exact):
+            np.testing.assert_allclose(projection["bands"][str(p)], band, rtol=1e-3)
+        self.assertAlmostEqual(projection["final"]["mean"], values[:, -1].mean())
+        self.assertEqual(projection["final"]["probability_of_loss"], (values[:, -1] < 1).mean())
+
+    def test_scale(self):
+        model = ("bootstrap", self.history)
+        unit = montecarlo.project(model, self.weights, 10, 500, seed=3)
+        scaled = montecarlo.scale(unit, 250.0)
+        direct = montecarlo.project(model, self.weights, 10, 500, 250.0, seed=3)
+        self.assertAlmostEqual(scaled["final"]["mean"], direct["final"]["mean"])
+        self.assertEqual(scaled["final"]["probability_of_loss"], direct["final"]["probability_of_loss"])
+        np.testing.assert_allclose(scaled["bands"]["95"], direct["bands"]["95"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# Tests for the portfolio optimizer.
+import unittest
+import numpy as np
+import optimizer
+
+
+def synthetic_returns(n_assets=40, days=500, seed=0):
+    # A few common factors plus idiosyncratic noise and a spread of expected returns.
+    rng = np.random.default_rng(seed)
+    factors = rng.normal(0, 0.01, (days, 3))
+    loadings = rng.normal(0.6, 0.4, (3, n_assets))
+    return factors @ loadings + rng.normal(0, 0.015, (days, n_assets)) + rng.normal(0.0004, 0.0003, n_assets)
+
+
+class TestCovariance(unittest.TestCase):
+    def test_ledoit_wolf_shrinks_towards_identity(self):
+        returns = synthetic_returns(n_assets=60, days=80)
+        cov, shrinkage = optimizer.ledoit_wolf(returns)
+        self.assertGreater(shrinkage, 0)
+        self.assertLess(shrinkage, 1)
+        np.testing.assert_allclose(cov, cov.T)
+        sample = np.cov(returns, rowvar=False, ddof=0)
+        # Shrinkage keeps the average variance and improves the conditioning.
+        self.assertAlmostEqual(np.trace(cov), np.trace(sample))
+        self.assertLess(np.linalg.cond(cov), np.linalg.cond(sample))
+
+    def test_unknown_estimator(self):
+        with self.assertRaises(ValueError):
+            optimizer.covariance(synthetic_returns(), "bogus")
+
+
+class TestProjection(unittest.TestCase):
+    def test_projection_meets_budget_and_bounds(self):
+        v = np.random.default_rng(1).normal(0, 1, 30)
+        for lower, upper in [(0.0, 1.0), (0.0, 0.05), (-0.2, 0.2)]:
+            w = optimizer.project(v, lower, upper)
+            self.assertAlmostEqual(w.sum(), 1.0)
+            self.assertGreaterEqual(w.min(), lower - 1e-12)
+            self.assertLessEqual(w.max(), upper + 1e-12)
+
+    def test_projection_of_feasible_point_is_identity(self):
+        w = np.array([0.2, 0.3, 0.5])
+        np.testing.assert_allclose(optimizer.project(w, 0.0, 1.0), w)
+
+
+class TestOptimize(unittest.TestCase):
+    def setUp(self):
+        returns = synthetic_returns()
+        self.mu = returns.mean(axis=0)
+        self.cov, _ = optimizer.ledoit_wolf(returns)
+
+    def test_unconstrained_min_variance_matches_closed_form(self):
+        w = optimizer.optimize("min_variance", self.mu, self.cov, long_only=False, max_weight=10)
+        inverse = np.linalg.solve(self.cov, np.ones(len(self.mu)))
+        np.testing.assert_allclose(w, inverse / inverse.sum(), atol=1e-8)
+
+    def test_unconstrained_max_sharpe_matches_tangency_portfolio(self):
+        w = optimizer.optimize("max_sharpe", self.mu, self.cov, long_only=False, max_weight=10)
+        tangency = np.linalg.solve(self.cov, self.mu)
+        tangency /= tangency.sum()
+        self.assertAlmostEqual(optimizer.sharpe(w, self.mu, self.cov),
+                               optimizer.sharpe(tangency, self.mu, self.cov), places=6)
+
+    def test_long_only_with_cap(self):
+        for method in optimizer.METHODS:
+            w = optimizer.optimize(method, self.mu, self.cov, long_only=True, max_weight=0.1)
+            self.assertAlmostEqual(w.sum(), 1.0)
+            self.assertGreaterEqual(w.min(), -1e-12)
+            self.assertLessEqual(w.max(), 0.1 + 1e-9)
+
+    def test_max_sharpe_beats_other_portfolios(self):
+        best = optimizer.sharpe(optimizer.optimize("max_sharpe", self.mu, self.cov), self.mu, self.cov)
+        for method in ("min_variance", "risk_parity"):
+            w = optimizer.optimize(method, self.mu, self.cov)
+            self.assertGreaterEqual(best + 1e-9, optimizer.sharpe(w, self.mu, self.cov))
+        equal = np.full(len(self.mu), 1 / len(self.mu))
+        self.assertGreater(best, optimizer.sharpe(equal, self.mu, self.cov))
+
+    def test_risk_parity_equalizes_contributions(self):
+        w = optimizer.optimize("risk_parity", self.mu, self.cov)
+        contributions = w * (self.cov @ w)
+        self.assertAlmostEqual(contributions.max() / contributions.min(), 1.0, places=6)
+
+    def test_invalid_constraints(self):
+        with self.assertRaises(ValueError):
+            optimizer.optimize("min_variance", self.mu, self.cov, max_weight=0.01)
+        with self.assertRaises(ValueError):
+            optimizer.optimize("risk_parity", self.mu, self.cov, long_only=False)
+        with self.assertRaises(ValueError):
+            optimizer.optimize("bogus", self.mu, self.cov)
+        flat = self.cov.copy()
+        flat[0, :] = flat[:, 0] = 0.0
+        with self.assertRaises(ValueError):
+            optimizer.optimize("risk_parity", self.mu, flat)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# Tests for the wide returns matrix helpers.
+import unittest
+import numpy as np
+import pandas as pd
+import panel
+
+
+def frame(dates, returns, tz="America/New_York", as_column=False):
+    index = pd.DatetimeIndex(pd.to_datetime(dates), name="Date").tz_localize(tz)
+    df = pd.DataFrame({"Daily_Return": returns}, index=index)
+    df["Cumulative_Return"] = np.cumprod(1 + np.asarray(returns)) - 1
+    if as_column:
+        # Shape of a frame read back from SQLite: a UTC-naive Date column.
+        df = df.reset_index()
+        df["Date"] = df["Date"].dt.tz_convert("UTC").dt.tz_localize(None)
+    return df
+
+
+class TestReturnsMatrix(unittest.TestCase):
+    def test_aligns_index_and_column_dates(self):
+        frames = {
+            "A": frame(["2024-01-02", "2024-01-03", "2024-01-04"], [0.01, 0.02, 0.03]),
+            "B": frame(["2024-01-03", "2024-01-04"], [-0.01, 0.05], as_column=True),
+        }
+        dates, names, values = panel.returns_matrix(frames)
+        self.assertEqual(names, ["A", "B"])
+        self.assertEqual(len(dates), 3)
+        np.testing.assert_allclose(values[:, 0], [0.01, 0.02, 0.03])
+        self.assertTrue(np.isnan(values[0, 1]))
+        np.testing.assert_allclose(values[1:, 1], [-0.01, 0.05])
+
+    def test_matches_pandas(self):
+        rng = np.random.default_rng(1)
+        dates = pd.bdate_range("2024-01-01", periods=50)
+        frames = {name: frame(dates, rng.normal(0, 0.01, 50)) for name in "ABCD"}
+        _, names, values = panel.returns_matrix(frames)
+        wide = pd.DataFrame({name: df["Daily_Return"] for name, df in frames.items()})
+        np.testing.assert_allclose(panel.correlation(values), wide.corr().to_numpy())
+
+        _, _, cumulative = panel.returns_matrix(frames, column="Cumulative_Return")
+        mean, std, last = panel.column_stats(values, cumulative)
+        np.testing.assert_allclose(mean, wide.mean().to_numpy())
+        np.testing.assert_allclose(std, wide.std().to_numpy())
+        np.testing.assert_allclose(last, [df["Cumulative_Return"].iloc[-1] for df in frames.values()])
+
+    def test_last_cumulative_skips_missing_tail(self):
+        returns = np.array([[0.1, 0.2], [0.1, np.nan]])
+        cumulative = np.array([[0.1, 0.2], [0.21, np.nan]])
+        _, std, last = panel.column_stats(returns, cumulative)
+        np.testing.assert_allclose(last, [0.21, 0.2])
+        self.assertTrue(np.isnan(std[1]))
+
+
+class TestReturnsPanel(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        dates = pd.bdate_range("2024-01-01", periods=40)
+        self.frames = {name: frame(dates, rng.normal(0, 0.01, 40)) for name in "ABCD"}
+        # An asset that starts late leaves NaN rows at the top of its column.
+        self.frames["E"] = frame(dates[10:], rng.normal(0, 0.01, 30))
+        self.returns = panel.ReturnsPanel.from_frames(self.frames)
+
+    def test_matches_returns_matrix(self):
+        dates, names, values = panel.returns_matrix(self.frames)
+        self.assertEqual(self.returns.names, names)
+        self.assertTrue(self.returns.dates.equals(dates))
+        np.testing.assert_array_equal(self.returns.returns, values)
+        self.assertEqual(self.returns.shape, (40, 5))
+        self.assertIn("E", self.returns)
+
+    def test_complete_returns_match_dropna(self):
+        wide = pd.DataFrame({name: df["Daily_Return"] for name, df in self.frames.items()})
+        np.testing.assert_allclose(self.returns.complete_returns(), wide.dropna().to_numpy())
+        self.assertEqual(int(self.returns.complete_mask.sum()), 30)
+        self.assertIs(self.returns.complete_returns(), self.returns.complete_returns())
+
+    def test_select_adjacent_assets_is_a_view(self):
+        stats = self.returns.stats()
+        subset = self.returns.select(["B", "C"])
+        self.assertTrue(np.shares_memory(subset.returns, self.returns.returns))
+        np.testing.assert_array_equal(subset.stats()[0], stats[0][1:3])
+
+        reordered = self.returns.select(["D", "A"])
+        np.testing.assert_array_equal(reordered.returns, self.returns.returns[:, [3, 0]])
+        with self.assertRaises(KeyError):
+            self.returns.select(["Z"])
+
+    def test_between_is_a_row_view(self):
+        window = self.returns.between("2024-01-15", "2024-01-20")
+        self.assertTrue(np.shares_memory(window.returns, self.returns.returns))
+        self.assertEqual(list(window.dates.strftime("%Y-%m-%d")), ["2024-01-15", "2024-01-16", "2024-01-17",
+                                                                   "2024-01-18", "2024-01-19"])
+        self.assertEqual(len(self.returns.between(end="2023-12-31")), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
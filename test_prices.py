@@ -0,0 +1,141 @@
+# Tests for the normalized prices table, run against a temporary SQLite database
+# (the COPY path is PostgreSQL-only; SQLite exercises the portable fallback).
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import cache
+import database
+import prices
+import datasource
+from stocks import process_stock_data
+
+
+def make_prices(start, days, seed=0):
+    index = pd.bdate_range(start, periods=days, tz="America/New_York", name="Date")
+    close = 100 * np.cumprod(1 + np.random.default_rng(seed).normal(0, 0.01, days))
+    return pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close,
+                         'Volume': np.full(days, 1000)}, index=index)
+
+
+class TestPricesTable(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self._url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(self.tmp.name, 'test.db')}"
+        database.dispose_engine()
+        cache.frame_cache.clear()
+        self.aapl = make_prices("2023-01-02", 30, seed=1)
+        self.msft = make_prices("2023-01-02", 30, seed=2)
+
+    def tearDown(self):
+        database.dispose_engine()
+        cache.frame_cache.clear()
+        if self._url is None:
+            del os.environ["DATABASE_URL"]
+        else:
+            os.environ["DATABASE_URL"] = self._url
+        self.tmp.cleanup()
+
+    def test_copy_and_load_roundtrip(self):
+        long_df = pd.concat([prices.to_long_frame(self.aapl, "AAPL", "stock"),
+                             prices.to_long_frame(self.msft, "MSFT", "stock")])
+        self.assertEqual(prices.copy_frame(long_df), 60)
+        # Re-copying overlapping rows replaces them instead of duplicating, and the first
+        # bar of the shorter fetch keeps the return stored by the longer one.
+        prices.copy_frame(prices.to_long_frame(self.aapl.iloc[10:], "AAPL", "stock"))
+        loaded = prices.load_prices(["AAPL", "MSFT"], "2023-01-01", "2023-03-01")
+        self.assertEqual(len(loaded), 60)
+
+        matrix = prices.returns_matrix(loaded)
+        self.assertEqual(list(matrix.columns), ["AAPL", "MSFT"])
+        np.testing.assert_allclose(matrix["AAPL"].values, self.aapl["Close"].pct_change().values)
+
+    def test_processed_frames_match_per_table_pipeline(self):
+        prices.copy_frame(prices.to_long_frame(self.aapl, "AAPL", "stock"))
+        frames = prices.to_processed_frames(prices.load_prices(["AAPL"], "2023-01-01", "2023-03-01"))
+        expected = process_stock_data(self.aapl)
+        np.testing.assert_allclose(frames["AAPL"]["Cumulative_Return"].values, expected["Cumulative_Return"].values)
+        self.assertEqual(list(frames["AAPL"]["Predicted_Direction"]), list(expected["Predicted_Direction"]))
+
+    def test_window_inside_a_longer_fetch_matches_per_table_pipeline(self):
+        # The stored bar before the window does not leak its return into the window.
+        prices.copy_frame(prices.to_long_frame(self.aapl, "AAPL", "stock"))
+        frames = prices.to_processed_frames(prices.load_prices(["AAPL"], "2023-01-16", "2023-03-01"))
+        expected = process_stock_data(self.aapl[self.aapl.index >= pd.Timestamp("2023-01-16", tz="UTC")])
+        self.assertEqual(list(frames["AAPL"]["Date"]), list(expected.index))
+        np.testing.assert_allclose(frames["AAPL"]["Cumulative_Return"].values, expected["Cumulative_Return"].values)
+
+    def test_migrate_legacy_tables(self):
+        database.store_df_to_db(process_stock_data(self.aapl), "stock_train_AAPL")
+        database.store_df_to_db(process_stock_data(self.msft), "asset_train_Software")
+        # Intraday tables are not daily bars of a ticker called "5m_AAPL".
+        database.store_df_to_db(process_stock_data(self.msft), "stock_train_5m_AAPL")
+        database.store_df_to_db(process_stock_data(self.msft), "asset_test_1h_Software")
+        self.assertEqual(prices.migrate_legacy_tables({"Software": "MSFT"}), 58)
+        loaded = prices.load_prices(["AAPL", "MSFT", "5m_AAPL", "1h_Software"], "2023-01-01", "2023-03-01")
+        self.assertEqual(set(loaded["ticker"]), {"AAPL", "MSFT"})
+        self.assertEqual(set(loaded["asset_class"]), {"stock", "asset"})
+
+
+    def test_app_loader_fetches_once_then_reads_prices_table(self):
+        import app
+        calls = []
+
+        class Stub(datasource.DataSource):
+            def history(self, ticker, start=None, end=None, period='3y', interval='1d'):
+                calls.append(ticker)
+                return make_prices(start, 40)
+
+        os.environ["STORAGE_LAYOUT"] = "normalized"
+        datasource.set_data_source(Stub())
+        try:
+            specs = [("stock", "AAPL", "AAPL"), ("asset", "Gold", "GLD")]
+            first = app.load_assets(specs, "test")
+            cache.frame_cache.clear()
+            second = app.load_assets(specs, "test")
+        finally:
+            del os.environ["STORAGE_LAYOUT"]
+            datasource.set_data_source(None)
+        self.assertEqual(sorted(calls), ["AAPL", "GLD"])
+        self.assertEqual(list(second), ["AAPL", "Gold"])
+        np.testing.assert_allclose(first["Gold"]["Cumulative_Return"].values,
+                                   second["Gold"]["Cumulative_Return"].values)
+
+    def test_app_loader_fetches_partial_coverage_once(self):
+        import app
+        calls = []
+        history = make_prices("2022-12-01", 120, seed=3)
+
+        class Stub(datasource.DataSource):
+            def history(self, ticker, start=None, end=None, period='3y', interval='1d'):
+                calls.append(ticker)
+                # LATE is listed after the window starts.
+                first = "2023-02-15" if ticker == "LATE" else start
+                return history[(history.index >= pd.Timestamp(first, tz="America/New_York"))
+                               & (history.index < pd.Timestamp(end, tz="America/New_York"))]
+
+        # Rows stored earlier for part of the window only, without a recorded fetch range.
+        prices.copy_frame(prices.to_long_frame(history[history.index < pd.Timestamp("2023-02-01", tz="UTC")],
+                                               "AAPL", "stock"))
+        os.environ["STORAGE_LAYOUT"] = "normalized"
+        datasource.set_data_source(Stub())
+        try:
+            specs = [("stock", "AAPL", "AAPL"), ("stock", "LATE", "LATE")]
+            first = app.load_assets(specs, "test")
+            cache.frame_cache.clear()
+            app.load_assets(specs, "test")
+        finally:
+            del os.environ["STORAGE_LAYOUT"]
+            datasource.set_data_source(None)
+        self.assertEqual(sorted(calls), ["AAPL", "LATE"])
+        start, end = app.WINDOWS["test"]
+        window = history[(history.index >= pd.Timestamp(start, tz="America/New_York"))
+                         & (history.index < pd.Timestamp(end, tz="America/New_York"))]
+        np.testing.assert_allclose(first["AAPL"]["Cumulative_Return"].values,
+                                   process_stock_data(window)["Cumulative_Return"].values)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+# Tests for the shared vectorized processing module used by stocks.py and assets.py.
+import unittest
+import numpy as np
+import pandas as pd
+from processing import process_price_data, process_panel, cumulative_by_group
+
+
+class TestProcessing(unittest.TestCase):
+    def setUp(self):
+        self.sample_data = pd.DataFrame({
+            'Close': [100.0, 105.0, 110.0, 108.0, 108.0]
+        }, index=pd.bdate_range('2023-01-02', periods=5, name='Date'))
+
+    def test_matches_pandas_reference(self):
+        processed = process_price_data(self.sample_data)
+        expected = self.sample_data['Close'].pct_change().dropna()
+        np.testing.assert_allclose(processed['Daily_Return'].values, expected.values)
+        np.testing.assert_allclose(processed['Cumulative_Return'].values, ((1 + expected).cumprod() - 1).values)
+        self.assertEqual(list(processed['Predicted_Direction']), ['Increase', 'Increase', 'Decrease', 'Decrease'])
+        self.assertEqual(processed['Predicted_Direction'].dtype, 'category')
+        self.assertListEqual(list(processed.index), list(self.sample_data.index[1:]))
+
+    def test_input_is_not_modified(self):
+        process_price_data(self.sample_data)
+        self.assertListEqual(list(self.sample_data.columns), ['Close'])
+
+    def test_float32_option(self):
+        processed = process_price_data(self.sample_data, dtype='float32')
+        self.assertEqual(processed['Close'].dtype, np.float32)
+        self.assertEqual(processed['Cumulative_Return'].dtype, np.float32)
+        self.assertAlmostEqual(float(processed['Cumulative_Return'].iloc[-1]), 0.08, places=6)
+
+    def test_panel_processes_all_tickers_at_once(self):
+        close = pd.DataFrame({'A': [100.0, 110.0, 121.0], 'B': [np.nan, 50.0, 45.0]})
+        panel = process_panel(close)
+        np.testing.assert_allclose(panel['Daily_Return']['A'].values[1:], [0.1, 0.1])
+        np.testing.assert_allclose(panel['Cumulative_Return']['A'].values, [0.0, 0.1, 0.21])
+        np.testing.assert_allclose(panel['Cumulative_Return']['B'].values, [0.0, 0.0, -0.1])
+        self.assertEqual(list(panel['Predicted_Direction']['B']), [False, False, False])
+
+    def test_cumulative_by_group(self):
+        cumulative = cumulative_by_group([0.1, 0.1, 0.5, -0.5], ['A', 'A', 'B', 'B'])
+        np.testing.assert_allclose(cumulative, [0.1, 0.21, 0.5, -0.25])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# Tests for the versioned analytics result store and the memoized app analytics.
+import unittest
+import pandas as pd
+import results
+from results import ResultStore, fingerprint
+from app import build_correlation_html, compute_group_metrics
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_equal_content_gives_equal_hash(self):
+        a = {'A': pd.Series([0.01, 0.02], name='Daily_Return')}
+        b = {'A': pd.Series([0.01, 0.02], name='Daily_Return')}
+        self.assertEqual(fingerprint(a), fingerprint(b))
+
+    def test_changed_values_or_names_change_hash(self):
+        base = {'A': pd.Series([0.01, 0.02], name='Daily_Return')}
+        changed = {'A': pd.Series([0.01, 0.03], name='Daily_Return')}
+        renamed = {'B': pd.Series([0.01, 0.02], name='Daily_Return')}
+        self.assertNotEqual(fingerprint(base), fingerprint(changed))
+        self.assertNotEqual(fingerprint(base), fingerprint(renamed))
+
+
+class TestResultStore(unittest.TestCase):
+    def test_computes_once_per_version(self):
+        store = ResultStore()
+        calls = []
+        compute = lambda: calls.append(1) or len(calls)
+        self.assertEqual(store.get_or_compute('x', 'v1', compute), 1)
+        self.assertEqual(store.get_or_compute('x', 'v1', compute), 1)
+        self.assertEqual(store.get_or_compute('x', 'v2', compute), 2)
+        self.assertEqual(store.latest('x'), ('v2', 2))
+        self.assertEqual(store.stats()['hits'], 1)
+
+
+class TestMemoizedAnalytics(unittest.TestCase):
+    def setUp(self):
+        results.result_store.clear()
+        df = pd.DataFrame({'Daily_Return': [0.01, 0.02, -0.01, 0.005]})
+        df['Cumulative_Return'] = (1 + df['Daily_Return']).cumprod() - 1
+        other = pd.DataFrame({'Daily_Return': [0.02, -0.01, 0.0, 0.01]})
+        other['Cumulative_Return'] = (1 + other['Daily_Return']).cumprod() - 1
+        self.train_data = {'A': df, 'B': other}
+
+    def test_correlation_html_is_reused_for_same_data(self):
+        first = build_correlation_html(self.train_data)
+        second = build_correlation_html({k: v.copy() for k, v in self.train_data.items()})
+        self.assertIs(first, second)
+
+    def test_group_metrics_recomputed_when_data_changes(self):
+        first, _ = compute_group_metrics(self.train_data)
+        changed = dict(self.train_data)
+        changed['A'] = self.train_data['A'] * 2
+        second, _ = compute_group_metrics(changed)
+        self.assertNotEqual(first['A']['Average Daily Return'], second['A']['Average Daily Return'])
+
+
+if __name__ == '__main__':
+    unittest.main()
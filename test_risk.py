@@ -0,0 +1,57 @@
+# Tests for the batch risk metrics, checked against pandas.
+import unittest
+import numpy as np
+import pandas as pd
+import risk
+
+
+class TestRiskMetrics(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.market = rng.normal(0.0005, 0.01, 300)
+        returns = rng.normal(0.001, 0.02, (300, 4))
+        returns[:, 1] = 1.5 * self.market + rng.normal(0, 0.002, 300)
+        returns[:40, 2] = np.nan  # listed later
+        returns[:, 3] = np.nan  # no data
+        self.returns = returns
+        self.wide = pd.DataFrame(returns)
+
+    def test_historical_var_and_cvar_match_pandas(self):
+        var, cvar = risk.historical_var(self.returns, 0.95)
+        quantile = self.wide.quantile(0.05)
+        np.testing.assert_allclose(var[:3], -quantile.to_numpy()[:3])
+        expected = [-self.wide[i][self.wide[i] <= quantile[i]].mean() for i in range(3)]
+        np.testing.assert_allclose(cvar[:3], expected)
+        self.assertTrue(np.isnan(var[3]) and np.isnan(cvar[3]))
+
+    def test_parametric_var(self):
+        var, cvar = risk.parametric_var(np.array([0.0]), np.array([0.01]), 0.95)
+        np.testing.assert_allclose(var, [0.01 * 1.6448536], rtol=1e-6)
+        np.testing.assert_allclose(cvar, [0.01 * 2.0627128], rtol=1e-6)
+
+    def test_drawdown_downside_and_beta(self):
+        metrics = risk.risk_metrics(self.returns, self.market)
+        wealth = (1 + self.wide.fillna(0)).cumprod()
+        drawdown = (wealth / np.maximum(wealth.cummax(), 1) - 1).min().to_numpy()
+        np.testing.assert_allclose(metrics["Max Drawdown"][:3], drawdown[:3])
+        self.assertTrue(np.isnan(metrics["Max Drawdown"][3]))
+
+        downside = np.sqrt((np.minimum(self.wide[0], 0) ** 2).mean())
+        self.assertAlmostEqual(metrics["Downside Deviation"][0], downside)
+        self.assertAlmostEqual(metrics["Sortino Ratio"][0], self.wide[0].mean() / downside)
+
+        market = pd.Series(self.market)
+        for i in range(3):
+            expected = self.wide[i].cov(market) / market[self.wide[i].notna()].var()
+            self.assertAlmostEqual(metrics["Beta"][i], expected)
+        self.assertAlmostEqual(metrics["Beta"][1], 1.5, delta=0.05)
+        self.assertEqual(list(metrics), list(risk.METRICS))
+
+    def test_without_market_or_rows(self):
+        self.assertTrue(np.isnan(risk.risk_metrics(self.returns)["Beta"]).all())
+        empty = risk.risk_metrics(np.empty((0, 2)))
+        self.assertTrue(all(np.isnan(values).all() for values in empty.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# Tests for the rolling and streaming correlation engine.
+import unittest
+import numpy as np
+import pandas as pd
+import rolling
+
+
+def sample_returns(days=120, assets=5, seed=4):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(0, 0.01, (days, assets)) + rng.normal(0, 0.01, (days, 1))
+    values[rng.random((days, assets)) < 0.05] = np.nan
+    return values
+
+
+class TestRollingCorrelation(unittest.TestCase):
+    def test_window_correlation_matches_pandas(self):
+        values = sample_returns()
+        expected = pd.DataFrame(values).corr().to_numpy()
+        np.testing.assert_allclose(rolling.window_correlation(values), expected, atol=1e-12)
+
+    def test_streaming_matches_recomputation(self):
+        values = sample_returns()
+        engine = rolling.RollingCorrelation(range(5), window=30)
+        for day in range(len(values)):
+            engine.append(values[day])
+            if day >= 10 and day % 7 == 0:
+                expected = rolling.window_correlation(values[max(0, day - 29):day + 1], min_periods=15)
+                np.testing.assert_allclose(engine.matrix(), expected, atol=1e-10)
+
+    def test_block_append_and_recent(self):
+        values = sample_returns()
+        engine = rolling.RollingCorrelation(range(5), window=30)
+        engine.append(values[:100], dates=list(range(100)))
+        engine.append(values[100:])
+        np.testing.assert_allclose(engine.recent(), values[-30:])
+        np.testing.assert_allclose(engine.matrix(), rolling.window_correlation(values[-30:], min_periods=15),
+                                   atol=1e-10)
+        self.assertEqual(engine.last_date, 99)
+
+    def test_pair_series_matches_pandas(self):
+        values = sample_returns()
+        frame = pd.DataFrame(values[:, :2], columns=["a", "b"])
+        expected = frame["a"].rolling(20, min_periods=10).corr(frame["b"]).to_numpy()
+        np.testing.assert_allclose(rolling.pair_series(values[:, 0], values[:, 1], 20, min_periods=10),
+                                   expected, atol=1e-10)
+
+    def test_too_few_observations_are_nan(self):
+        engine = rolling.RollingCorrelation(["a", "b"], window=10)
+        engine.append([0.01, 0.02])
+        self.assertTrue(np.isnan(engine.matrix()).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
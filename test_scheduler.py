@@ -0,0 +1,94 @@
+# Tests for the background refresher, run against a temporary SQLite database.
+import os
+import tempfile
+import unittest
+import database
+import scheduler
+from scheduler import Refresher
+
+
+class Recorder:
+    def __init__(self):
+        self.refreshes = 0
+        self.loads = 0
+        self.fail = False
+
+    def refresh_sources(self):
+        self.refreshes += 1
+
+    def load_snapshot(self):
+        if self.fail:
+            raise RuntimeError("database unavailable")
+        self.loads += 1
+        return {"loads": self.loads}
+
+
+class TestRefresher(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self._url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(self.tmp.name, 'test.db')}"
+        database.dispose_engine()
+
+    def tearDown(self):
+        database.dispose_engine()
+        if self._url is None:
+            del os.environ["DATABASE_URL"]
+        else:
+            os.environ["DATABASE_URL"] = self._url
+        self.tmp.cleanup()
+
+    def test_warm_up_then_refresh_only_when_due(self):
+        calls = Recorder()
+        refresher = Refresher(calls.load_snapshot, calls.refresh_sources, interval=3600, poll=1)
+        self.assertIsNone(refresher.snapshot())
+        snapshot = refresher.run_once()
+        self.assertEqual(snapshot.data, {"loads": 1})
+        refresher.run_once()
+        self.assertEqual((calls.refreshes, calls.loads), (1, 1))
+        self.assertFalse(refresher.status()["stale"])
+
+    def test_other_workers_reuse_the_shared_refresh(self):
+        first, second = Recorder(), Recorder()
+        Refresher(first.load_snapshot, first.refresh_sources, interval=3600).run_once()
+        other = Refresher(second.load_snapshot, second.refresh_sources, interval=3600)
+        self.assertIsNotNone(other.run_once())
+        self.assertEqual((second.refreshes, second.loads), (0, 1))
+
+        # A forced refresh elsewhere changes the marker and the snapshot is rebuilt.
+        Refresher(first.load_snapshot, first.refresh_sources, interval=3600).run_once(force=True)
+        other.run_once()
+        self.assertEqual(second.loads, 2)
+
+    def test_waits_while_another_worker_holds_the_lock(self):
+        calls = Recorder()
+        refresher = Refresher(calls.load_snapshot, calls.refresh_sources, interval=3600)
+        with database.advisory_lock(scheduler.REFRESH_LOCK_KEY) as acquired:
+            self.assertTrue(acquired)
+            self.assertIsNone(refresher.run_once())
+        self.assertEqual(calls.refreshes, 0)
+        self.assertIsNotNone(refresher.run_once())
+
+    def test_wait_for_the_first_snapshot(self):
+        calls = Recorder()
+        refresher = Refresher(calls.load_snapshot, calls.refresh_sources, interval=3600, poll=3600)
+        self.assertIsNone(refresher.wait(0.01))
+        refresher.start()
+        try:
+            self.assertEqual(refresher.wait(30).data, {"loads": 1})
+        finally:
+            refresher.stop()
+
+    def test_failure_keeps_last_good_snapshot(self):
+        calls = Recorder()
+        refresher = Refresher(calls.load_snapshot, calls.refresh_sources, interval=3600)
+        good = refresher.run_once()
+        calls.fail = True
+        self.assertIs(refresher.run_once(force=True), good)
+        status = refresher.status()
+        self.assertTrue(status["stale"])
+        self.assertIn("database unavailable", status["last_error"])
+
+
+if __name__ == '__main__':
+    unittest.main()
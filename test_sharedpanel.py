@@ -0,0 +1,115 @@
+# Tests for the returns panel shared between worker processes.
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+import numpy as np
+import pandas as pd
+import panel
+import processing
+import sharedpanel
+from benchmark import BenchmarkEnvironment, make_price_panel
+
+
+def processed_frames(tickers, days=60, seed=0):
+    return {ticker: processing.process_price_data(df) for ticker, df in make_price_panel(tickers, days, seed=seed).items()}
+
+
+class TestPanelStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {"SHARED_PANEL_DIR": self.tmp.name, "SHARED_PANEL_RECHECK": "0"})
+        self.env.start()
+        frames = processed_frames(["A", "B", "C"])
+        # C starts later than the others.
+        frames["C"] = frames["C"].iloc[10:]
+        self.windows = {"train": (frames, {"A": "stock", "B": "stock", "C": "asset"})}
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_published_panel_is_shared_zero_copy(self):
+        store = sharedpanel.PanelStore()
+        build = MagicMock(return_value=self.windows)
+        shared = store.get(lambda: 1.0, build)
+        self.assertEqual(shared.version, 1.0)
+        dates, names, values = shared.matrix("train")
+        expected_dates, _, expected = panel.returns_matrix(self.windows["train"][0])
+        np.testing.assert_array_equal(values, expected)
+        self.assertTrue((dates == expected_dates).all())
+
+        frames = shared.frames("train", "stock")
+        self.assertEqual(list(frames), ["A", "B"])
+        later = shared.frames("train")["C"]
+        self.assertEqual(len(later), len(self.windows["train"][0]["C"]))
+        np.testing.assert_array_equal(later["Daily_Return"].to_numpy(),
+                                      self.windows["train"][0]["C"]["Daily_Return"].to_numpy())
+        self.assertTrue(np.shares_memory(later["Daily_Return"].to_numpy(), values))
+        self.assertIs(shared.frames("train", "stock"), frames)
+
+        # Another worker maps the published panel instead of building it.
+        other_build = MagicMock()
+        other = sharedpanel.PanelStore().get(lambda: 1.0, other_build)
+        other_build.assert_not_called()
+        build.assert_called_once()
+        np.testing.assert_array_equal(other.matrix("train")[2], values)
+
+    def test_new_version_is_swapped_in(self):
+        store = sharedpanel.PanelStore()
+        old = store.get(lambda: 1.0, lambda: self.windows)
+        newer = {"train": (processed_frames(["A", "B"], seed=3), {"A": "stock", "B": "stock"})}
+        new = store.get(lambda: 2.0, lambda: newer)
+        self.assertEqual(new.version, 2.0)
+        self.assertEqual(new.matrix("train")[1], ["A", "B"])
+        # The previous version stays readable for workers still using it.
+        self.assertEqual(old.matrix("train")[2].shape[1], 3)
+        self.assertEqual(store.status()["version"], 2.0)
+
+    def test_disabled_without_directory(self):
+        with patch.dict(os.environ, {"SHARED_PANEL_DIR": ""}):
+            self.assertFalse(sharedpanel.enabled())
+            self.assertEqual(sharedpanel.store.status(), {"enabled": False})
+
+
+class TestAppSharedPanel(unittest.TestCase):
+    def test_training_and_test_data_come_from_the_panel(self):
+        with BenchmarkEnvironment(n_tickers=5, days=300) as env:
+            app = env.app
+            expected = app.compute_group_metrics(app.get_training_data())[0]
+            expected_test = {name: df["Cumulative_Return"].iloc[-1] for name, df in app.get_all_test_data().items()}
+            env.reset_caches()
+            with patch.dict(os.environ, {"SHARED_PANEL_DIR": os.path.join(env.tmp.name, "panel")}), \
+                    patch.object(sharedpanel, "store", sharedpanel.PanelStore()):
+                frames = app.get_training_data()
+                self.assertEqual(list(frames), env.stock_tickers)
+                metrics = app.compute_group_metrics(frames)[0]
+                for asset, values in expected.items():
+                    for name, value in values.items():
+                        self.assertAlmostEqual(metrics[asset][name], value)
+                test = app.get_all_test_data()
+                self.assertEqual(set(test), set(expected_test))
+                for name, value in expected_test.items():
+                    self.assertAlmostEqual(test[name]["Cumulative_Return"].iloc[-1], value)
+                self.assertEqual(list(app.get_benchmark_training_data()), list(env.bench_tickers))
+                self.assertEqual(sharedpanel.store.builds, 1)
+                # The loaded frames were only needed to publish the panel.
+                self.assertEqual(env.cache.frame_cache.stats()["entries"], 0)
+
+                # A configuration change is a new version even when the refresh marker is unchanged.
+                start, end = app.WINDOWS["train"]
+                later = (pd.Timestamp(start) + pd.Timedelta(days=60)).date().isoformat()
+                with patch.dict(os.environ, {"SHARED_PANEL_RECHECK": "0"}), \
+                        patch.dict(app.WINDOWS, {"train": (later, end)}):
+                    env.reset_caches()
+                    frames = app.get_training_data()
+                    self.assertEqual(sharedpanel.store.builds, 2)
+                    self.assertGreaterEqual(min(df.index.min() for df in frames.values()).tz_localize(None),
+                                            pd.Timestamp(later))
+                    with patch.object(app, "top_active_stocks", env.stock_tickers[:3]):
+                        self.assertEqual(list(app.get_training_data()), env.stock_tickers[:3])
+                        self.assertEqual(sharedpanel.store.builds, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
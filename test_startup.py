@@ -0,0 +1,138 @@
+# Tests for the startup report, the lazy data source imports and the application factory.
+import builtins
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+import scheduler
+import startup
+from benchmark import BenchmarkEnvironment
+
+
+class TestImportTimer(unittest.TestCase):
+    def test_times_outermost_imports_and_restores_import(self):
+        original = builtins.__import__
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "startup_probe_outer.py"), "w") as out:
+                out.write("import startup_probe_inner\n")
+            with open(os.path.join(tmp, "startup_probe_inner.py"), "w") as out:
+                out.write("import time\ntime.sleep(0.02)\n")
+            sys.path.insert(0, tmp)
+            timer = startup.ImportTimer()
+            try:
+                timer.install()
+                __import__("startup_probe_outer")
+                timer.uninstall()
+            finally:
+                timer.uninstall()
+                sys.path.remove(tmp)
+                sys.modules.pop("startup_probe_outer", None)
+                sys.modules.pop("startup_probe_inner", None)
+        self.assertIs(builtins.__import__, original)
+        self.assertEqual(list(timer.times), ["startup_probe_outer"])
+        self.assertGreaterEqual(timer.times["startup_probe_outer"], 0.02)
+
+    def test_report_checks_target(self):
+        report = startup.StartupReport()
+        with patch.dict(os.environ, {"STARTUP_TARGET_SECONDS": "0.000001"}):
+            with self.assertLogs(level="WARNING") as logs:
+                report.mark_ready()
+            status = report.status()
+        self.assertIn("Startup target missed", logs.output[0])
+        self.assertFalse(status["within_target"])
+        self.assertIsNone(status["first_response_seconds"])
+        self.assertGreater(status["ready_seconds"], 0)
+
+
+class TestColdStart(unittest.TestCase):
+    def test_app_import_leaves_dotenv_and_logging_to_the_factory(self):
+        code = ("import logging, app; print(logging.getLogger().handlers == [], 'EXAMPLE_SETTING' in app.os.environ); "
+                "app.create_app(preload='none'); print(logging.getLogger().handlers != [], app.os.environ['EXAMPLE_SETTING'])")
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, ".env"), "w") as out:
+                out.write("EXAMPLE_SETTING=loaded\n")
+            environ = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+            environ.pop("BACKGROUND_REFRESH", None)
+            output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                    cwd=tmp, env=environ).stdout.split()
+        self.assertEqual(output, ["True", "False", "True", "loaded"])
+
+    def test_app_import_does_not_load_yfinance(self):
+        code = "import sys, app; print('yfinance' in sys.modules, 'database' in app.startup.startup_report.imports.times)"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+        self.assertEqual(output, ["False", "True"])
+
+
+class TestAppFactory(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.env = BenchmarkEnvironment(n_tickers=4, days=200).__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.env.__exit__(None, None, None)
+
+    def test_preload_data_and_startup_endpoint(self):
+        app = self.env.app
+        flask_app = app.create_app(preload="data")
+        # Each call builds a new app with the routes, configured from the environment.
+        self.assertIsNot(flask_app, app.app)
+        self.assertIsNot(app.create_app(preload="none"), flask_app)
+        self.assertEqual(app.top_active_stocks, self.env.stock_tickers)
+        self.assertIn("preload_data", startup.startup_report.phases)
+        # The training analytics were precomputed, so the page only renders them.
+        self.assertGreater(self.env.results.result_store.stats()["entries"], 0)
+
+        client = flask_app.test_client()
+        self.assertEqual(client.get("/health").status_code, 200)
+        report = client.get("/debug/startup").get_json()
+        self.assertEqual(report["pid"], os.getpid())
+        self.assertIsNotNone(report["ready_seconds"])
+        self.assertGreaterEqual(report["first_response_seconds"], report["imports_seconds"])
+        # Only modules imported for the first time by app.py are listed (others in this run were imported by tests).
+        self.assertTrue(all(seconds >= 0 for seconds in report["imports"].values()))
+
+    def test_refresher_warms_up_before_traffic(self):
+        app = self.env.app
+        gate = threading.Event()
+
+        def load_snapshot():
+            gate.wait(30)
+            return app.load_snapshot_data()
+        refresher = scheduler.Refresher(load_snapshot, lambda: None, interval=3600, poll=3600)
+        load = app.get_training_data
+
+        def refresher_only():
+            # Requests must not load the data inline while the refresher does.
+            self.assertEqual(threading.current_thread().name, "data-refresher")
+            return load()
+        env = {"BACKGROUND_REFRESH": "1", "REFRESH_WARMUP_WAIT": "0"}
+        with patch.dict(os.environ, env), patch.object(app, "refresher", refresher), \
+                patch.object(app, "get_training_data", side_effect=refresher_only):
+            try:
+                client = app.create_app().test_client()
+                self.assertTrue(refresher.status()["warming_up"])
+                page = client.get("/")
+                self.assertEqual(page.status_code, 503)
+                self.assertIn("Retry-After", page.headers)
+                self.assertEqual(client.get("/api/metrics").status_code, 503)
+
+                gate.set()
+                self.assertIsNotNone(refresher.wait(30))
+                self.assertEqual(client.get("/").status_code, 200)
+                self.assertEqual(client.get("/api/metrics").status_code, 200)
+            finally:
+                gate.set()
+                refresher.stop()
+
+    def test_rejects_unknown_preload(self):
+        with self.assertRaises(ValueError):
+            self.env.app.create_app(preload="everything")
+
+
+if __name__ == '__main__':
+    unittest.main()
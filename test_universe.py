@@ -0,0 +1,63 @@
+# Tests for the configurable ticker universe and date windows.
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+import universe
+
+
+class TestLoadUniverse(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _env(self, **values):
+        names = ("UNIVERSE_FILE", "UNIVERSE_STOCKS", "UNIVERSE_BENCHMARKS",
+                 "TRAIN_START", "TRAIN_END", "TEST_START", "TEST_END")
+        env = {k: v for k, v in os.environ.items() if k not in names}
+        env.update(values)
+        return mock.patch.dict(os.environ, env, clear=True)
+
+    def test_defaults(self):
+        with self._env():
+            config = universe.load_universe()
+        self.assertEqual(config.stocks, universe.DEFAULT_STOCKS)
+        self.assertEqual(config.benchmarks["Gold"], "GLD")
+        self.assertEqual(config.windows["train"], ("2022-01-01", "2024-12-31"))
+
+    def test_file_with_ticker_list(self):
+        with open(os.path.join(self.tmp.name, "sp500.csv"), "w") as handle:
+            handle.write("Symbol,Security\nMMM,3M\nBRK.B,Berkshire\n# comment\n\nAOS,A. O. Smith\n")
+        path = os.path.join(self.tmp.name, "universe.json")
+        with open(path, "w") as handle:
+            json.dump({"stocks": "sp500.csv", "benchmarks": {"S&P 500": "SPY"},
+                       "windows": {"train": ["2020-01-01", "2021-12-31"]}}, handle)
+        with self._env(UNIVERSE_FILE=path, TEST_END="2023-06-30"):
+            config = universe.load_universe()
+        self.assertEqual(config.stocks, ["MMM", "BRK-B", "AOS"])
+        self.assertEqual(config.benchmarks, {"S&P 500": "SPY"})
+        self.assertEqual(config.windows["train"], ("2020-01-01", "2021-12-31"))
+        self.assertEqual(config.windows["test"], ("2023-01-01", "2023-06-30"))
+
+    def test_environment_overrides(self):
+        with self._env(UNIVERSE_STOCKS="AAPL, MSFT", UNIVERSE_BENCHMARKS="Gold=GLD,Bonds=TLT"):
+            config = universe.load_universe()
+        self.assertEqual(config.stocks, ["AAPL", "MSFT"])
+        self.assertEqual(config.benchmarks, {"Gold": "GLD", "Bonds": "TLT"})
+
+    def test_invalid_window(self):
+        with self._env(TRAIN_START="2025-01-01"):
+            with self.assertRaises(ValueError):
+                universe.load_universe()
+
+    def test_window_name(self):
+        self.assertEqual(universe.window_name("2022-01-01", "2022-06-30"), "w20220101_20220630")
+        with self.assertRaises(ValueError):
+            universe.window_name("2022-06-30", "2022-01-01")
+        with self.assertRaises(ValueError):
+            universe.window_name("2022-01-01'; drop", "2022-06-30")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import re
+
+# Defaults: the original top 10 active stocks, the four benchmarks and the fixed windows.
+DEFAULT_STOCKS = ['AAPL', 'TSLA', 'AMZN', 'GOOGL', 'MSFT', 'NVDA', 'META', 'NFLX', 'AMD', 'BRK-B']
+DEFAULT_BENCHMARKS = {'S&P 500': 'SPY', 'Gold': 'GLD', 'Silver': 'SLV', 'Oil': 'USO'}
+DEFAULT_WINDOWS = {"train": ("2022-01-01", "2024-12-31"), "test": ("2023-01-01", "2023-03-31")}
+
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class Universe:
+    """The tickers and date windows the pipeline runs on."""
+
+    def __init__(self, stocks=None, benchmarks=None, windows=None):
+        self.stocks = list(stocks if stocks is not None else DEFAULT_STOCKS)
+        self.benchmarks = dict(benchmarks if benchmarks is not None else DEFAULT_BENCHMARKS)
+        self.windows = {name: tuple(dates) for name, dates in (windows or DEFAULT_WINDOWS).items()}
+
+
+def read_ticker_list(path):
+    """Reads tickers from a text/CSV file: one per line, first column, '#' comments and a 'Symbol' header skipped."""
+    tickers = []
+    with open(path) as handle:
+        for line in handle:
+            value = line.split("#", 1)[0].split(",", 1)[0].strip().strip('"')
+            if value and value.lower() not in ("symbol", "ticker"):
+                tickers.append(value.replace(".", "-"))
+    return tickers
+
+
+def _split_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def load_universe(path=None):
+    """
+    Loads the universe for this deployment. Starts from the defaults, then applies the
+    JSON file named by UNIVERSE_FILE (keys: stocks, benchmarks, windows; `stocks` may be
+    a list or the path of a ticker list file such as an S&P 500 constituents CSV), then
+    environment overrides: UNIVERSE_STOCKS (comma-separated or a file path),
+    UNIVERSE_BENCHMARKS ("Name=TICKER,..."), TRAIN_START/TRAIN_END/TEST_START/TEST_END.
+    """
+    config = {}
+    path = path or os.getenv("UNIVERSE_FILE")
+    if path:
+        with open(path) as handle:
+            config = json.load(handle)
+        base_dir = os.path.dirname(os.path.abspath(path))
+        if isinstance(config.get("stocks"), str):
+            config["stocks"] = read_ticker_list(os.path.join(base_dir, config["stocks"]))
+
+    stocks = config.get("stocks")
+    env_stocks = os.getenv("UNIVERSE_STOCKS")
+    if env_stocks:
+        stocks = read_ticker_list(env_stocks) if os.path.exists(env_stocks) else _split_list(env_stocks)
+
+    benchmarks = config.get("benchmarks")
+    env_benchmarks = os.getenv("UNIVERSE_BENCHMARKS")
+    if env_benchmarks:
+        benchmarks = dict(item.split("=", 1) for item in _split_list(env_benchmarks))
+
+    windows = dict(DEFAULT_WINDOWS)
+    windows.update({name: tuple(dates) for name, dates in config.get("windows", {}).items()})
+    for name in ("train", "test"):
+        start = os.getenv(f"{name.upper()}_START", windows[name][0])
+        end = os.getenv(f"{name.upper()}_END", windows[name][1])
+        windows[name] = (start, end)
+    for name, (start, end) in windows.items():
+        if not (_DATE.match(start) and _DATE.match(end)) or start >= end:
+            raise ValueError(f"Invalid window '{name}': {start} to {end}")
+    return Universe(stocks, benchmarks, windows)
+
+
+def window_name(start, end):
+    """Name of an ad-hoc window (used in table names and cache keys) for a date range."""
+    if not (_DATE.match(start or "") and _DATE.match(end or "")) or start >= end:
+        raise ValueError(f"Invalid date range: {start} to {end}")
+    return f"w{start.replace('-', '')}_{end.replace('-', '')}"
+
+
+_WINDOW_NAME = re.compile(r"^w(\d{4})(\d{2})(\d{2})_(\d{4})(\d{2})(\d{2})$")
+
+
+def window_dates(name):
+    """The (start, end) date range of an ad-hoc window name (see window_name), or None."""
+    match = _WINDOW_NAME.match(name)
+    if not match:
+        return None
+    parts = match.groups()
+    return "-".join(parts[:3]), "-".join(parts[3:])